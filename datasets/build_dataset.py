@@ -1,23 +1,336 @@
+"""
+Builds a dataset from a dora-record recording of a set of episodes.
+
+Each stream of the recording (`action`, `observation.state`, `observation.images.*`) is resampled on the frame grid of
+each episode, `start + k / framerate`, with sorted as-of joins on `timestamp_utc`. The samples of a stream are only
+taken from the episode of the frame. Each stream has a policy:
+
+- previous: the latest sample at or before the frame.
+- nearest: the closest sample to the frame, before or after it.
+- linear: the linear interpolation of the samples around the frame, for the joint values only.
+
+A frame filled from a sample further than `--max-staleness-ms` from it is stale. The frames before the first sample of
+an episode are filled from that first sample. The number of stale frames of each stream is printed, and written in
+`resample_report.json` next to the dataset.
+
+The joint values of `action` and `observation.state` are stored as fixed-size lists of float32, so a reader gets the
+(n_frames, n_joints) matrix of a column without copying it. The names of the joints are stored once, as a JSON list in
+the `joints` key of the schema metadata.
+
+The normalization statistics of the dataset are written in `stats.json`, see `datasets/dataset_stats.py`.
+"""
+
 import os
+import json
 import argparse
 
-import pandas as pd
+import numpy as np
 import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dataset_stats import IMAGE_SAMPLES, STATS_FILE, update_stats
+
+POLICIES = ["previous", "nearest", "linear"]
+
+# Joint values are interpolated, the other streams (e.g. video frames) take the latest frame at or before each frame
+DEFAULT_POLICIES = {"action": "linear", "observation.state": "linear"}
+
+
+def load_timestamps(table: pa.Table) -> np.ndarray:
+    # The timestamps of the recording in nanoseconds
+    return table["timestamp_utc"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+
+
+def flatten(column: pa.ChunkedArray) -> pa.Array:
+    # dora-record stores each value as a list, flatten them into one contiguous array
+    column = column.combine_chunks()
+    if pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+        return column.flatten()
+
+    return column
+
 
+def load_episodes(record_path: str) -> list[tuple[int, int, int]]:
+    """
+    Returns the (episode_index, start, end) of each episode of the recording, in nanoseconds, without the failed
+    episodes. An episode starts at a value of `episode_index` other than -1, and ends at the following value.
+    """
+    table = pq.read_table(
+        record_path + "/episode_index.parquet",
+        columns=["timestamp_utc", "episode_index"],
+    ).sort_by("timestamp_utc")
+
+    timestamps = load_timestamps(table)
+    indices = flatten(table["episode_index"]).to_numpy(zero_copy_only=False)
+
+    failed = set()
+    if os.path.exists(record_path + "/failed_episode_index.parquet"):
+        failed_table = pq.read_table(
+            record_path + "/failed_episode_index.parquet",
+            columns=["failed_episode_index"],
+        )
+        failed = set(flatten(failed_table["failed_episode_index"]).to_pylist())
+
+    episodes = []
+    for position, (timestamp, index) in enumerate(zip(timestamps, indices)):
+        if index == -1:
+            continue
+
+        # An episode that was not stopped ends with the recording
+        end = int(timestamps[position + 1]) if position + 1 < len(timestamps) else None
+        episodes.append((int(index), int(timestamp), end))
+
+    return [episode for episode in episodes if episode[0] not in failed]
+
+
+def load_stream(record_path: str, name: str):
+    """
+    Loads a stream of the recording, sorted by time. Returns its timestamps in nanoseconds, and its values: a
+    (n_samples, n_joints) float32 matrix and the joints for the joints/values streams, the recorded values otherwise.
+    """
+    table = pq.read_table(
+        f"{record_path}/{name}.parquet", columns=["timestamp_utc", name]
+    ).sort_by("timestamp_utc")
+
+    timestamps = load_timestamps(table)
+
+    column = table[name].combine_chunks()
+    values = flatten(table[name])
+
+    if pa.types.is_struct(values.type) and values.type.get_field_index("values") != -1:
+        if len(column) == 0:
+            # A node that never published, its joints are not known and its frames are reported missing
+            print(f"WARNING: the stream {name} of {record_path} has no message.")
+            return timestamps, np.zeros((0, 0), np.float32), None
+
+        # Each message holds the same joints, one matrix row per message
+        joints = values.field("joints")[: len(values) // len(column)]
+        matrix = (
+            values.field("values")
+            .to_numpy(zero_copy_only=False)
+            .astype(np.float32)
+            .reshape(len(column), -1)
+        )
+
+        return timestamps, matrix, joints
+
+    return timestamps, column, None
+
+
+def as_of(timestamps: np.ndarray, grid: np.ndarray, policy: str):
+    """
+    Selects the samples of each frame of the grid with sorted as-of joins. Returns the indices of the samples before
+    and after each frame, the interpolation weight of the sample after, and the distance of each frame to the samples
+    it is filled from, in nanoseconds.
+    """
+    last = len(timestamps) - 1
+
+    # The frames before the first sample take the first sample, the frames after the last sample take the last
+    before = np.clip(np.searchsorted(timestamps, grid, side="right") - 1, 0, last)
+    after = np.clip(np.searchsorted(timestamps, grid, side="left"), 0, last)
+
+    distance_before = np.abs(grid - timestamps[before])
+    distance_after = np.abs(timestamps[after] - grid)
+
+    if policy == "previous":
+        return before, before, np.zeros(len(grid)), distance_before
+
+    if policy == "nearest":
+        nearest = np.where(distance_after < distance_before, after, before)
+        return (
+            nearest,
+            nearest,
+            np.zeros(len(grid)),
+            np.minimum(distance_before, distance_after),
+        )
+
+    if policy == "linear":
+        span = (timestamps[after] - timestamps[before]).astype(np.float64)
+        weight = np.divide(
+            grid - timestamps[before],
+            span,
+            out=np.zeros(len(grid)),
+            where=span > 0,
+        )
 
-def adapt_timestamps(dataset):
-    start_timestamp = dataset.groupby("episode_index")["timestamp_utc"].min()
-    start_timestamp = start_timestamp.apply(
-        lambda x: pd.to_datetime(x).timestamp() * 1000
+        return (
+            before,
+            after,
+            np.clip(weight, 0, 1),
+            np.minimum(distance_before, distance_after),
+        )
+
+    raise ValueError(f"Unknown policy {policy}, expected one of {POLICIES}.")
+
+
+def resample(
+    timestamps: np.ndarray,
+    values,
+    grid: np.ndarray,
+    policy: str,
+):
+    """
+    Resamples the samples of a stream on the frame grid. Returns the values of the frames, and the distance of each
+    frame to the samples it is filled from, in nanoseconds.
+    """
+    if isinstance(values, np.ndarray):
+        if len(timestamps) == 0:
+            return np.full((len(grid), values.shape[1]), np.nan, np.float32), np.full(
+                len(grid), np.inf
+            )
+
+        before, after, weight, distance = as_of(timestamps, grid, policy)
+
+        frames = values[before] + weight[:, None].astype(np.float32) * (
+            values[after] - values[before]
+        )
+
+        return frames, distance
+
+    if policy == "linear":
+        raise ValueError("The linear policy is only available for joint values.")
+
+    if len(timestamps) == 0:
+        return pa.nulls(len(grid), values.type), np.full(len(grid), np.inf)
+
+    before, _, _, distance = as_of(timestamps, grid, policy)
+
+    return values.take(pa.array(before)), distance
+
+
+def to_fixed_size_list(values: np.ndarray) -> pa.FixedSizeListArray:
+    # One list per row of the matrix, sharing the buffer of the matrix
+    return pa.FixedSizeListArray.from_arrays(
+        pa.array(values.astype(np.float32, copy=False).ravel()), values.shape[1]
     )
 
-    dataset["timestamp_utc"] = dataset.apply(
-        lambda x: pd.to_datetime(x["timestamp_utc"]).timestamp() * 1000
-        - start_timestamp[x["episode_index"]],
-        axis=1,
+
+def load_joints(schema: pa.Schema) -> list[str]:
+    """
+    Returns the names of the joints of a dataset, from its schema metadata.
+    """
+    return json.loads(schema.metadata[b"joints"])
+
+
+def build_dataset(
+    record_path: str,
+    framerate: int,
+    policies: dict[str, str],
+    max_staleness_ms: float,
+):
+    """
+    Resamples the streams of the recording on the frame grid of each episode. Returns the dataset table, and the
+    resampling report of each stream.
+    """
+    episodes = load_episodes(record_path)
+
+    names = ["action", "observation.state"] + sorted(
+        f[: -len(".parquet")]
+        for f in os.listdir(record_path)
+        if f.startswith("observation.images.") and f.endswith(".parquet")
     )
+    streams = {name: load_stream(record_path, name) for name in names}
 
-    return dataset
+    # The joints are the joints of the actions, or of the states if no action was recorded
+    joints = next(
+        (joints for _, _, joints in streams.values() if joints is not None), None
+    )
+    joints = [] if joints is None else joints.to_pylist()
+
+    # A joint stream without message has the joints of the other one, its frames are NaN
+    for name, (timestamps, values, _) in streams.items():
+        if isinstance(values, np.ndarray) and len(timestamps) == 0:
+            streams[name] = (timestamps, np.zeros((0, len(joints)), np.float32), None)
+
+    # An episode that was not stopped ends at the last sample of the recording
+    last = max(
+        (
+            int(timestamps[-1])
+            for timestamps, _, _ in streams.values()
+            if len(timestamps)
+        ),
+        default=0,
+    )
+
+    max_staleness = max_staleness_ms * 1e6
+
+    # The frames of each episode, in integer nanoseconds like the timestamps of the recording
+    grids = []
+    for _, start, end in episodes:
+        end = max(start, last if end is None else end)
+        count = (end - start) * framerate // 1_000_000_000 + 1
+        grids.append(
+            start + np.arange(count, dtype=np.int64) * 1_000_000_000 // framerate
+        )
+
+    columns = {
+        "episode_index": np.repeat(
+            [episode[0] for episode in episodes], [len(grid) for grid in grids]
+        )
+    }
+    report = {}
+
+    for name, (timestamps, values, _) in streams.items():
+        policy = policies.get(name, DEFAULT_POLICIES.get(name, "previous"))
+
+        frames = []
+        distances = []
+
+        for (_, start, end), grid in zip(episodes, grids):
+            # Only the samples of the episode of the frames are used, so no value leaks across episodes
+            first = np.searchsorted(timestamps, start, side="left")
+            stop = (
+                len(timestamps)
+                if end is None
+                else np.searchsorted(timestamps, end, side="right")
+            )
+
+            episode_frames, distance = resample(
+                timestamps[first:stop], values[first:stop], grid, policy
+            )
+
+            frames.append(episode_frames)
+            distances.append(distance)
+
+        distances = np.concatenate(distances) if distances else np.zeros(0)
+
+        if isinstance(values, np.ndarray):
+            columns[name] = to_fixed_size_list(
+                np.concatenate(frames)
+                if frames
+                else np.zeros((0, values.shape[1]), np.float32)
+            )
+        else:
+            columns[name] = pa.concat_arrays(frames) if frames else values[:0]
+
+        finite = distances[np.isfinite(distances)]
+
+        report[name] = {
+            "policy": policy,
+            "frames": len(distances),
+            "stale_frames": int(np.sum(distances > max_staleness)),
+            "missing_frames": int(np.sum(~np.isfinite(distances))),
+            "max_staleness_ms": float(finite.max() / 1e6) if len(finite) else None,
+        }
+
+    frame = np.concatenate([np.arange(len(grid)) for grid in grids]) if grids else []
+    columns["timestamp"] = np.asarray(frame) * 1000 / framerate
+
+    return pa.table(columns, metadata={"joints": json.dumps(joints)}), report
+
+
+def parse_policies(policies: list[str]) -> dict[str, str]:
+    parsed = {}
+    for policy in policies:
+        name, _, value = policy.partition("=")
+        if value not in POLICIES:
+            raise ValueError(
+                f"Unknown policy {policy}, expected STREAM=POLICY with POLICY one of {POLICIES}."
+            )
+
+        parsed[name] = value
+
+    return parsed
 
 
 def main():
@@ -44,6 +357,29 @@ def main():
         default=30,
         help="The framerate of the video.",
     )
+    parser.add_argument(
+        "--policy",
+        type=str,
+        action="append",
+        required=False,
+        default=[],
+        help="The resampling policy of a stream, e.g. observation.state=previous (previous, nearest or linear). "
+        "The joint values are interpolated by default, the other streams take the previous sample.",
+    )
+    parser.add_argument(
+        "--max-staleness-ms",
+        type=float,
+        required=False,
+        default=100,
+        help="The distance to the samples above which a frame is reported as stale.",
+    )
+    parser.add_argument(
+        "--image-samples",
+        type=int,
+        required=False,
+        default=IMAGE_SAMPLES,
+        help="The number of frames decoded per episode and camera for the image statistics, 0 to skip them.",
+    )
 
     args = parser.parse_args()
 
@@ -53,208 +389,42 @@ def main():
         )
     )
 
-    framerate = args.framerate
-
     args.dataset_name = args.dataset_name.replace(" ", "_")
     args.dataset_name = args.dataset_name.lower()
 
-    # Load the recording, only keep 'timestamp_utc', and valeus for 'action', 'state', and 'images
-    action = pd.read_parquet(args.record_path + "/action.parquet")
-    action = action[["timestamp_utc", "action"]]
-
-    episode_index = pd.read_parquet(args.record_path + "/episode_index.parquet")
-    episode_index = episode_index[["timestamp_utc", "episode_index"]]
-
-    state = pd.read_parquet(args.record_path + "/observation.state.parquet")
-    state = state[["timestamp_utc", "observation.state"]]
-
-    files = os.listdir(args.record_path)
-    image_files = [
-        f
-        for f in files
-        if f.startswith("observation.images.") and f.endswith(".parquet")
-    ]
-    image_files = [f.replace(".parquet", "") for f in image_files]
-
-    images = [
-        pd.read_parquet(args.record_path + "/" + f + ".parquet") for f in image_files
-    ]
-    images = [images[i][["timestamp_utc", image_files[i]]] for i in range(len(images))]
-
-    # filter rows that are between start and end timestamp, and add the episode_index
-    action = pd.DataFrame(action)
-    episode_index = pd.DataFrame(episode_index)
-    state = pd.DataFrame(state)
-    images = [pd.DataFrame(image) for image in images]
-
-    # add "episode_index" column to dataframes
-    action["episode_index"] = -1
-    state["episode_index"] = -1
-    for image in images:
-        image["episode_index"] = -1
-
-    # get a list of tuple (episode, start, end) for each episode: an episode start if episode_index != -1 and end if
-    # episode_index == -1
-    episode_start_end = []
-
-    for i in range(len(episode_index)):
-        if episode_index.iloc[i]["episode_index"] != -1:
-            episode_start_end.append(
-                (
-                    episode_index.iloc[i]["episode_index"],
-                    episode_index.iloc[i]["timestamp_utc"],
-                    None,
-                )
-            )
-        else:
-            episode_start_end[-1] = (
-                episode_start_end[-1][0],
-                episode_start_end[-1][1],
-                episode_index.iloc[i]["timestamp_utc"],
-            )
-
-    # for each dataframe, filter rows that are between start and end timestamp, and add the episode_index
-    action = [
-        action[
-            (action["timestamp_utc"] >= episode_start_end[i][1])
-            & (action["timestamp_utc"] <= episode_start_end[i][2])
-        ]
-        for i in range(len(episode_start_end))
-    ]
-
-    for i in range(len(action)):
-        action[i].loc[:, "episode_index"] = episode_start_end[i][0][0]
-
-    action = pd.concat(action, sort=False)
-
-    state = [
-        state[
-            (state["timestamp_utc"] >= episode_start_end[i][1])
-            & (state["timestamp_utc"] <= episode_start_end[i][2])
-        ]
-        for i in range(len(episode_start_end))
-    ]
-
-    for i in range(len(state)):
-        state[i].loc[:, "episode_index"] = episode_start_end[i][0][0]
-
-    state = pd.concat(state, sort=False)
-
-    for i in range(len(images)):
-        image = [
-            images[i][
-                (images[i]["timestamp_utc"] >= episode_start_end[j][1])
-                & (images[i]["timestamp_utc"] <= episode_start_end[j][2])
-            ]
-            for j in range(len(episode_start_end))
-        ]
-
-        for j in range(len(image)):
-            image[j].loc[:, "episode_index"] = episode_start_end[j][0][0]
-
-        images[i] = pd.concat(image, sort=False)
-
-    state = adapt_timestamps(state)
-    action = adapt_timestamps(action)
-
-    for i in range(len(images)):
-        # multiply the timestamp by the value of the image column
-        images[i]["timestamp_utc"] = images[i].apply(
-            lambda x: x[image_files[i]][0]["timestamp"] * 1000, axis=1
-        )
-
-    # we merge action, state, and images into a single dataframe, based on the timestamp_utc. Preserve the order of
-    # the rows and 'episode_index' column
-
-    dataset = pd.merge(
-        action, state, on=["timestamp_utc", "episode_index"], how="outer"
+    dataset, report = build_dataset(
+        args.record_path,
+        args.framerate,
+        parse_policies(args.policy),
+        args.max_staleness_ms,
     )
-    for i in range(len(images)):
-        dataset = pd.merge(
-            dataset, images[i], on=["timestamp_utc", "episode_index"], how="outer"
-        )
-
-    # load failed_episode_index.parquet
-    if os.path.exists(args.record_path + "/failed_episode_index.parquet"):
-        failed_episode_index = pd.read_parquet(
-            args.record_path + "/failed_episode_index.parquet"
-        )
-        failed_episode_index = failed_episode_index[["failed_episode_index"]]
-
-        failed_episode_index = [
-            i[0] for i in failed_episode_index["failed_episode_index"].tolist()
-        ]
 
-        # remove the rows for which episode_index is in failed_episode_index
-        dataset = dataset[~dataset["episode_index"].isin(failed_episode_index)]
+    dataset_path = "datasets/" + args.dataset_name
+    if not os.path.exists(dataset_path):
+        os.makedirs(dataset_path)
 
-    # sort the dataset by episode_index and timestamp_utc
+    pq.write_table(dataset, dataset_path + "/dataset.parquet")
 
-    dataset.sort_values(by=["episode_index", "timestamp_utc"], inplace=True)
+    with open(dataset_path + "/resample_report.json", "w") as file:
+        json.dump(report, file, indent=2)
 
-    # create a raw.parquet file with the dataset
-    if not os.path.exists("datasets/" + args.dataset_name):
-        os.makedirs("datasets/" + args.dataset_name)
-
-    dataset.to_parquet("datasets/" + args.dataset_name + "/raw.parquet", index=False)
-
-    # for each row with NaN values, fill the NaN values with the nearest non-NaN value
-    dataset.set_index(["timestamp_utc", "episode_index"], inplace=True)
-
-    dataset = dataset.ffill().bfill()
-
-    dataset.reset_index(inplace=True)
-
-    # add a new column "frame" to the dataset that is the result of timestamp_utc // framerate
-    dataset["frame"] = dataset["timestamp_utc"] // int(1000 / framerate)
-
-    # Only keep 1 row for each frame, keep the first row if there are multiple rows for the same frame
-    dataset = (
-        dataset.groupby(["episode_index", "frame"])
-        .apply(lambda x: x.iloc[0], include_groups=False)
-        .reset_index()
-    )
-
-    # Remove timestamp_utc column
-    dataset.drop(columns=["timestamp_utc"], inplace=True)
-
-    # Add new column "timestamp" that is the result of frame * framerate
-    dataset["timestamp"] = dataset["frame"] * 1000 / framerate
-
-    # Drop the frame column
-    dataset.drop(columns=["frame"], inplace=True)
-
-    # only keep the array of positions for each action abd state
-    arrow_struct = pa.StructArray.from_pandas(dataset["action"][0])
-    joints = arrow_struct.field("joints").to_numpy(zero_copy_only=False)
-
-    def get_values(x):
-        arrow_x = pa.StructArray.from_pandas(x)
-        return arrow_x.field("values").to_numpy(zero_copy_only=False)
-
-    dataset["action"] = dataset["action"].apply(lambda x: get_values(x))
-    dataset["observation.state"] = dataset["observation.state"].apply(
-        lambda x: get_values(x)
-    )
-
-    # Add a new column "joints" that is the array of joints with enough rows to match the number of rows in the dataset
-    dataset["joints"] = pd.Series([joints for _ in range(len(dataset))])
+    # move the video folder to the dataset folder
+    if os.path.exists(args.record_path + "/videos"):
+        os.rename(args.record_path + "/videos", dataset_path + "/videos")
 
-    dataset.sort_values(by=["episode_index", "timestamp"], inplace=True)
+    # The statistics of a previous build of the dataset are not those of its episodes
+    if os.path.exists(dataset_path + "/" + STATS_FILE):
+        os.remove(dataset_path + "/" + STATS_FILE)
 
-    # save the dataset to a parquet file
-    dataset.to_parquet(
-        "datasets/" + args.dataset_name + "/dataset.parquet", index=False
-    )
+    update_stats(dataset_path, dataset, args.image_samples)
 
-    # move the video folder to the dataset folder
-    if os.path.exists(args.record_path + "/videos"):
-        os.rename(
-            args.record_path + "/videos", "datasets/" + args.dataset_name + "/videos"
+    print(f"{'stream':<32}{'policy':>10}{'frames':>10}{'stale':>10}{'missing':>10}")
+    for name, stream in report.items():
+        print(
+            f"{name:<32}{stream['policy']:>10}{stream['frames']:>10}{stream['stale_frames']:>10}"
+            f"{stream['missing_frames']:>10}"
         )
 
-    print(dataset)
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,360 @@
+"""
+Computes the normalization statistics of a dataset built by `datasets/build_dataset.py`: the mean, std, min and max of
+`action` and `observation.state` per joint, and of the images per channel (RGB, in [0, 1]) from frames sampled in the
+videos of each episode.
+
+The statistics are stored in `stats.json` next to `dataset.parquet`. The moments (count, mean, sum of squared
+differences, min, max) of each episode are kept, and merged into the global statistics with the parallel algorithm of
+Chan et al., so adding an episode only computes the statistics of that episode, and dropping one subtracts its
+moments.
+
+    python datasets/dataset_stats.py --dataset-path datasets/my_dataset
+    python datasets/dataset_stats.py --dataset-path datasets/my_dataset --drop-episodes 3 7
+"""
+
+import os
+import json
+import argparse
+from functools import reduce
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+STATS_FILE = "stats.json"
+FEATURES = ["action", "observation.state"]
+IMAGE_SAMPLES = 10
+
+
+def moments(values: np.ndarray) -> dict:
+    """
+    Returns the moments of each column of a (n_samples, n_features) matrix, ignoring the NaN values.
+    """
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0).astype(np.float64)
+    filled = np.where(valid, values, 0).astype(np.float64)
+
+    mean = np.divide(
+        filled.sum(axis=0), count, out=np.zeros(len(count)), where=count > 0
+    )
+    m2 = np.where(valid, (filled - mean) ** 2, 0).sum(axis=0)
+
+    return {
+        "count": count,
+        "mean": mean,
+        "m2": m2,
+        "min": np.fmin.reduce(values, axis=0).astype(np.float64),
+        "max": np.fmax.reduce(values, axis=0).astype(np.float64),
+    }
+
+
+def merge(a: dict, b: dict) -> dict:
+    """
+    Merges the moments of two sets of samples.
+    """
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+
+    mean = a["mean"] + np.divide(
+        delta * b["count"], count, out=np.zeros(len(count)), where=count > 0
+    )
+    m2 = (
+        a["m2"]
+        + b["m2"]
+        + np.divide(
+            delta**2 * a["count"] * b["count"],
+            count,
+            out=np.zeros(len(count)),
+            where=count > 0,
+        )
+    )
+
+    return {
+        "count": count,
+        "mean": mean,
+        "m2": m2,
+        "min": np.fmin(a["min"], b["min"]),
+        "max": np.fmax(a["max"], b["max"]),
+    }
+
+
+def subtract(total: dict, part: dict, remaining: list[dict]) -> dict:
+    """
+    Removes the moments of a set of samples from the moments of the set holding them. The min and max can not be
+    subtracted, they are those of the `remaining` sets.
+    """
+    count = total["count"] - part["count"]
+
+    mean = np.divide(
+        total["count"] * total["mean"] - part["count"] * part["mean"],
+        count,
+        out=np.zeros(len(count)),
+        where=count > 0,
+    )
+    m2 = total["m2"] - part["m2"]
+    m2 -= np.divide(
+        (part["mean"] - mean) ** 2 * count * part["count"],
+        total["count"],
+        out=np.zeros(len(count)),
+        where=total["count"] > 0,
+    )
+
+    nan = np.full(len(count), np.nan)
+
+    return {
+        "count": count,
+        "mean": mean,
+        "m2": np.maximum(m2, 0),
+        "min": reduce(np.fmin, [moment["min"] for moment in remaining], nan),
+        "max": reduce(np.fmax, [moment["max"] for moment in remaining], nan),
+    }
+
+
+def finalize(moment: dict) -> dict:
+    return to_json(
+        {
+            "mean": moment["mean"],
+            "std": np.sqrt(
+                np.divide(
+                    moment["m2"],
+                    moment["count"],
+                    out=np.zeros(len(moment["count"])),
+                    where=moment["count"] > 0,
+                )
+            ),
+            "min": moment["min"],
+            "max": moment["max"],
+        }
+    )
+
+
+def to_json(moment: dict) -> dict:
+    # NaN is not valid JSON, a feature without samples has a null min and max
+    return {
+        key: [None if np.isnan(value) else float(value) for value in values]
+        for key, values in moment.items()
+    }
+
+
+def from_json(moment: dict) -> dict:
+    return {
+        key: np.array([np.nan if value is None else value for value in values])
+        for key, values in moment.items()
+    }
+
+
+def sample_image_moments(
+    dataset_path: str, column: pa.Array, samples: int
+) -> Optional[dict]:
+    """
+    Returns the moments of the channels of `samples` frames of a video, evenly spaced over the frames of an episode.
+    `column` holds the video frame of each frame of the episode. None if the video can not be read.
+    """
+    import cv2
+
+    frames = column.to_pylist()
+    picked = np.linspace(0, len(frames) - 1, min(samples, len(frames))).astype(int)
+
+    captures = {}
+    image_moments = None
+
+    for index in picked:
+        if not frames[index]:
+            continue
+
+        frame = frames[index][0]
+        path = os.path.join(dataset_path, frame["path"])
+
+        if path not in captures:
+            if not os.path.exists(path):
+                continue
+            captures[path] = cv2.VideoCapture(path)
+
+        capture = captures[path]
+        capture.set(cv2.CAP_PROP_POS_MSEC, frame["timestamp"] * 1000)
+
+        ok, image = capture.read()
+        if ok:
+            # Channels in RGB order, in [0, 1], merged frame by frame to keep one decoded frame in memory
+            moment = moments(image[:, :, ::-1].reshape(-1, 3) / 255.0)
+            image_moments = (
+                moment if image_moments is None else merge(image_moments, moment)
+            )
+
+    for capture in captures.values():
+        capture.release()
+
+    return image_moments
+
+
+def episode_moments(
+    dataset_path: str, episode: pa.Table, image_samples: int
+) -> dict[str, dict]:
+    features = {}
+
+    for name in episode.column_names:
+        column = episode[name].combine_chunks()
+
+        if name in FEATURES:
+            values = column.flatten().to_numpy(zero_copy_only=False)
+            features[name] = moments(values.astype(np.float64).reshape(len(column), -1))
+
+        elif name.startswith("observation.images.") and image_samples > 0:
+            image = sample_image_moments(dataset_path, column, image_samples)
+            if image is not None:
+                features[name] = image
+
+    return features
+
+
+def load_stats(dataset_path: str) -> dict:
+    path = os.path.join(dataset_path, STATS_FILE)
+    if not os.path.exists(path):
+        return {"episodes": {}, "global": {}}
+
+    with open(path) as file:
+        stats = json.load(file)
+
+    return {
+        "episodes": {
+            int(index): {name: from_json(moment) for name, moment in features.items()}
+            for index, features in stats["episodes"].items()
+        },
+        "global": {name: from_json(moment) for name, moment in stats["global"].items()},
+    }
+
+
+def save_stats(dataset_path: str, stats: dict):
+    with open(os.path.join(dataset_path, STATS_FILE), "w") as file:
+        json.dump(
+            {
+                "stats": {
+                    name: finalize(moment) for name, moment in stats["global"].items()
+                },
+                "global": {
+                    name: to_json(moment) for name, moment in stats["global"].items()
+                },
+                "episodes": {
+                    str(index): {
+                        name: to_json(moment) for name, moment in features.items()
+                    }
+                    for index, features in sorted(stats["episodes"].items())
+                },
+            },
+            file,
+        )
+
+
+def add_episode(stats: dict, index: int, features: dict[str, dict]):
+    stats["episodes"][index] = features
+
+    for name, moment in features.items():
+        if name in stats["global"]:
+            stats["global"][name] = merge(stats["global"][name], moment)
+        else:
+            stats["global"][name] = moment
+
+
+def drop_episode(stats: dict, index: int):
+    features = stats["episodes"].pop(index)
+
+    for name, moment in features.items():
+        remaining = [
+            episode[name] for episode in stats["episodes"].values() if name in episode
+        ]
+
+        if remaining:
+            stats["global"][name] = subtract(stats["global"][name], moment, remaining)
+        else:
+            del stats["global"][name]
+
+
+def update_stats(
+    dataset_path: str,
+    table: Optional[pa.Table] = None,
+    image_samples: int = IMAGE_SAMPLES,
+) -> dict:
+    """
+    Updates `stats.json` to the episodes of the dataset: the statistics of the new episodes are computed and merged,
+    the episodes no longer in the dataset are subtracted. Returns the statistics.
+    """
+    if table is None:
+        table = pq.read_table(os.path.join(dataset_path, "dataset.parquet"))
+
+    stats = load_stats(dataset_path)
+
+    episode_indices = table["episode_index"].to_numpy()
+    indices = set(np.unique(episode_indices).tolist())
+
+    for index in sorted(set(stats["episodes"]) - indices):
+        drop_episode(stats, index)
+
+    columns = [
+        name
+        for name in table.column_names
+        if name in FEATURES or name.startswith("observation.images.")
+    ]
+
+    for index in sorted(indices - set(stats["episodes"])):
+        episode = table.select(columns).filter(pc.equal(table["episode_index"], index))
+        add_episode(stats, index, episode_moments(dataset_path, episode, image_samples))
+
+    save_stats(dataset_path, stats)
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="This script computes or updates the normalization statistics of a dataset."
+    )
+
+    parser.add_argument(
+        "--dataset-path",
+        type=str,
+        required=True,
+        help="The path to the dataset, holding dataset.parquet.",
+    )
+    parser.add_argument(
+        "--drop-episodes",
+        type=int,
+        nargs="*",
+        required=False,
+        default=[],
+        help="The episodes to remove from the dataset and its statistics.",
+    )
+    parser.add_argument(
+        "--image-samples",
+        type=int,
+        required=False,
+        default=IMAGE_SAMPLES,
+        help="The number of frames decoded per episode and camera for the image statistics, 0 to skip them.",
+    )
+
+    args = parser.parse_args()
+
+    table = pq.read_table(os.path.join(args.dataset_path, "dataset.parquet"))
+
+    if args.drop_episodes:
+        table = table.filter(
+            pc.invert(
+                pc.is_in(
+                    table["episode_index"], pa.array(args.drop_episodes, pa.int64())
+                )
+            )
+        )
+        pq.write_table(table, os.path.join(args.dataset_path, "dataset.parquet"))
+
+    stats = update_stats(args.dataset_path, table, args.image_samples)
+
+    for name, moment in stats["global"].items():
+        final = finalize(moment)
+        print(name)
+        for key in ["mean", "std", "min", "max"]:
+            print(f"  {key:<5}", final[key])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Merges the recordings of several sessions into one dataset.
+
+Each session is an `out/<dataflow_id>` folder: a dataset written by the lerobot-recorder node (`dataset.parquet`), or a
+dora-record recording, built with `datasets/build_dataset.py`. The sessions are built in a pool of processes, with the
+statistics of their episodes. The episodes are then renumbered from 0 in the order of the sessions, and the videos are
+hard-linked (or moved with `--move`) into the `videos` folder of the dataset under the new episode index, without
+re-encoding them.
+
+    python datasets/merge_datasets.py --sessions out/session_a out/session_b --dataset-name my_dataset
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from build_dataset import build_dataset, load_joints, parse_policies
+from dataset_stats import IMAGE_SAMPLES, add_episode, episode_moments, save_stats
+
+
+def build_session(
+    session: str,
+    framerate: int,
+    policies: dict[str, str],
+    max_staleness_ms: float,
+    image_samples: int,
+):
+    """
+    Builds the dataset of a session and the statistics of its episodes, in a process of the pool. Returns the dataset
+    table and the moments of each episode.
+    """
+    if os.path.exists(os.path.join(session, "dataset.parquet")):
+        table = pq.read_table(os.path.join(session, "dataset.parquet"))
+    else:
+        table, _ = build_dataset(session, framerate, policies, max_staleness_ms)
+
+    table = table.sort_by([("episode_index", "ascending"), ("timestamp", "ascending")])
+
+    columns = [
+        name
+        for name in table.column_names
+        if name in ["action", "observation.state"]
+        or name.startswith("observation.images.")
+    ]
+
+    moments = {}
+    for index in np.unique(table["episode_index"].to_numpy()).tolist():
+        episode = table.select(columns).filter(pc.equal(table["episode_index"], index))
+        moments[index] = episode_moments(session, episode, image_samples)
+
+    return table, moments
+
+
+def link(source: str, destination: str, move: bool):
+    # The videos of a previous merge in the dataset are replaced
+    if os.path.exists(destination):
+        os.remove(destination)
+
+    if move:
+        shutil.move(source, destination)
+        return
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Hard links do not cross file systems
+        shutil.copy2(source, destination)
+
+
+def rewrite_videos(table: pa.Table, session: str, output: str, move: bool) -> pa.Table:
+    """
+    Links the videos of a session in the dataset under the index of their episode in the dataset, and rewrites their
+    paths in the video frame columns.
+    """
+    for name in table.column_names:
+        if not name.startswith("observation.images."):
+            continue
+
+        camera = name[len("observation.images.") :]
+
+        column = table[name].combine_chunks()
+        frames = column.flatten()
+
+        # The paths are rewritten once per video, not once per frame
+        paths = frames.field("path").dictionary_encode()
+        episode_of_frame = np.repeat(
+            table["episode_index"].to_numpy(), np.diff(column.offsets.to_numpy())
+        )
+        _, first_frames = np.unique(
+            paths.indices.to_numpy(zero_copy_only=False), return_index=True
+        )
+
+        rewritten = []
+        for path, frame in zip(paths.dictionary.to_pylist(), first_frames):
+            episode = int(episode_of_frame[frame])
+            extension = os.path.splitext(path)[1]
+            new_path = f"videos/{camera}_episode_{episode:06d}{extension}"
+
+            source = os.path.join(session, path)
+            if os.path.exists(source):
+                link(source, os.path.join(output, new_path), move)
+            else:
+                print(
+                    f"Video {source} not found, the paths of its frames are still rewritten."
+                )
+
+            rewritten.append(new_path)
+
+        frames = pa.StructArray.from_arrays(
+            [
+                pa.array(rewritten, pa.string()).take(paths.indices),
+                frames.field("timestamp"),
+            ],
+            names=["path", "timestamp"],
+        )
+
+        table = table.set_column(
+            table.schema.get_field_index(name),
+            name,
+            pa.ListArray.from_arrays(
+                column.offsets,
+                frames,
+                mask=column.is_null() if column.null_count else None,
+            ),
+        )
+
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="This script merges the recordings of several sessions into one dataset."
+    )
+
+    parser.add_argument(
+        "--sessions",
+        type=str,
+        nargs="+",
+        required=True,
+        help="The paths to the sessions, recorded datasets or dora-record recordings.",
+    )
+    parser.add_argument(
+        "--dataset-name",
+        type=str,
+        required=True,
+        help="The name you want for the dataset.",
+    )
+    parser.add_argument(
+        "--framerate",
+        type=int,
+        required=False,
+        default=30,
+        help="The framerate of the video, for the dora-record recordings.",
+    )
+    parser.add_argument(
+        "--policy",
+        type=str,
+        action="append",
+        required=False,
+        default=[],
+        help="The resampling policy of a stream of the dora-record recordings, see build_dataset.py.",
+    )
+    parser.add_argument(
+        "--max-staleness-ms",
+        type=float,
+        required=False,
+        default=100,
+        help="The distance to the samples above which a frame is reported as stale.",
+    )
+    parser.add_argument(
+        "--image-samples",
+        type=int,
+        required=False,
+        default=IMAGE_SAMPLES,
+        help="The number of frames decoded per episode and camera for the image statistics, 0 to skip them.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        required=False,
+        default=os.cpu_count(),
+        help="The number of sessions built in parallel.",
+    )
+    parser.add_argument(
+        "--move",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Move the videos into the dataset, instead of hard-linking them.",
+    )
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    dataset_name = args.dataset_name.replace(" ", "_").lower()
+    output = "datasets/" + dataset_name
+    os.makedirs(output + "/videos", exist_ok=True)
+
+    policies = parse_policies(args.policy)
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        built = list(
+            executor.map(
+                build_session,
+                args.sessions,
+                [args.framerate] * len(args.sessions),
+                [policies] * len(args.sessions),
+                [args.max_staleness_ms] * len(args.sessions),
+                [args.image_samples] * len(args.sessions),
+            )
+        )
+
+    tables = []
+    stats = {"episodes": {}, "global": {}}
+    first = 0
+
+    joints = None
+
+    for session, (table, moments) in zip(args.sessions, built):
+        if table.num_rows == 0:
+            continue
+
+        # The actions of the sessions must be of the same joints to share their statistics
+        session_joints = load_joints(table.schema)
+        if joints is None:
+            joints = session_joints
+        elif session_joints != joints:
+            raise ValueError(
+                f"The joints {session_joints} of {session} differ from the joints {joints} of {args.sessions[0]}."
+            )
+
+        # The episodes of the sessions are numbered from 0, in the order of the sessions
+        indices = sorted(moments)
+        episodes = {index: first + position for position, index in enumerate(indices)}
+
+        table = table.set_column(
+            table.schema.get_field_index("episode_index"),
+            "episode_index",
+            pa.array(
+                first + np.searchsorted(indices, table["episode_index"].to_numpy()),
+                pa.int64(),
+            ),
+        )
+        first += len(indices)
+
+        tables.append(rewrite_videos(table, session, output, args.move))
+
+        for index in indices:
+            add_episode(stats, episodes[index], moments[index])
+
+    if not tables:
+        raise ValueError(
+            f"The sessions {args.sessions} have no frame, there is nothing to merge."
+        )
+
+    dataset = pa.concat_tables(tables, promote_options="permissive")
+    dataset = dataset.replace_schema_metadata({"joints": json.dumps(joints)})
+
+    pq.write_table(dataset, output + "/dataset.parquet")
+    save_stats(output, stats)
+
+    print(
+        f"Merged {len(args.sessions)} sessions, {first} episodes and {dataset.num_rows} frames in {output}, in "
+        f"{time.perf_counter() - start:.1f} s."
+    )
+
+
+if __name__ == "__main__":
+    main()
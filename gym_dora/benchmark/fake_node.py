@@ -0,0 +1,81 @@
+"""
+Fake Dora node: emulates the event stream of a robot publishing its joints and cameras at a fixed framerate, so that
+gym_dora environments can be benchmarked without a running dataflow.
+"""
+
+import time
+import queue
+import threading
+
+import numpy as np
+import pyarrow as pa
+
+
+class FakeNode:
+
+    def __init__(
+        self,
+        fps: int,
+        joints: list[str] | None = None,
+        cameras: dict[str, tuple[int]] | None = None,
+        jitter: float = 0.002,
+        num_envs: int | None = None,
+    ):
+        """
+        Args:
+            fps: the framerate at which every input is published.
+            joints: the joints of the robot, an `agent_pos` input is published if set.
+            cameras: the cameras of the robot and their (height, width, channels) shape.
+            jitter: the maximum random delay in seconds between the inputs of a same frame.
+            num_envs: if set, emulates `num_envs` robots publishing concurrently, the inputs of the i-th robot are
+            suffixed by `/i` (e.g. `agent_pos/0`).
+        """
+        self.fps = fps
+        self.jitter = jitter
+        self.events = queue.Queue()
+        self.actions = 0
+
+        self.running = True
+        self.threads = []
+
+        for suffix in [""] if num_envs is None else [f"/{i}" for i in range(num_envs)]:
+            inputs = {}
+            if joints:
+                inputs["agent_pos" + suffix] = pa.array(
+                    np.zeros(len(joints), dtype=np.float64)
+                )
+            for camera, hwc_shape in (cameras or {}).items():
+                inputs[camera + suffix] = pa.array(
+                    np.random.randint(0, 255, size=hwc_shape, dtype=np.uint8).ravel()
+                )
+
+            thread = threading.Thread(target=self.publish, args=(inputs,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def publish(self, inputs: dict[str, pa.Array]):
+        next_frame = time.perf_counter()
+
+        while self.running:
+            for input_id, value in inputs.items():
+                time.sleep(np.random.uniform(0, self.jitter))
+                self.events.put(
+                    {"type": "INPUT", "id": input_id, "value": value, "metadata": {}}
+                )
+
+            next_frame += 1 / self.fps
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    def next(self, timeout: float | None = None):
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return {"type": "ERROR", "error": f"Timeout event stream after {timeout}"}
+
+    def send_output(self, output_id: str, data: pa.Array, metadata: dict | None = None):
+        self.actions += 1
+
+    def close(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
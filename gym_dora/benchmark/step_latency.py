@@ -0,0 +1,163 @@
+"""
+Step latency benchmark: measures the latency and CPU usage of `DoraEnv.step` against a fake node publishing the inputs
+of a robot, and compares it to the previous polling implementation (spin on `next(timeout=0.001)` for a full period,
+then sleep to pace). `DoraEnv` is measured both when returning copies and read-only views of its buffers.
+
+Usage:
+    python gym_dora/benchmark/step_latency.py --robot aloha --steps 300
+"""
+
+import time
+import argparse
+
+import numpy as np
+import pyarrow as pa
+
+from fake_node import FakeNode
+
+from gym_dora.env import DoraEnv
+from gym_dora.robots import aloha, koch, reachy2
+
+ROBOTS = {"aloha": aloha, "koch": koch, "reachy2": reachy2}
+
+
+class PollingEnv:
+    """
+    The previous observation loop of DoraEnv, kept as a reference for the benchmark.
+    """
+
+    def __init__(self, node, fps: int, cameras: dict[str, tuple[int]]):
+        self._node = node
+        self.fps = fps
+        self.cameras = cameras
+        self._observation = {"pixels": {}, "agent_pos": None}
+        self._step_time = time.time()
+        self.received_at = {}
+
+    def _get_obs(self):
+        obs_initial_time = time.time()
+        while time.time() - obs_initial_time < 1 / self.fps:
+            event = self._node.next(timeout=0.001)
+
+            if event["type"] == "INPUT":
+                if "cam" in event["id"]:
+                    self._observation["pixels"][event["id"]] = (
+                        event["value"].to_numpy().reshape(self.cameras[event["id"]])
+                    )
+                else:
+                    self._observation[event["id"]] = event["value"].to_numpy()
+
+                self.received_at[event["id"]] = time.perf_counter()
+
+            elif event["type"] == "ERROR":
+                break
+
+    def step(self, action: np.ndarray):
+        self._node.send_output("action", pa.array(action))
+
+        time.sleep(max(0, 1 / self.fps - (time.time() - self._step_time)))
+        self._step_time = time.time()
+
+        self._get_obs()
+
+        now = time.perf_counter()
+        staleness = {key: now - value for key, value in self.received_at.items()}
+        return self._observation, 0, False, False, {"staleness": staleness}
+
+
+def run(env, steps: int, action_size: int, policy_ms: float) -> dict:
+    action = np.zeros(action_size, dtype=np.float32)
+    latencies = []
+    ages = []
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    for _ in range(steps):
+        # Emulate the inference time of the policy
+        time.sleep(policy_ms / 1000)
+
+        start = time.perf_counter()
+        _, _, _, _, info = env.step(action)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        # Age of the oldest input of the observation when it is returned to the policy
+        ages.append(max(info["staleness"].values()) * 1000)
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "max_ms": float(np.max(latencies)),
+        "age_ms": float(np.mean(ages)),
+        "steps_per_s": steps / wall,
+        "cpu_percent": 100 * cpu / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Step latency benchmark: measures DoraEnv.step against a fake node."
+    )
+
+    parser.add_argument(
+        "--robot",
+        type=str,
+        choices=list(ROBOTS),
+        required=False,
+        help="The robot configuration to emulate.",
+        default="aloha",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        required=False,
+        help="The number of steps to measure.",
+        default=300,
+    )
+    parser.add_argument(
+        "--policy-ms",
+        type=float,
+        required=False,
+        help="The emulated inference time of the policy between two steps, in milliseconds.",
+        default=10.0,
+    )
+
+    args = parser.parse_args()
+
+    robot = ROBOTS[args.robot]
+
+    print(
+        f"{'implementation':<20}{'p50 (ms)':>10}{'p95 (ms)':>10}{'max (ms)':>10}"
+        f"{'obs age (ms)':>14}{'steps/s':>10}{'cpu (%)':>10}"
+    )
+
+    for name in ["polling", "event-driven", "event-driven views"]:
+        node = FakeNode(robot.FPS, robot.JOINTS, robot.CAMERAS)
+
+        if name == "polling":
+            env = PollingEnv(node, robot.FPS, robot.CAMERAS)
+        else:
+            env = DoraEnv(
+                robot.FPS,
+                robot.ACTIONS,
+                robot.JOINTS,
+                robot.CAMERAS,
+                copy=name != "event-driven views",
+                node=node,
+            )
+            env.reset()
+
+        result = run(env, args.steps, len(robot.ACTIONS), args.policy_ms)
+        node.close()
+
+        print(
+            f"{name:<20}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['max_ms']:>10.1f}"
+            f"{result['age_ms']:>14.1f}{result['steps_per_s']:>10.1f}{result['cpu_percent']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Vector throughput benchmark: measures how the throughput of `DoraVectorEnv` scales with the number of robots
+multiplexed on one node, against a fake node emulating them. The policy is emulated by a batched forward pass whose
+duration grows slowly with the batch size, as on a GPU.
+
+Usage:
+    python gym_dora/benchmark/vector_throughput.py --robot koch --num-envs 1 2 4 8
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from fake_node import FakeNode
+
+from gym_dora.env_vector import DoraVectorEnv
+from gym_dora.robots import aloha, koch, reachy2
+
+ROBOTS = {"aloha": aloha, "koch": koch, "reachy2": reachy2}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Vector throughput benchmark: measures DoraVectorEnv against a fake node."
+    )
+
+    parser.add_argument(
+        "--robot",
+        type=str,
+        choices=list(ROBOTS),
+        required=False,
+        help="The robot configuration to emulate.",
+        default="koch",
+    )
+    parser.add_argument(
+        "--num-envs",
+        type=int,
+        nargs="+",
+        required=False,
+        help="The numbers of robots to measure.",
+        default=[1, 2, 4, 8],
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        required=False,
+        help="The number of steps to measure for each number of robots.",
+        default=200,
+    )
+    parser.add_argument(
+        "--policy-ms",
+        type=float,
+        required=False,
+        help="The emulated duration of a batched forward pass of one sample, in milliseconds.",
+        default=10.0,
+    )
+    parser.add_argument(
+        "--policy-ms-per-sample",
+        type=float,
+        required=False,
+        help="The emulated additional duration of a batched forward pass per sample, in milliseconds.",
+        default=0.5,
+    )
+
+    args = parser.parse_args()
+
+    robot = ROBOTS[args.robot]
+
+    print(
+        f"{'num envs':<10}{'steps/s':>10}{'env steps/s':>14}{'p50 step (ms)':>16}{'p95 step (ms)':>16}"
+        f"{'fresh (%)':>12}"
+    )
+
+    for num_envs in args.num_envs:
+        node = FakeNode(robot.FPS, robot.JOINTS, robot.CAMERAS, num_envs=num_envs)
+        env = DoraVectorEnv(
+            num_envs, robot.FPS, robot.ACTIONS, robot.JOINTS, robot.CAMERAS, node=node
+        )
+        env.reset()
+
+        actions = np.zeros((num_envs, len(robot.ACTIONS)), dtype=np.float32)
+        latencies = []
+        fresh = []
+
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            # Emulate one batched forward pass of the policy
+            time.sleep(
+                (args.policy_ms + args.policy_ms_per_sample * (num_envs - 1)) / 1000
+            )
+
+            step_start = time.perf_counter()
+            _, _, _, _, infos = env.step(actions)
+            latencies.append((time.perf_counter() - step_start) * 1000)
+            fresh.append(np.mean(infos["fresh"]))
+
+        wall = time.perf_counter() - start
+
+        env.close()
+        node.close()
+
+        print(
+            f"{num_envs:<10}{args.steps / wall:>10.1f}{num_envs * args.steps / wall:>14.1f}"
+            f"{np.percentile(latencies, 50):>16.1f}{np.percentile(latencies, 95):>16.1f}"
+            f"{100 * np.mean(fresh):>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ from dora import Node
 from gymnasium import spaces
 import time
 
+from gym_dora.observation import ObservationAssembler
+
 
 class DoraEnv(gym.Env):
     metadata = {}
@@ -15,11 +17,38 @@ class DoraEnv(gym.Env):
         actions: list[str],
         joints: list[str] | None = None,
         cameras: dict[str, tuple[int]] | None = None,
+        timeout: float | None = None,
+        reset_timeout: float = 5.0,
+        history: int = 1,
+        buffer_size: int | None = None,
+        copy: bool = True,
+        node=None,
     ):
+        """
+        Args:
+            fps: the control frequency of the robot.
+            actions: the names of the action values.
+            joints: the names of the joints in `agent_pos`.
+            cameras: the cameras of the robot and their (height, width, channels) shape.
+            timeout: the maximum time in seconds `step` waits for a fresh observation, defaults to two periods 2 / fps.
+            reset_timeout: the maximum time in seconds `reset` waits for a complete observation.
+            history: the number of most recent states and frames stacked in an observation, on a new first axis. If 1,
+            they are not stacked.
+            buffer_size: the number of slots of the preallocated ring buffer of each input, at least `history`.
+            copy: if True observations are copies, otherwise read-only views of the ring buffers that are overwritten
+            once `buffer_size - history` newer values have been received.
+            node: the Dora node to use, a new one is created if not set.
+        """
         self.fps = fps
         self.actions = actions
         self.joints = joints
         self.cameras = cameras
+        self.timeout = 2 / fps if timeout is None else timeout
+        self.reset_timeout = reset_timeout
+        self.history = history
+
+        # Stacked observations have a leading history axis
+        stack = (history,) if history > 1 else ()
 
         # Specify gym action and observation spaces
 
@@ -29,7 +58,7 @@ class DoraEnv(gym.Env):
             observation_space["agent_pos"] = spaces.Box(
                 low=-1000.0,
                 high=1000.0,
-                shape=(len(self.joints),),
+                shape=stack + (len(self.joints),),
                 dtype=np.float64,
             )
 
@@ -41,7 +70,7 @@ class DoraEnv(gym.Env):
                     low=0,
                     high=255,
                     # height x width x channels (e.g. 480 x 640 x 3)
-                    shape=hwc_shape,
+                    shape=stack + tuple(hwc_shape),
                     dtype=np.uint8,
                 )
             observation_space["pixels"] = spaces.Dict(pixels_space)
@@ -52,62 +81,44 @@ class DoraEnv(gym.Env):
         )
 
         # Initialize a new Dora node used to get events from the robot
-        # that will be stored in `_observation` and `_terminated`
-        self._node = Node()
-        self._observation = {"pixels": {}, "agent_pos": None}
+        # that will be assembled into observations by `_assembler`
+        self._node = Node() if node is None else node
+        self._assembler = ObservationAssembler(
+            self._node, self.joints, self.cameras, history, buffer_size, copy
+        )
         self._terminated = False
-        self._step_time = time.time()
-
-    def _get_obs(self):
-        obs_initial_time = time.time()
-        while time.time() - obs_initial_time < 1 / self.fps:
-            event = self._node.next(timeout=0.001)
-
-            ## If event is None, the node event stream is closed and we should terminate the env
-            if event is None:
-                self._terminated = True
-                print("Node event stream closed.")
-                raise ConnectionError("Dora Node event stream closed.")
-
-            if event["type"] == "INPUT":
-                # Map Image input into pixels key within Aloha environment
-                if "cam" in event["id"]:
-                    camera = event["id"]
-                    hwc_shape = self.cameras[camera]
-                    self._observation["pixels"][event["id"]] = (
-                        event["value"].to_numpy().reshape(hwc_shape)
-                    )
-                else:
-                    # Map other inputs into the observation dictionary using the event id as key
-                    self._observation[event["id"]] = event["value"].to_numpy()
-
-            # If the event is a timeout error break the update loop.
-            elif event["type"] == "ERROR":
-                break
+
+    def _get_obs(self, timeout: float) -> dict:
+        """
+        Waits for a fresh observation, i.e. every required input updated since the previous one, for at most `timeout`
+        seconds. Returns the info dictionary with the per-input staleness in seconds.
+        """
+        try:
+            fresh = self._assembler.assemble(time.perf_counter() + timeout)
+        except ConnectionError:
+            self._terminated = True
+            print("Node event stream closed.")
+            raise
+
+        return {"fresh": fresh, "staleness": self._assembler.staleness()}
 
     def reset(self, seed: int | None = None):
         del seed
         ## TODO(tao): Add reset event to the node
         # self._node.send_output("reset")
-        self._get_obs()
+        info = self._get_obs(self.reset_timeout)
         self._terminated = False
-        info = {}
-        return self._observation, info
+        return self._assembler.observation(), info
 
     def step(self, action: np.ndarray):
         # Send the action to the dataflow as action key.
         self._node.send_output("action", pa.array(action))
 
-        # Space observation so that they match the dataset
-        time.sleep(max(0, 1 / self.fps - (time.time() - self._step_time)))
-        self._step_time = time.time()
-
-        # Reset the observation
-        self._get_obs()
+        # The observations are paced by the robot, there is no need to sleep between steps
+        info = self._get_obs(self.timeout)
         reward = 0
         terminated = truncated = self._terminated
-        info = {}
-        return self._observation, reward, terminated, truncated, info
+        return self._assembler.observation(), reward, terminated, truncated, info
 
     def render(self): ...
 
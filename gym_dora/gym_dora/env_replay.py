@@ -1,15 +1,137 @@
-import time
+import queue
+import threading
 
-import cv2
 import gymnasium as gym
 import numpy as np
 import pyarrow as pa
 from dora import Node
 from gymnasium import spaces
-from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
 
 EPISODE = 19
 REPO_ID = "cadene/reachy2_mobile_base"
+PREFETCH = 32
+
+
+class FramePrefetcher:
+    """
+    Decodes the frames of an episode of a LeRobot dataset in a background thread, ahead of the environment.
+
+    Decoded items are converted once to uint8 HWC images and stored in a bounded queue of `size` items, so that the
+    environment step only has to pop the next one.
+    """
+
+    def __init__(self, dataset, cameras: dict[str, tuple[int]], size: int = PREFETCH):
+        """
+        Args:
+            dataset: the LeRobotDataset to read.
+            cameras: the cameras to decode and their expected (height, width, channels) shape.
+            size: the maximum number of decoded items kept ahead of the environment.
+        """
+        self.dataset = dataset
+        self.cameras = cameras
+        self.size = size
+
+        self.items = None
+        self.running = None
+        self.thread = None
+
+    def start(self, from_index: int, to_index: int):
+        """
+        Starts decoding the items [from_index, to_index) of the dataset, stopping any previous decoding.
+        """
+        self.stop()
+
+        self.items = queue.Queue(maxsize=self.size)
+        self.running = threading.Event()
+        self.running.set()
+
+        self.thread = threading.Thread(
+            target=self.decode,
+            args=(from_index, to_index, self.items, self.running),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        self.running.clear()
+
+        # Unblock the decoding thread if it is waiting for a free slot
+        while self.thread.is_alive():
+            try:
+                self.items.get(timeout=0.01)
+            except queue.Empty:
+                pass
+
+        self.thread = None
+
+    def decode(
+        self,
+        from_index: int,
+        to_index: int,
+        items: queue.Queue,
+        running: threading.Event,
+    ):
+        import torch
+
+        for index in range(from_index, to_index):
+            if not running.is_set():
+                return
+
+            try:
+                item = self.dataset[index]
+
+                pixels = {}
+                for camera, hwc_shape in self.cameras.items():
+                    ## Convert image from chw float in [0, 1] to hwc uint8, in one pass
+                    image = item[f"observation.images.{camera}"].permute((1, 2, 0))
+                    if tuple(image.shape) != tuple(hwc_shape):
+                        raise ValueError(
+                            f"Image of {camera} has shape {tuple(image.shape)}, expected {tuple(hwc_shape)}"
+                        )
+
+                    pixels[camera] = np.empty(hwc_shape, dtype=np.uint8)
+                    torch.from_numpy(pixels[camera]).copy_(image * 255)
+
+                observation = {
+                    "pixels": pixels,
+                    "agent_pos": item["observation.state"].numpy(),
+                }
+            except Exception as e:
+                # Errors are raised by the environment when it reaches the item
+                observation = e
+
+            while running.is_set():
+                try:
+                    items.put(observation, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+        # End of the episode
+        while running.is_set():
+            try:
+                items.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+    def next(self) -> dict | None:
+        """
+        Returns the next decoded observation, or None at the end of the episode.
+        """
+        observation = self.items.get()
+
+        if isinstance(observation, Exception):
+            raise observation
+
+        if observation is None:
+            # Keep the end of the episode visible to the next calls
+            self.items.put(None)
+
+        return observation
 
 
 class DoraEnv(gym.Env):
@@ -21,11 +143,27 @@ class DoraEnv(gym.Env):
         actions: list[str],
         joints: list[str] | None = None,
         cameras: dict[str, tuple[int]] | None = None,
+        repo_id: str = REPO_ID,
+        episode: int = EPISODE,
+        root: str | None = None,
+        prefetch: int = PREFETCH,
     ):
+        """
+        Args:
+            fps: the framerate of the dataset.
+            actions: the names of the action values.
+            joints: the names of the joints in `agent_pos`.
+            cameras: the cameras of the dataset and their (height, width, channels) shape.
+            repo_id: the LeRobot dataset to replay.
+            episode: the episode of the dataset to replay.
+            root: a local directory containing the dataset (`<root>/<repo_id>`), used instead of the hub, so that no
+            network access is needed.
+            prefetch: the number of frames decoded ahead of the environment.
+        """
         self.fps = fps
         self.actions = actions
         self.joints = joints
-        self.cameras = cameras
+        self.cameras = cameras or {}
         self._node = Node()
 
         # Specify gym action and observation spaces
@@ -42,7 +180,7 @@ class DoraEnv(gym.Env):
 
         if self.cameras:
             pixels_space = {}
-            for camera, hwc_shape in cameras.items():
+            for camera, hwc_shape in self.cameras.items():
                 # Assumes images are unsigned int8 in [0,255]
                 pixels_space[camera] = spaces.Box(
                     low=0,
@@ -62,11 +200,15 @@ class DoraEnv(gym.Env):
         # that will be stored in `_observation` and `_terminated`
         self._observation = {"pixels": {}, "agent_pos": None}
         self._terminated = False
-        self.dataset = LeRobotDataset(REPO_ID)
-        self.from_index = self.dataset.episode_data_index["from"][EPISODE].item()
-        self.to_index = self.dataset.episode_data_index["to"][EPISODE].item()
 
-        self.index = 0
+        # LeRobot is imported on first use, so that importing gym_dora does not load torch
+        from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
+
+        self.dataset = LeRobotDataset(repo_id, root=root)
+        self.from_index = self.dataset.episode_data_index["from"][episode].item()
+        self.to_index = self.dataset.episode_data_index["to"][episode].item()
+
+        self._prefetcher = FramePrefetcher(self.dataset, self.cameras, prefetch)
 
     def reset(self, seed: int | None = None):  # type: ignore
         del seed
@@ -75,53 +217,32 @@ class DoraEnv(gym.Env):
         self._terminated = False
         info = {}
 
-        item = self.dataset[self.from_index + self.index]
-        state = item["observation.state"]
-        image = item["observation.images.cam_trunk"]
-        image = image.permute((1, 2, 0)).numpy() * 255
-        image = image.astype(np.uint8)
-
-        if image.shape != (800, 1280, 3):  # , "image not in the right order"
-            raise ValueError("image not in the right order")
-
-        self._observation = {"pixels": {"cam_trunk": image}, "agent_pos": state.numpy()}
+        # Replay the episode from its first frame
+        self._prefetcher.start(self.from_index, self.to_index)
+        self._observation = self._prefetcher.next()
 
         return self._observation, info
 
     def step(self, action: np.ndarray):
-        # if action is not None:
         # Send the action to the dataflow as action key.
         self._node.send_output("action", pa.array(action))
 
-        # Send the action to the dataflow as action key.
-        # Space observation so that they match the dataset
-        ## Convert image from chw to hwc
+        observation = self._prefetcher.next()
 
-        if self.from_index + self.index >= self.to_index:
+        if observation is None:
             self._terminated = True
             return self._observation, 0, True, False, {}
 
-        item = self.dataset[self.from_index + self.index]
-        state = item["observation.state"]
-        image = item["observation.images.cam_trunk"]
-        image = image.permute((1, 2, 0)).numpy() * 255
-        image = image.astype(np.uint8)
-
-        if image.shape != (800, 1280, 3):  # , "image not in the right order"
-            raise ValueError("image not in the right order")
-
-        self._observation = {"pixels": {"cam_trunk": image}, "agent_pos": state.numpy()}
-        # Reset the observation
+        self._observation = observation
         reward = 0
         terminated = truncated = self._terminated
         info = {}
-        self.index += 1
         return self._observation, reward, terminated, truncated, info
 
     def render(self): ...
 
     def close(self):
+        self._prefetcher.stop()
+
         # Drop the node
         del self._node
-        pass
-        pass
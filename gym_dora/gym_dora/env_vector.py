@@ -0,0 +1,159 @@
+import time
+
+import numpy as np
+import pyarrow as pa
+from dora import Node
+from gymnasium import spaces
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import batch_space
+
+from gym_dora.observation import ObservationAssembler
+
+
+class DoraVectorEnv(VectorEnv):
+    """
+    Drives several robots (or simulations) of a same dataflow from one policy process.
+
+    The inputs of the i-th robot are multiplexed on a single Dora node with a `/i` suffix (e.g. `agent_pos/0`,
+    `cam_high/0`), and its actions are sent on the `action/i` output. Observations are batched on a new first axis so
+    that a policy can run a single batched forward pass per control tick.
+    """
+
+    metadata = {}
+
+    def __init__(
+        self,
+        num_envs: int,
+        fps: int,
+        actions: list[str],
+        joints: list[str] | None = None,
+        cameras: dict[str, tuple[int]] | None = None,
+        timeout: float | None = None,
+        reset_timeout: float = 5.0,
+        history: int = 1,
+        buffer_size: int | None = None,
+        node=None,
+    ):
+        """
+        Args:
+            num_envs: the number of robots multiplexed on the node.
+            fps: the control frequency of the robots.
+            actions: the names of the action values of one robot.
+            joints: the names of the joints in `agent_pos` of one robot.
+            cameras: the cameras of one robot and their (height, width, channels) shape.
+            timeout: the maximum time in seconds `step` waits for a fresh observation of every robot, defaults to two
+            periods 2 / fps.
+            reset_timeout: the maximum time in seconds `reset` waits for a complete observation of every robot.
+            history: the number of most recent states and frames stacked in an observation of one robot.
+            buffer_size: the number of slots of the preallocated ring buffer of each input.
+            node: the Dora node to use, a new one is created if not set.
+        """
+        # The attributes set by the constructor of VectorEnv, whose signature differs between gymnasium versions
+        self.render_mode = None
+        self.spec = None
+        self.closed = False
+
+        self.num_envs = num_envs
+        self.fps = fps
+        self.actions = actions
+        self.joints = joints
+        self.cameras = cameras
+        self.timeout = 2 / fps if timeout is None else timeout
+        self.reset_timeout = reset_timeout
+
+        # Specify gym action and observation spaces of one robot, then batch them
+
+        stack = (history,) if history > 1 else ()
+
+        observation_space = {}
+
+        if self.joints:
+            observation_space["agent_pos"] = spaces.Box(
+                low=-1000.0,
+                high=1000.0,
+                shape=stack + (len(self.joints),),
+                dtype=np.float64,
+            )
+
+        if self.cameras:
+            pixels_space = {}
+            for camera, hwc_shape in cameras.items():
+                # Assumes images are unsigned int8 in [0,255]
+                pixels_space[camera] = spaces.Box(
+                    low=0,
+                    high=255,
+                    shape=stack + tuple(hwc_shape),
+                    dtype=np.uint8,
+                )
+            observation_space["pixels"] = spaces.Dict(pixels_space)
+
+        self.single_observation_space = spaces.Dict(observation_space)
+        self.single_action_space = spaces.Box(
+            low=-1, high=1, shape=(len(self.actions),), dtype=np.float32
+        )
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        # Initialize a new Dora node used to get events from all the robots
+        self._node = Node() if node is None else node
+        self._assembler = ObservationAssembler(
+            self._node,
+            self.joints,
+            self.cameras,
+            history,
+            buffer_size,
+            num_envs=num_envs,
+        )
+        self._terminated = False
+
+    def _get_obs(self, timeout: float) -> dict:
+        """
+        Waits for a fresh observation of every robot for at most `timeout` seconds. Returns the info dictionary with
+        the per-robot freshness and the per-input staleness in seconds.
+        """
+        try:
+            self._assembler.assemble(time.perf_counter() + timeout)
+        except ConnectionError:
+            self._terminated = True
+            print("Node event stream closed.")
+            raise
+
+        # Input ids are suffixed by the robot index, gather them into one array per input
+        staleness = {}
+        for input_id, value in self._assembler.staleness().items():
+            key, index = input_id.rsplit("/", 1)
+            staleness.setdefault(key, np.zeros(self.num_envs))[int(index)] = value
+
+        return {
+            "fresh": np.array(self._assembler.fresh),
+            "_fresh": np.ones(self.num_envs, dtype=bool),
+            "staleness": staleness,
+            "_staleness": np.ones(self.num_envs, dtype=bool),
+        }
+
+    def reset(self, *, seed: int | None = None, options: dict | None = None):
+        del seed, options
+        infos = self._get_obs(self.reset_timeout)
+        self._terminated = False
+        return self._assembler.batched_observation(), infos
+
+    def step(self, actions: np.ndarray):
+        # Scatter the batched actions to the robots
+        for index, action in enumerate(actions):
+            self._node.send_output(f"action/{index}", pa.array(action))
+
+        infos = self._get_obs(self.timeout)
+        rewards = np.zeros(self.num_envs)
+        terminations = np.full(self.num_envs, self._terminated)
+        truncations = np.full(self.num_envs, self._terminated)
+        return (
+            self._assembler.batched_observation(),
+            rewards,
+            terminations,
+            truncations,
+            infos,
+        )
+
+    def close_extras(self, **kwargs):
+        # Drop the node
+        del self._node
@@ -0,0 +1,275 @@
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated ring buffer of fixed-shape samples (camera frames or joint states).
+
+    The last `history` slots are mirrored after the end of the storage, so the `history` most recent samples are
+    always a contiguous, chronologically ordered view of the storage: reading them never copies nor allocates.
+    """
+
+    def __init__(
+        self, shape: tuple[int], dtype, history: int = 1, size: int | None = None
+    ):
+        """
+        Args:
+            shape: the shape of one sample, e.g. (height, width, channels) for a camera.
+            dtype: the dtype of the samples.
+            history: the number of most recent samples returned by `latest`.
+            size: the number of slots of the ring, at least `history`. Defaults to `history + 1`, so the view returned
+            by `latest` stays valid while the next sample is written.
+        """
+        self.shape = tuple(shape)
+        self.history = history
+        self.size = max(history + 1 if size is None else size, history)
+        self.storage = np.zeros((self.size + history - 1, *shape), dtype=dtype)
+        self.slot = -1
+
+    def push(self, sample: np.ndarray):
+        """
+        Copies a sample into the next slot of the ring.
+        """
+        first = self.slot < 0
+
+        self.slot = (self.slot + 1) % self.size
+        np.copyto(self.storage[self.slot], sample, casting="unsafe")
+
+        if first:
+            # Until the history is full, repeat the first sample
+            self.storage[:] = self.storage[self.slot]
+        elif self.slot < self.history - 1:
+            self.storage[self.slot + self.size] = self.storage[self.slot]
+
+    def latest_shape(self) -> tuple[int]:
+        """
+        Returns the shape of the arrays returned by `latest`.
+        """
+        return self.shape if self.history == 1 else (self.history, *self.shape)
+
+    def latest(self) -> np.ndarray | None:
+        """
+        Returns a read-only view of the most recent sample, or of the `history` most recent samples (oldest first)
+        stacked on a new first axis if `history > 1`. Returns None if no sample has been pushed yet.
+        """
+        if self.slot < 0:
+            return None
+
+        if self.history == 1:
+            view = self.storage[self.slot]
+        else:
+            start = self.slot - self.history + 1
+            if start < 0:
+                start += self.size
+            view = self.storage[start : start + self.history]
+
+        view.flags.writeable = False
+        return view
+
+
+class ObservationAssembler:
+    """
+    Collects the inputs of a Dora node into gym observations.
+
+    The assembler knows which inputs are required to build an observation (`agent_pos` and each camera), and blocks on
+    the node event stream only until all of them have been updated since the previous observation, or until a deadline
+    expires. Events already queued are drained first, so an observation always holds the latest value of each input.
+
+    The values of the required inputs are copied into preallocated ring buffers as they arrive, observations are
+    either read-only views of those buffers or copies of them.
+    """
+
+    def __init__(
+        self,
+        node,
+        joints: list[str] | None = None,
+        cameras: dict[str, tuple[int]] | None = None,
+        history: int = 1,
+        buffer_size: int | None = None,
+        copy: bool = True,
+        num_envs: int | None = None,
+    ):
+        """
+        Args:
+            node: the Dora node used to receive the events from the robot.
+            joints: the joints of the robot, if set `agent_pos` is a required input.
+            cameras: the cameras of the robot and their (height, width, channels) shape, each camera is a required
+            input.
+            history: the number of most recent values of each required input stacked in an observation. If 1, the
+            values are not stacked.
+            buffer_size: the number of slots of each ring buffer, see `RingBuffer`.
+            copy: if True observations are copies of the ring buffers, otherwise read-only views that are overwritten
+            once `buffer_size - history` newer values have been received.
+            num_envs: if set, the inputs of `num_envs` robots are multiplexed on the node, and the inputs of the i-th
+            robot are suffixed by `/i` (e.g. `agent_pos/0`, `cam_high/0`).
+        """
+        self.node = node
+        self.cameras = cameras or {}
+        self.copy = copy
+
+        self.suffixes = (
+            [""] if num_envs is None else [f"/{index}" for index in range(num_envs)]
+        )
+
+        self.buffers = {}
+        for suffix in self.suffixes:
+            if joints:
+                self.buffers["agent_pos" + suffix] = RingBuffer(
+                    (len(joints),), np.float64, history, buffer_size
+                )
+            for camera, hwc_shape in self.cameras.items():
+                self.buffers[camera + suffix] = RingBuffer(
+                    hwc_shape, np.uint8, history, buffer_size
+                )
+
+        self.required = list(self.buffers)
+
+        # Inputs that are not required are stored as they are received
+        self.extras = {}
+        self.received_at = {key: None for key in self.required}
+        self.assembled_at = float("-inf")
+        self.fresh = [False] * len(self.suffixes)
+
+    def handle(self, event) -> bool:
+        """
+        Stores the value of an INPUT event in the observation. Returns False if the event is a timeout of the event
+        stream.
+
+        Raises ConnectionError if the node event stream is closed.
+        """
+        # If event is None, the node event stream is closed and the env should terminate
+        if event is None:
+            raise ConnectionError("Dora Node event stream closed.")
+
+        if event["type"] == "ERROR":
+            return False
+
+        if event["type"] != "INPUT":
+            return True
+
+        event_id = event["id"]
+
+        if event_id in self.buffers:
+            buffer = self.buffers[event_id]
+
+            # Zero-copy view of the Arrow data, copied once into the ring buffer
+            buffer.push(event["value"].to_numpy().reshape(buffer.shape))
+            self.received_at[event_id] = time.perf_counter()
+        else:
+            # Map other inputs into the observation dictionary using the event id as key
+            self.extras[event_id] = event["value"].to_numpy()
+
+        return True
+
+    def observation(self, suffix: str = "") -> dict:
+        """
+        Returns a new observation dictionary holding the latest values of the inputs of the robot identified by
+        `suffix`, the cameras are mapped into the pixels key.
+        """
+        values = {}
+        for key in ["agent_pos"] + list(self.cameras):
+            buffer = self.buffers.get(key + suffix)
+            value = buffer.latest() if buffer is not None else None
+            values[key] = value.copy() if self.copy and value is not None else value
+
+        return {
+            **self.extras,
+            "pixels": {
+                camera: values[camera]
+                for camera in self.cameras
+                if values[camera] is not None
+            },
+            "agent_pos": values["agent_pos"],
+        }
+
+    def batched_observation(self) -> dict:
+        """
+        Returns a new observation dictionary holding the latest values of the inputs of every robot, stacked on a new
+        first axis. Inputs never received are filled with zeros.
+        """
+        observation = {"pixels": {}}
+
+        for key in ["agent_pos"] + list(self.cameras):
+            if key + self.suffixes[0] not in self.buffers:
+                continue
+
+            buffers = [self.buffers[key + suffix] for suffix in self.suffixes]
+            batch = np.zeros(
+                (len(buffers),) + buffers[0].latest_shape(), buffers[0].storage.dtype
+            )
+            for index, buffer in enumerate(buffers):
+                if buffer.slot >= 0:
+                    batch[index] = buffer.latest()
+
+            if key in self.cameras:
+                observation["pixels"][key] = batch
+            else:
+                observation[key] = batch
+
+        return observation
+
+    def drain(self):
+        """
+        Handles every event already queued by the node, without blocking.
+        """
+        while self.handle(self.node.next(timeout=0.0)):
+            pass
+
+    def is_fresh(self, suffix: str = "") -> bool:
+        """
+        Returns True if every required input (of the robot identified by `suffix`) has been updated since the previous
+        observation.
+        """
+        return all(
+            self.received_at[key] is not None
+            and self.received_at[key] > self.assembled_at
+            for key in self.required
+            if key.endswith(suffix)
+        )
+
+    def staleness(self) -> dict[str, float]:
+        """
+        Returns the age in seconds of the last value of every required input (inf if never received).
+        """
+        now = time.perf_counter()
+
+        return {
+            key: (
+                now - self.received_at[key]
+                if self.received_at[key] is not None
+                else np.inf
+            )
+            for key in self.required
+        }
+
+    def assemble(self, deadline: float) -> bool:
+        """
+        Receives events until every required input has been updated since the previous observation, or until
+        `deadline` (a `time.perf_counter()` value) is reached.
+
+        Returns True if a fresh observation was assembled, False if the deadline expired first, in which case the
+        observation holds the latest known values.
+
+        Raises ConnectionError if the node event stream is closed.
+        """
+        self.drain()
+
+        fresh = self.is_fresh()
+        while not fresh:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+
+            self.handle(self.node.next(timeout=remaining))
+            fresh = self.is_fresh()
+
+        # Inputs of the next frame may have been queued while waiting for the last one
+        self.drain()
+
+        # Freshness of each robot, when the inputs of several robots are multiplexed
+        self.fresh = [self.is_fresh(suffix) for suffix in self.suffixes]
+        self.assembled_at = time.perf_counter()
+
+        return fresh
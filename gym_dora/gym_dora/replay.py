@@ -0,0 +1,131 @@
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def load_recording(path: str, episode: int, topic: str = "action"):
+    """
+    Loads the episode of a raw dora-record recording into NumPy arrays.
+
+    The episode of each row of `<path>/<topic>.parquet` is the last value of `<path>/episode_index.parquet` recorded
+    before it (an as-of join), -1 marking the end of an episode.
+
+    Returns the timestamps of the rows of the episode in seconds from its first row, and the (n_rows, n_values) matrix
+    of their values.
+    """
+    recording = pq.read_table(
+        f"{path}/{topic}.parquet", columns=["timestamp_utc", topic]
+    )
+    episodes = pq.read_table(
+        f"{path}/episode_index.parquet", columns=["timestamp_utc", "episode_index"]
+    )
+
+    def seconds(table: pa.Table) -> np.ndarray:
+        timestamps = table["timestamp_utc"].to_numpy().astype("datetime64[ns]")
+        return timestamps.astype(np.int64) / 1e9
+
+    def flatten(column: pa.ChunkedArray) -> np.ndarray:
+        # dora-record stores each value as a list, flatten them into one contiguous buffer
+        column = column.combine_chunks()
+        if pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+            return column.flatten().to_numpy().reshape(len(column), -1)
+        return column.to_numpy().reshape(len(column), -1)
+
+    recording = recording.sort_by("timestamp_utc")
+    episodes = episodes.sort_by("timestamp_utc")
+
+    timestamps = seconds(recording)
+    episode_timestamps = seconds(episodes)
+    episode_indices = flatten(episodes["episode_index"])[:, 0]
+
+    # Backward as-of join of the rows on the episode index
+    position = np.searchsorted(episode_timestamps, timestamps, side="right") - 1
+    row_episodes = np.where(position >= 0, episode_indices[position], -1)
+
+    mask = row_episodes == episode
+    if not mask.any():
+        raise ValueError(f"Episode {episode} not found in {path}.")
+
+    timestamps = timestamps[mask]
+    values = np.ascontiguousarray(flatten(recording[topic]).astype(np.float32)[mask])
+
+    return timestamps - timestamps[0], values
+
+
+class ReplayPolicy:
+    """
+    Replays the actions of an episode of a raw dora-record recording, as a policy of a gym_dora environment.
+
+    The episode is converted once to a timestamp array and an action matrix. Each action is returned at an absolute
+    deadline `origin + timestamp / speed` on the monotonic clock, so the time spent stepping the environment between
+    two actions does not accumulate as drift. The lateness of each action relative to its deadline is recorded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        episode: int = 0,
+        speed: float | None = 1.0,
+        topic: str = "action",
+    ):
+        """
+        Args:
+            path: the directory of the recording, holding `<topic>.parquet` and `episode_index.parquet`.
+            episode: the episode to replay.
+            speed: the replay speed multiplier. If None, actions are returned without waiting, faster than real time,
+            e.g. for offline regression tests.
+            topic: the recorded topic replayed as actions.
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError("The replay speed must be positive.")
+
+        self.timestamps, self.actions = load_recording(str(path), episode, topic)
+        self.speed = speed
+
+        self.index = 0
+        self.origin = None
+        self.lateness = np.zeros(len(self.timestamps))
+
+    def select_action(self, obs):
+        """
+        Waits for the deadline of the next action and returns it, and whether it is the last action of the episode.
+        """
+        del obs
+
+        index = min(self.index, len(self.actions) - 1)
+
+        if self.speed is not None:
+            now = time.perf_counter()
+
+            if self.origin is None:
+                self.origin = now - self.timestamps[0] / self.speed
+
+            deadline = self.origin + self.timestamps[index] / self.speed
+            if deadline > now:
+                time.sleep(deadline - now)
+
+            if self.index < len(self.actions):
+                self.lateness[index] = time.perf_counter() - deadline
+
+        self.index += 1
+        finished = self.index >= len(self.actions)
+
+        return self.actions[index], finished
+
+    def statistics(self) -> dict[str, float]:
+        """
+        Returns the lateness statistics in milliseconds of the actions returned so far, empty if the replay is not
+        paced.
+        """
+        lateness = self.lateness[: min(self.index, len(self.lateness))] * 1000
+        if self.speed is None or len(lateness) == 0:
+            return {}
+
+        return {
+            "mean": float(np.mean(lateness)),
+            "p50": float(np.percentile(lateness, 50)),
+            "p99": float(np.percentile(lateness, 99)),
+            "max": float(np.max(lateness)),
+        }
@@ -0,0 +1,264 @@
+"""
+Startup benchmark: this script measures the cold-start time of every node in the node-hub, so that regressions on heavy
+imports (torch, lerobot, cv2, mujoco...) can be spotted before they delay a whole dataflow.
+
+The `main` of each node runs in a fresh interpreter with `python -X importtime`, against a stub of the dora API that
+records when the `Node` is created and when the node asks for its first event, then exits. The startup path is
+measured up to that first event, including the libraries imported inside `main` after the `Node` is created. The
+wall times are measured over several runs, and the most expensive libraries and the `PROFILE_STARTUP` breakdown of the
+node are reported.
+
+A node that needs its hardware (a serial port, a robot) fails after the `Node` is created, only its time to the `Node`
+is reported. The nodes run in a temporary directory, so the files they write are not left in the repository: the paths
+given with `--env` must be absolute.
+
+Usage:
+    python node-hub/benchmark_startup.py --runs 5
+    python node-hub/benchmark_startup.py --env CONFIG=$PWD/robots/alexk-lcr/configs/follower.left.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from pathlib import Path
+
+NODE_HUB = Path(__file__).resolve().parent
+
+# The environment a node needs to reach its first event without hardware
+NODE_ENV = {
+    "video_encoder.main": {"VIDEO_NAME": "startup_benchmark", "FPS": "30"},
+    "lerobot_dashboard.main": {"SDL_VIDEODRIVER": "dummy"},
+    "mujoco_client.main": {
+        "SCENE": str(
+            NODE_HUB.parent / "robots/alexk-lcr/assets/simulation/reach_cube.xml"
+        ),
+        "HEADLESS": "1",
+    },
+}
+
+# Replaces the dora API in the benchmarked interpreter, the times are written as JSON lines to STARTUP_REPORT
+STUB_DORA = """
+import os
+import json
+import time
+
+
+def report(name):
+    with open(os.environ["STARTUP_REPORT"], "a") as file:
+        file.write(json.dumps({name: time.time()}) + "\\n")
+
+
+class Node:
+    def __init__(self, *args, **kwargs):
+        report("node")
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next()
+
+    def next(self, timeout=None):
+        report("first_event")
+        os._exit(0)
+
+    def send_output(self, *args, **kwargs):
+        pass
+
+    def dataflow_id(self):
+        return "startup_benchmark"
+"""
+
+
+def discover_nodes(node_hub: Path) -> list[tuple[Path, str]]:
+    """
+    Lists every node of the hub as a tuple (package directory, module to import), e.g.
+    (node-hub/opencv-video-capture, "opencv_video_capture.main").
+    """
+    nodes = []
+
+    for package in sorted(node_hub.iterdir()):
+        if not (package / "pyproject.toml").exists():
+            continue
+
+        for main in sorted(package.glob("*/main.py")):
+            nodes.append((package, f"{main.parent.name}.main"))
+
+    return nodes
+
+
+def parse_importtime(stderr: str, top: int) -> list[tuple[str, float]]:
+    """
+    Parses the output of `python -X importtime` and returns the `top` most expensive libraries, with the time spent
+    importing all their modules in milliseconds.
+    """
+    libraries = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_time, _, name = line[len("import time:") :].split("|")
+        library = name.strip().split(".")[0]
+
+        libraries[library] = libraries.get(library, 0) + int(self_time) / 1000
+
+    return sorted(libraries.items(), key=lambda x: x[1], reverse=True)[:top]
+
+
+def read_report(path: Path) -> dict[str, float]:
+    times = {}
+    if path.exists():
+        for line in path.read_text().splitlines():
+            times.update(json.loads(line))
+
+        path.unlink()
+
+    return times
+
+
+def benchmark_node(
+    package: Path, module: str, runs: int, top: int, stub: Path, env: dict
+) -> dict:
+    env = {**os.environ, **NODE_ENV.get(module, {}), **env}
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(stub), str(package), env.get("PYTHONPATH", "")]
+    )
+    env["STARTUP_REPORT"] = str(stub / "report.jsonl")
+    env["PROFILE_STARTUP"] = "1"
+
+    node_times = []
+    ready_times = []
+    process = None
+
+    for _ in range(runs):
+        start = time.time()
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                f"from {module} import main; main()",
+            ],
+            env=env,
+            cwd=stub,
+            capture_output=True,
+            text=True,
+        )
+        times = read_report(stub / "report.jsonl")
+
+        if "node" in times:
+            node_times.append((times["node"] - start) * 1000)
+        if "first_event" in times:
+            ready_times.append((times["first_event"] - start) * 1000)
+
+    result = {
+        "module": module,
+        "node_ms": statistics.median(node_times) if node_times else None,
+        "ready_ms": statistics.median(ready_times) if ready_times else None,
+        "slowest_imports": parse_importtime(process.stderr, top),
+        "profile": [
+            line for line in process.stdout.splitlines() if "startup profile" in line
+        ],
+    }
+
+    if not ready_times:
+        errors = [
+            line
+            for line in process.stderr.splitlines()
+            if not line.startswith("import time:")
+        ]
+        result["error"] = errors[-1] if errors else "exited before its first event"
+
+    return result
+
+
+def parse_env(variables: list[str]) -> dict[str, str]:
+    env = {}
+    for variable in variables:
+        name, _, value = variable.partition("=")
+        env[name] = value
+
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Startup benchmark: measures the cold-start time of every node in the node-hub."
+    )
+
+    parser.add_argument(
+        "--runs",
+        type=int,
+        required=False,
+        help="The number of fresh interpreters used to measure each node.",
+        default=5,
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        required=False,
+        help="The number of most expensive libraries to report for each node.",
+        default=3,
+    )
+    parser.add_argument(
+        "--env",
+        type=str,
+        action="append",
+        required=False,
+        help="An environment variable NAME=VALUE given to every node, e.g. the CONFIG of a simulated robot.",
+        default=[],
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=False,
+        help="An optional path to a JSON file where the report is saved.",
+        default=None,
+    )
+
+    args = parser.parse_args()
+
+    env = parse_env(args.env)
+
+    print(f"{'module':<40}{'to Node (ms)':>14}{'to first event (ms)':>22}")
+
+    report = []
+
+    with tempfile.TemporaryDirectory() as stub:
+        stub = Path(stub)
+        (stub / "dora.py").write_text(STUB_DORA)
+
+        for package, module in discover_nodes(NODE_HUB):
+            result = benchmark_node(package, module, args.runs, args.top, stub, env)
+            report.append(result)
+
+            node_ms = "-" if result["node_ms"] is None else f"{result['node_ms']:.1f}"
+            ready_ms = (
+                "-" if result["ready_ms"] is None else f"{result['ready_ms']:.1f}"
+            )
+            print(f"{module:<40}{node_ms:>14}{ready_ms:>22}")
+
+            if "error" in result:
+                print(f"    failed: {result['error']}")
+
+            for library, duration in result["slowest_imports"]:
+                print(f"    {library:<36}{duration:>14.1f}")
+
+            for line in result["profile"]:
+                print(f"    {line}")
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
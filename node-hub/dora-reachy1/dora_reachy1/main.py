@@ -1,5 +1,3 @@
-from reachy_sdk import ReachySDK
-from reachy_sdk.trajectory import goto, goto_async
 import os
 from dora import Node
 import numpy as np
@@ -46,9 +44,11 @@ def sad_antennas(reachy):
 
 
 def main():
-
     node = Node()
 
+    from reachy_sdk import ReachySDK
+    from reachy_sdk.trajectory import goto
+
     ROBOT_IP = os.getenv("ROBOT_IP", "10.42.0.24")
     MAX_R_ARM_POSE = [0.35, -0.46, -0.42]
 
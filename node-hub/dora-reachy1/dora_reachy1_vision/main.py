@@ -1,5 +1,3 @@
-from reachy_sdk import ReachySDK
-from reachy_sdk.trajectory import goto, goto_async
 import os
 from dora import Node
 import numpy as np
@@ -7,9 +5,10 @@ import pyarrow as pa
 
 
 def main():
-
     node = Node()
 
+    from reachy_sdk import ReachySDK
+
     ROBOT_IP = os.getenv("ROBOT_IP", "10.42.0.24")
     CAMERA = os.getenv("CAMERA", "right")
 
@@ -1,8 +1,10 @@
 import enum
+import os
+import time
 
 import pyarrow as pa
 
-from typing import Union
+from typing import Optional, Union
 
 from dynamixel_sdk import (
     PacketHandler,
@@ -10,6 +12,8 @@ from dynamixel_sdk import (
     COMM_SUCCESS,
     GroupSyncRead,
     GroupSyncWrite,
+    BROADCAST_ID,
+    INST_PING,
 )
 from dynamixel_sdk import DXL_HIBYTE, DXL_HIWORD, DXL_LOBYTE, DXL_LOWORD
 
@@ -17,6 +21,82 @@ PROTOCOL_VERSION = 2.0
 BAUD_RATE = 1_000_000
 TIMEOUT_MS = 1000
 
+# Offsets of the ID and of the first data byte in a Protocol 2.0 status packet
+STATUS_PACKET_ID = 4
+STATUS_PACKET_DATA = 9
+
+# Baud rates supported by the X series, scanned in this order
+BAUD_RATES = [1_000_000, 57_600, 2_000_000, 3_000_000, 4_000_000, 115_200, 9_600]
+
+# Values of the Baud_Rate register of the X series
+BAUD_RATE_VALUES = {
+    9_600: 0,
+    57_600: 1,
+    115_200: 2,
+    1_000_000: 3,
+    2_000_000: 4,
+    3_000_000: 5,
+    4_000_000: 6,
+}
+
+# The answers to a broadcast ping are spaced by up to 3 ms per ID
+PING_DELAY_MS = 3.0
+
+# FTDI-based USB-serial adapters (e.g. U2D2, USB2Dynamixel) hold the bytes received until their latency timer expires,
+# 16 ms by default, which adds up to 16 ms to each answer. The SDK timeouts assume this default.
+LATENCY_TIMER_MS = 16
+LOW_LATENCY_TIMER_MS = 1
+SYSFS = "/sys"
+
+MODEL_NUMBERS = {
+    1020: "xm430-w350",
+    1060: "xl430-w250",
+    1120: "xm540-w270",
+    1190: "xl330-m077",
+    1200: "xl330-m288",
+}
+
+
+def latency_timer_path(port: str, sysfs: str = SYSFS) -> Optional[str]:
+    """
+    Returns the sysfs file of the latency timer of the USB-serial adapter of `port` (e.g. /dev/ttyUSB0, or one of its
+    /dev/serial/by-id links), None if the adapter has no latency timer.
+    """
+    device = os.path.basename(os.path.realpath(port))
+    path = os.path.join(sysfs, "bus", "usb-serial", "devices", device, "latency_timer")
+
+    return path if os.path.exists(path) else None
+
+
+def read_latency_timer(port: str, sysfs: str = SYSFS) -> Optional[int]:
+    """
+    Returns the latency timer of the USB-serial adapter of `port` in ms, None if the adapter has no latency timer.
+    """
+    path = latency_timer_path(port, sysfs)
+    if path is None:
+        return None
+
+    with open(path) as file:
+        return int(file.read().strip())
+
+
+def write_latency_timer(port: str, latency_timer_ms: int, sysfs: str = SYSFS) -> bool:
+    """
+    Sets the latency timer of the USB-serial adapter of `port`, returns False if the adapter has no latency timer or the
+    file is not writable (it requires root, or a udev rule).
+    """
+    path = latency_timer_path(port, sysfs)
+    if path is None:
+        return False
+
+    try:
+        with open(path, "w") as file:
+            file.write(str(latency_timer_ms))
+    except OSError:
+        return False
+
+    return True
+
 
 def wrap_joints_and_values(
     joints: Union[list[str], pa.Array],
@@ -153,7 +233,30 @@ MODEL_CONTROL_TABLE = {
 
 class DynamixelBus:
 
-    def __init__(self, port: str, description: dict[str, (int, str)]):
+    def __init__(
+        self,
+        port: str,
+        description: dict[str, (int, str)],
+        baud_rate: int = BAUD_RATE,
+        read_retries: int = 1,
+        read_budget_ms: Optional[float] = None,
+        low_latency: bool = True,
+        sysfs: str = SYSFS,
+    ):
+        """
+        Args:
+            port: the serial port to connect to the Dynamixel bus
+            description: a dictionary containing the description of the motors connected to the bus. The keys are the
+            motor names and the values are tuples containing the motor id and the motor model.
+            baud_rate: the baud rate of the bus.
+            read_retries: the number of times the motors that did not answer a read are read again.
+            read_budget_ms: the maximum time a read waits for the answers of the motors, retries included. None waits
+            for the timeout of each sync read.
+            low_latency: set the latency timer of the USB-serial adapter to 1 ms, and enable ASYNC_LOW_LATENCY on the
+            port.
+            sysfs: the root of sysfs, where the latency timer of the USB-serial adapter is found.
+        """
+
         self.port = port
         self.descriptions = description
         self.motor_ctrl = {}
@@ -177,15 +280,134 @@ class DynamixelBus:
         if not self.port_handler.openPort():
             raise OSError(f"Failed to open port {self.port}")
 
-        self.port_handler.setBaudRate(BAUD_RATE)
+        self.low_latency = low_latency
+        self.sysfs = sysfs
+
+        if not self.set_port_baud_rate(baud_rate):
+            raise OSError(
+                f"Failed to set the baud rate {baud_rate} on port {self.port}"
+            )
         self.port_handler.setPacketTimeoutMillis(TIMEOUT_MS)
 
+        self.latency_timer_ms = self.configure_latency_timer()
+
         self.group_readers = {}
         self.group_writers = {}
 
+        self.read_retries = read_retries
+        self.read_budget_ms = read_budget_ms
+
+        # Per-motor counters of the answers missed by a sync read, and of the reads that returned a null value
+        self.missed_answers = {motor_name: 0 for motor_name in description}
+        self.stale_reads = {motor_name: 0 for motor_name in description}
+
     def close(self):
         self.port_handler.closePort()
 
+    def set_port_baud_rate(self, baud_rate: int) -> bool:
+        """
+        Sets the baud rate of the port, which reopens it, and enables ASYNC_LOW_LATENCY on it if `low_latency`.
+        """
+        if not self.port_handler.setBaudRate(baud_rate):
+            return False
+
+        if self.low_latency:
+            # Linux only, and not supported by all the drivers (e.g. pseudo-terminals)
+            set_low_latency_mode = getattr(
+                self.port_handler.ser, "set_low_latency_mode", None
+            )
+
+            if set_low_latency_mode is not None:
+                try:
+                    set_low_latency_mode(True)
+                except ValueError:
+                    pass
+
+        return True
+
+    def configure_latency_timer(self) -> int:
+        """
+        Reads the latency timer of the USB-serial adapter, sets it to 1 ms if `low_latency`, and warns if it stays
+        higher. Returns the latency timer in ms, the default of the FTDI adapters if the adapter has none.
+        """
+        latency_timer_ms = read_latency_timer(self.port, self.sysfs)
+        if latency_timer_ms is None:
+            return LATENCY_TIMER_MS
+
+        if self.low_latency and latency_timer_ms > LOW_LATENCY_TIMER_MS:
+            if write_latency_timer(self.port, LOW_LATENCY_TIMER_MS, self.sysfs):
+                latency_timer_ms = read_latency_timer(self.port, self.sysfs)
+
+        if latency_timer_ms > LOW_LATENCY_TIMER_MS:
+            print(
+                f"WARNING: the latency timer of the USB-serial adapter of {self.port} is {latency_timer_ms} ms, each "
+                f"answer of the motors is delayed by up to {latency_timer_ms} ms. Set it to {LOW_LATENCY_TIMER_MS} ms "
+                f"as root with `echo {LOW_LATENCY_TIMER_MS} > {latency_timer_path(self.port, self.sysfs)}`, or with "
+                f"a udev rule.",
+                flush=True,
+            )
+
+        return latency_timer_ms
+
+    def ping(self, motor_ids: list[int]) -> dict[int, int]:
+        """
+        Pings the motors with a broadcast ping, and returns the model number of each motor that answered, by ID. The
+        answers are only waited for up to the highest ID of `motor_ids`.
+        """
+        # Header, ID, length, instruction and CRC, the header and the CRC are filled by the packet handler
+        packet = [0, 0, 0, 0, BROADCAST_ID, 3, 0, INST_PING, 0, 0]
+
+        comm = self.packet_handler.txPacket(self.port_handler, packet)
+        if comm != COMM_SUCCESS:
+            raise ConnectionError(
+                f"Ping failed due to communication error on port {self.port}: "
+                f"{self.packet_handler.getTxRxResult(comm)}"
+            )
+
+        # Status packets of a ping are 14 bytes long
+        self.port_handler.setPacketTimeoutMillis(
+            (max(motor_ids) + 1)
+            * (PING_DELAY_MS + 14 * self.port_handler.tx_time_per_byte)
+            + self.latency_timer_ms
+        )
+
+        model_numbers = {}
+        while True:
+            packet, comm = self.packet_handler.rxPacket(self.port_handler)
+
+            if comm == COMM_SUCCESS:
+                idx = packet[STATUS_PACKET_ID]
+                if idx in motor_ids:
+                    model_numbers[idx] = packet[STATUS_PACKET_DATA] | (
+                        packet[STATUS_PACKET_DATA + 1] << 8
+                    )
+            elif self.port_handler.isPacketTimeout():
+                break
+
+        return model_numbers
+
+    def scan(
+        self, motor_ids: list[int], baud_rates: Optional[list[int]] = None
+    ) -> dict[int, dict[int, int]]:
+        """
+        Pings the motors at each baud rate of `baud_rates` (all the supported baud rates by default), and returns the
+        model numbers of the motors found, by baud rate and ID. The bus is left at the baud rate it was opened with.
+        """
+        baud_rate = self.port_handler.getBaudRate()
+
+        found = {}
+        for scanned_baud_rate in baud_rates or BAUD_RATES:
+            if not self.set_port_baud_rate(scanned_baud_rate):
+                continue
+
+            model_numbers = self.ping(motor_ids)
+            if model_numbers:
+                found[scanned_baud_rate] = model_numbers
+
+        self.set_port_baud_rate(baud_rate)
+
+        return found
+
     def write(self, data_name: str, data: pa.StructArray):
         motor_ids = [
             self.motor_ctrl[motor_name.as_py()]["id"]
@@ -205,9 +427,7 @@ class DynamixelBus:
         packet_address = self.motor_ctrl[first_motor_name][data_name]["addr"]
         packet_bytes_size = self.motor_ctrl[first_motor_name][data_name]["bytes_size"]
 
-        init_group = data_name not in self.group_readers
-
-        if init_group:
+        if group_key not in self.group_writers:
             self.group_writers[group_key] = GroupSyncWrite(
                 self.port_handler,
                 self.packet_handler,
@@ -215,9 +435,13 @@ class DynamixelBus:
                 packet_bytes_size,
             )
 
+        writer = self.group_writers[group_key]
+
         for idx, value in zip(motor_ids, values):
             value = value.as_py()
             if value is None:
+                # Motors without a value are left out of the packet
+                writer.removeParam(idx)
                 continue
 
             if packet_bytes_size == 1:
@@ -242,23 +466,29 @@ class DynamixelBus:
                     f"is provided instead."
                 )
 
-            if init_group:
-                self.group_writers[group_key].addParam(idx, data)
-            else:
-                self.group_writers[group_key].changeParam(idx, data)
+            if not writer.changeParam(idx, data):
+                writer.addParam(idx, data)
+
+        if not writer.data_dict:
+            return
 
-        comm = self.group_writers[group_key].txPacket()
+        comm = writer.txPacket()
         if comm != COMM_SUCCESS:
             raise ConnectionError(
                 f"Write failed due to communication error on port {self.port} for group_key {group_key}: "
                 f"{self.packet_handler.getTxRxResult(comm)}"
             )
 
-    def read(self, data_name: str, motor_names: pa.Array) -> pa.StructArray:
-        motor_ids = [
-            self.motor_ctrl[motor_name.as_py()]["id"] for motor_name in motor_names
-        ]
-
+    def sync_read(
+        self,
+        data_name: str,
+        motor_ids: list[int],
+        timeout_ms: Optional[float] = None,
+    ) -> dict[int, int]:
+        """
+        Sends a sync read of `data_name` to the motors, and returns the values of the motors that answered before the
+        timeout of the sync read, or `timeout_ms` if it is shorter.
+        """
         group_key = f"{data_name}_" + "_".join([str(idx) for idx in motor_ids])
 
         first_motor_name = list(self.motor_ctrl.keys())[0]
@@ -266,7 +496,7 @@ class DynamixelBus:
         packet_address = self.motor_ctrl[first_motor_name][data_name]["addr"]
         packet_bytes_size = self.motor_ctrl[first_motor_name][data_name]["bytes_size"]
 
-        if data_name not in self.group_readers:
+        if group_key not in self.group_readers:
             self.group_readers[group_key] = GroupSyncRead(
                 self.port_handler,
                 self.packet_handler,
@@ -277,25 +507,168 @@ class DynamixelBus:
             for idx in motor_ids:
                 self.group_readers[group_key].addParam(idx)
 
-        comm = self.group_readers[group_key].txRxPacket()
+        comm = self.group_readers[group_key].txPacket()
         if comm != COMM_SUCCESS:
             raise ConnectionError(
                 f"Read failed due to communication error on port {self.port} for group_key {group_key}: "
                 f"{self.packet_handler.getTxRxResult(comm)}"
             )
 
-        values = pa.array(
-            [
-                self.group_readers[group_key].getData(
-                    idx, packet_address, packet_bytes_size
+        # The timeout of the SDK assumes the default latency timer of the adapter
+        packet_timeout = self.port_handler.packet_timeout - 2 * (
+            LATENCY_TIMER_MS - self.latency_timer_ms
+        )
+        if timeout_ms is not None:
+            packet_timeout = min(packet_timeout, timeout_ms)
+
+        self.port_handler.setPacketTimeoutMillis(packet_timeout)
+
+        # The answers are collected by ID, so a motor that does not answer does not discard the answers of the
+        # following motors
+        values = {}
+        while len(values) < len(motor_ids):
+            packet, comm = self.packet_handler.rxPacket(self.port_handler)
+
+            if comm == COMM_SUCCESS:
+                idx = packet[STATUS_PACKET_ID]
+                if idx in motor_ids:
+                    values[idx] = int.from_bytes(
+                        bytes(
+                            packet[
+                                STATUS_PACKET_DATA : STATUS_PACKET_DATA
+                                + packet_bytes_size
+                            ]
+                        ),
+                        "little",
+                    )
+            elif self.port_handler.isPacketTimeout():
+                break
+
+        return values
+
+    def read(self, data_name: str, motor_names: pa.Array) -> pa.StructArray:
+        """
+        Reads `data_name` of the motors. The motors that did not answer are read again, at most `read_retries` times
+        and within `read_budget_ms`, and the values of the motors that still did not answer are null.
+
+        :raises ConnectionError: If no motor answered.
+        """
+        start = time.perf_counter()
+
+        names = motor_names.to_pylist()
+        motor_ids = [self.motor_ctrl[motor_name]["id"] for motor_name in names]
+
+        values = {}
+        missing = motor_ids
+        for attempt in range(self.read_retries + 1):
+            timeout_ms = None
+            if self.read_budget_ms is not None:
+                remaining_ms = (
+                    self.read_budget_ms - (time.perf_counter() - start) * 1000
                 )
-                for idx in motor_ids
+                if attempt > 0 and remaining_ms <= 0:
+                    break
+
+                # A motor that does not answer is waited for until the timeout, the budget left is shared with the
+                # retries
+                timeout_ms = remaining_ms / (self.read_retries + 1 - attempt)
+
+            values.update(self.sync_read(data_name, missing, timeout_ms))
+            missing = [idx for idx in missing if idx not in values]
+
+            for motor_name, idx in zip(names, motor_ids):
+                if idx in missing:
+                    self.missed_answers[motor_name] += 1
+
+            if not missing:
+                break
+
+        if not values:
+            raise ConnectionError(
+                f"Read failed on port {self.port}: no answer of the motors {motor_ids} for {data_name}"
+            )
+
+        for motor_name, idx in zip(names, motor_ids):
+            if idx not in values:
+                self.stale_reads[motor_name] += 1
+
+        values = pa.array([values.get(idx) for idx in motor_ids], type=pa.uint32())
+        values = values.from_buffers(pa.int32(), len(values), values.buffers())
+
+        # The motors that did not answer keep a null value, `wrap_joints_and_values` would drop them
+        return pa.StructArray.from_arrays(
+            arrays=[motor_names, values], names=["joints", "values"]
+        )
+
+    def read_errors(self, motor_names: pa.Array) -> pa.StructArray:
+        """
+        Returns the per-motor error counters: `missed`, the answers missed by a sync read, retries included, and
+        `stale`, the reads that returned a null value.
+        """
+        names = motor_names.to_pylist()
+
+        return pa.StructArray.from_arrays(
+            arrays=[
+                motor_names,
+                pa.array(
+                    [self.missed_answers[motor_name] for motor_name in names],
+                    type=pa.uint32(),
+                ),
+                pa.array(
+                    [self.stale_reads[motor_name] for motor_name in names],
+                    type=pa.uint32(),
+                ),
             ],
-            type=pa.uint32(),
+            names=["joints", "missed", "stale"],
         )
-        values = values.from_buffers(pa.int32(), len(values), values.buffers())
 
-        return wrap_joints_and_values(motor_names, values)
+    def supports_baud_rate(self, baud_rate: int) -> bool:
+        """
+        Checks that the port can be set to a baud rate, by setting it and back, without writing to the motors.
+        """
+        if self.port_handler.getCFlagBaud(baud_rate) <= 0:
+            return False
+
+        baud_rate_before = self.port_handler.getBaudRate()
+
+        try:
+            supported = self.set_port_baud_rate(baud_rate)
+        except OSError:
+            supported = False
+
+        self.set_port_baud_rate(baud_rate_before)
+
+        return supported
+
+    def set_baud_rate(self, baud_rate: int):
+        """
+        Sets the baud rate of all the motors of the bus, then of the port. The motors switch to the new baud rate as
+        soon as they received the instruction, and the Baud_Rate register is only written while their torque is
+        disabled.
+        """
+        # The port is checked first, the motors would otherwise be left at a baud rate the port can not follow
+        if not self.supports_baud_rate(baud_rate):
+            raise OSError(
+                f"The baud rate {baud_rate} is not supported by port {self.port}"
+            )
+
+        joints = pa.array(list(self.motor_ctrl.keys()), pa.string())
+
+        self.write(
+            "Baud_Rate",
+            wrap_joints_and_values(
+                joints,
+                pa.array([BAUD_RATE_VALUES[baud_rate]] * len(joints), pa.uint32()),
+            ),
+        )
+
+        # Let the instruction leave the adapter before reopening the port at the new baud rate
+        time.sleep(0.01)
+
+        if not self.set_port_baud_rate(baud_rate):
+            raise OSError(
+                f"Failed to set the baud rate {baud_rate} on port {self.port}"
+            )
 
     def write_torque_enable(self, torque_mode: pa.StructArray):
         self.write("Torque_Enable", torque_mode)
@@ -326,3 +699,15 @@ class DynamixelBus:
 
     def write_position_d_gain(self, position_d_gain: pa.StructArray):
         self.write("Position_D_Gain", position_d_gain)
+
+    def read_return_delay_time(self, motor_names: pa.Array) -> pa.StructArray:
+        return self.read("Return_Delay_Time", motor_names)
+
+    def write_return_delay_time(self, return_delay_time: pa.StructArray):
+        self.write("Return_Delay_Time", return_delay_time)
+
+    def read_status_return_level(self, motor_names: pa.Array) -> pa.StructArray:
+        return self.read("Status_Return_Level", motor_names)
+
+    def write_status_return_level(self, status_return_level: pa.StructArray):
+        self.write("Status_Return_Level", status_return_level)
@@ -12,7 +12,7 @@ import pyarrow as pa
 
 from dora import Node
 
-from .bus import DynamixelBus, TorqueMode, wrap_joints_and_values
+from .bus import BAUD_RATE, DynamixelBus, TorqueMode, wrap_joints_and_values
 
 
 class Client:
@@ -20,16 +20,28 @@ class Client:
     def __init__(self, config: dict[str, any]):
         self.config = config
 
+        # The node is created before configuring the motors, so the dataflow can start while the bus is set up
+        self.node = Node(config["name"])
+
         description = {}
         for i in range(len(config["ids"])):
             description[config["joints"][i]] = (config["ids"][i], config["models"][i])
 
         self.config["joints"] = pa.array(config["joints"], pa.string())
-        self.bus = DynamixelBus(config["port"], description)
+
+        self.bus = DynamixelBus(
+            config["port"],
+            description,
+            baud_rate=config["baud_rate"],
+            read_retries=config["read_retries"],
+            read_budget_ms=config["read_budget_ms"],
+            low_latency=config["low_latency"],
+        )
 
         # Set client configuration values, raise errors if the values are not set to indicate that the motors are not
         # configured correctly
 
+        self.bus.write_status_return_level(self.config["status_return_level"])
         self.bus.write_torque_enable(self.config["torque"])
         self.bus.write_goal_current(self.config["goal_current"])
 
@@ -42,8 +54,6 @@ class Client:
         time.sleep(0.1)
         self.bus.write_position_p_gain(self.config["P"])
 
-        self.node = Node(config["name"])
-
     def run(self):
         for event in self.node:
             event_type = event["type"]
@@ -57,6 +67,8 @@ class Client:
                     self.pull_velocity(self.node, event["metadata"])
                 elif event_id == "pull_current":
                     self.pull_current(self.node, event["metadata"])
+                elif event_id == "pull_errors":
+                    self.pull_errors(self.node, event["metadata"])
                 elif event_id == "write_goal_position":
                     self.write_goal_position(event["value"])
                 elif event_id == "write_goal_current":
@@ -106,6 +118,13 @@ class Client:
         except ConnectionError as e:
             print("Error reading current:", e)
 
+    def pull_errors(self, node, metadata):
+        node.send_output(
+            "errors",
+            self.bus.read_errors(self.config["joints"]),
+            metadata,
+        )
+
     def write_goal_position(self, goal_position: pa.StructArray):
         try:
             self.bus.write_goal_position(goal_position)
@@ -146,6 +165,27 @@ def main():
         help="The configuration of the dynamixel motors.",
         default=None,
     )
+    parser.add_argument(
+        "--read-retries",
+        type=int,
+        required=False,
+        help="The number of times the motors that did not answer a read are read again.",
+        default=1,
+    )
+    parser.add_argument(
+        "--read-budget-ms",
+        type=float,
+        required=False,
+        help="The maximum time a read waits for the answers of the motors, retries included.",
+        default=None,
+    )
+    parser.add_argument(
+        "--no-low-latency",
+        action="store_true",
+        required=False,
+        help="Keep the latency timer of the USB-serial adapter, instead of setting it to 1 ms.",
+        default=False,
+    )
 
     args = parser.parse_args()
 
@@ -168,8 +208,26 @@ def main():
     with open(os.environ.get("CONFIG") if args.config is None else args.config) as file:
         config = json.load(file)
 
+    read_retries = int(os.getenv("READ_RETRIES", args.read_retries))
+
+    read_budget_ms = os.getenv("READ_BUDGET_MS", args.read_budget_ms)
+    if read_budget_ms is not None:
+        read_budget_ms = float(read_budget_ms)
+
+    low_latency = not args.no_low_latency and os.getenv("LOW_LATENCY", "1").lower() in [
+        "1",
+        "true",
+    ]
+
     joints = config.keys()
 
+    # The baud rate tuned by the configuration tool is shared by all the motors of the bus
+    baud_rates = {config[joint].get("baud_rate", BAUD_RATE) for joint in joints}
+    if len(baud_rates) != 1:
+        raise ValueError(
+            f"The motors of the configuration have different baud rates: {baud_rates}"
+        )
+
     # Create configuration
     bus = {
         "name": args.name,
@@ -177,6 +235,10 @@ def main():
         "ids": [config[joint]["id"] for joint in joints],
         "joints": list(config.keys()),
         "models": [config[joint]["model"] for joint in joints],
+        "read_retries": read_retries,
+        "read_budget_ms": read_budget_ms,
+        "low_latency": low_latency,
+        "baud_rate": baud_rates.pop(),
         "torque": wrap_joints_and_values(
             pa.array(config.keys(), pa.string()),
             pa.array(
@@ -191,6 +253,13 @@ def main():
                 type=pa.uint32(),
             ),
         ),
+        "status_return_level": wrap_joints_and_values(
+            pa.array(config.keys(), pa.string()),
+            pa.array(
+                [config[joint].get("status_return_level") for joint in joints],
+                type=pa.uint32(),
+            ),
+        ),
         "goal_current": wrap_joints_and_values(
             pa.array(config.keys(), pa.string()),
             pa.array(
@@ -214,6 +283,7 @@ def main():
     print("Dynamixel Client Configuration: ", bus, flush=True)
 
     client = Client(bus)
+
     client.run()
     client.close()
 
@@ -4,6 +4,7 @@ velocities, currents, and set goal positions and currents.
 """
 
 import os
+import time
 import argparse
 import json
 
@@ -19,20 +20,28 @@ class Client:
     def __init__(self, config: dict[str, any]):
         self.config = config
 
+        # The node is created before configuring the motors, so the dataflow can start while the bus is set up
+        self.node = Node(config["name"])
+
         description = {}
         for i in range(len(config["ids"])):
             description[config["joints"][i]] = (config["ids"][i], config["models"][i])
 
         self.config["joints"] = pa.array(config["joints"], pa.string())
-        self.bus = FeetechBus(config["port"], description)
+
+        self.bus = FeetechBus(
+            config["port"],
+            description,
+            read_retries=config["read_retries"],
+            read_budget_ms=config["read_budget_ms"],
+            low_latency=config["low_latency"],
+        )
 
         # Set client configuration values and raise errors if the values are not set to indicate that the motors are not
         # configured correctly
 
         self.bus.write_torque_enable(self.config["torque"])
 
-        self.node = Node(config["name"])
-
     def run(self):
         for event in self.node:
             event_type = event["type"]
@@ -46,6 +55,8 @@ class Client:
                     self.pull_velocity(self.node, event["metadata"])
                 elif event_id == "pull_current":
                     self.pull_current(self.node, event["metadata"])
+                elif event_id == "pull_errors":
+                    self.pull_errors(self.node, event["metadata"])
                 elif event_id == "write_goal_position":
                     self.write_goal_position(event["value"])
                 elif event_id == "end":
@@ -93,6 +104,13 @@ class Client:
         except ConnectionError as e:
             print("Error reading current:", e)
 
+    def pull_errors(self, node, metadata):
+        node.send_output(
+            "errors",
+            self.bus.read_errors(self.config["joints"]),
+            metadata,
+        )
+
     def write_goal_position(self, goal_position: pa.StructArray):
         try:
             self.bus.write_goal_position(goal_position)
@@ -128,6 +146,27 @@ def main():
         help="The configuration of the feetech motors.",
         default=None,
     )
+    parser.add_argument(
+        "--read-retries",
+        type=int,
+        required=False,
+        help="The number of times the motors that did not answer a read are read again.",
+        default=1,
+    )
+    parser.add_argument(
+        "--read-budget-ms",
+        type=float,
+        required=False,
+        help="The maximum time a read waits for the answers of the motors, retries included.",
+        default=None,
+    )
+    parser.add_argument(
+        "--no-low-latency",
+        action="store_true",
+        required=False,
+        help="Keep the latency timer of the USB-serial adapter, instead of setting it to 1 ms.",
+        default=False,
+    )
 
     args = parser.parse_args()
 
@@ -150,6 +189,17 @@ def main():
     with open(os.environ.get("CONFIG") if args.config is None else args.config) as file:
         config = json.load(file)
 
+    read_retries = int(os.getenv("READ_RETRIES", args.read_retries))
+
+    read_budget_ms = os.getenv("READ_BUDGET_MS", args.read_budget_ms)
+    if read_budget_ms is not None:
+        read_budget_ms = float(read_budget_ms)
+
+    low_latency = not args.no_low_latency and os.getenv("LOW_LATENCY", "1").lower() in [
+        "1",
+        "true",
+    ]
+
     joints = config.keys()
 
     # Create configuration
@@ -159,6 +209,9 @@ def main():
         "ids": [config[joint]["id"] for joint in joints],
         "joints": list(config.keys()),
         "models": [config[joint]["model"] for joint in joints],
+        "read_retries": read_retries,
+        "read_budget_ms": read_budget_ms,
+        "low_latency": low_latency,
         "torque": wrap_joints_and_values(
             pa.array(config.keys(), pa.string()),
             pa.array(
@@ -178,6 +231,7 @@ def main():
     print("Feetech Client Configuration: ", bus, flush=True)
 
     client = Client(bus)
+
     client.run()
     client.close()
 
@@ -1,4 +1,3 @@
-import lebai_sdk
 import numpy as np
 import pyarrow as pa
 from dora import Node
@@ -26,19 +25,24 @@ def save_json_file(file_path, data):
 
 SAVED_POSE_PATH = "pose_library.json"
 
-lebai_sdk.init()
 ROBOT_IP = os.getenv(
     "LEBAI_IP", "10.42.0.253"
 )  # 设定机器人ip地址，需要根据机器人实际ip地址修改
 
 
 def main():
+    # The node is created before importing the Lebai SDK, so the dataflow does not wait for it
+    node = Node()
+
+    import lebai_sdk
+
+    lebai_sdk.init()
+
     # Load the JSON file
     pose_library = load_json_file(SAVED_POSE_PATH)
     lebai = lebai_sdk.connect(ROBOT_IP, False)  # 创建实例
 
     lebai.start_sys()  # 启动手臂
-    node = Node()
     recording = False
     teaching = False
     recording_name = None
@@ -1,18 +1,110 @@
 """
 This Dora node is a minimalistic interface that shows two images and text in a Pygame window.
+
+Only the latest frame of each image slot is kept. A scaler thread converts the new frames into reusable surfaces of the
+size of their slot, at most at the display rate, and the window is only redrawn when a slot or the text changed.
 """
 
 import os
+import time
 import argparse
+import threading
 
 import numpy as np
-import pygame
 
 import pyarrow as pa
 
 from dora import Node
 
 
+class Slot:
+    """
+    An image slot of the window: the latest frame received, and its scaled surface.
+    """
+
+    def __init__(self, surface):
+        self.lock = threading.Lock()
+        self.surface = surface
+
+        # Latest frame received and its version, the frame is only decoded by the scaler
+        self.frame = None
+        self.version = 0
+        self.scaled_version = 0
+        self.drawn_version = 0
+
+    def put(self, frame: pa.StructArray):
+        with self.lock:
+            self.frame = frame
+            self.version += 1
+
+    def take(self):
+        """
+        Returns the latest frame and its version if it has not been scaled yet, None otherwise.
+        """
+        with self.lock:
+            if self.version == self.scaled_version:
+                return None
+
+            return self.frame, self.version
+
+
+class Scaler(threading.Thread):
+    """
+    Scales the latest frame of each slot into its surface, at most `fps` times per second. Frames received in between
+    are skipped.
+    """
+
+    def __init__(self, slots: list, fps: float):
+        super().__init__(daemon=True)
+
+        self.slots = slots
+        self.period = 1 / fps
+        self.running = True
+
+    def run(self):
+        import pygame
+
+        deadline = time.perf_counter()
+
+        while self.running:
+            deadline += self.period
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+
+            # Do not catch up on the periods missed by a slow scaling
+            deadline = max(deadline, time.perf_counter() - self.period)
+
+            for slot in self.slots:
+                taken = slot.take()
+                if taken is None:
+                    continue
+
+                arrow_image, version = taken
+                arrow_image = arrow_image[0]
+
+                width = arrow_image["width"].as_py()
+                height = arrow_image["height"].as_py()
+                data = arrow_image["data"].values.to_numpy()
+
+                image = pygame.image.frombuffer(data, (width, height), "BGR")
+
+                with slot.lock:
+                    # The surface of the slot is created once in the format of the frames, then reused
+                    if (
+                        slot.surface.get_bitsize() != image.get_bitsize()
+                        or slot.surface.get_masks() != image.get_masks()
+                    ):
+                        slot.surface = pygame.Surface(slot.surface.get_size(), 0, image)
+
+                    if image.get_size() == slot.surface.get_size():
+                        slot.surface.blit(image, (0, 0))
+                    else:
+                        pygame.transform.scale(
+                            image, slot.surface.get_size(), slot.surface
+                        )
+
+                    slot.scaled_version = version
+
+
 def main():
     # Handle dynamic nodes, ask for the name of the node in the dataflow
     parser = argparse.ArgumentParser(
@@ -40,14 +132,45 @@ def main():
         help="The height of the window.",
         default=480,
     )
+    parser.add_argument(
+        "--display-fps",
+        type=float,
+        required=False,
+        help="The maximum rate at which the images are scaled and the window redrawn.",
+        default=30,
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        required=False,
+        help="Print an import/initialization timing breakdown of the node.",
+        default=False,
+    )
 
     args = parser.parse_args()
 
+    profile_startup = args.profile_startup or os.getenv(
+        "PROFILE_STARTUP", "0"
+    ).lower() in ["1", "true"]
+    startup = {}
+
     window_width = int(os.getenv("WINDOW_WIDTH", args.window_width))
     window_height = int(os.getenv("WINDOW_HEIGHT", args.window_height))
+    display_fps = float(os.getenv("DISPLAY_FPS", args.display_fps))
 
-    image_left = pygame.Surface((int(window_width // 2), window_height // 2))
-    image_right = pygame.Surface((int(window_width // 2), window_height // 2))
+    # pygame is imported once the node is created, the dataflow does not wait for it
+    start = time.perf_counter()
+    node = Node(args.name)
+    startup["node"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    import pygame
+
+    startup["import pygame"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    image_left = Slot(pygame.Surface((int(window_width // 2), window_height // 2)))
+    image_right = Slot(pygame.Surface((int(window_width // 2), window_height // 2)))
 
     pygame.font.init()
     font = pygame.font.SysFont("Comic Sans MS", 30)
@@ -58,12 +181,21 @@ def main():
     screen = pygame.display.set_mode((window_width, window_height + text.get_height()))
 
     pygame.display.set_caption("Pygame minimalistic interface")
+    startup["window"] = (time.perf_counter() - start) * 1000
 
-    node = Node(args.name)
+    if profile_startup:
+        print("LeRobot Dashboard startup profile (ms): ", startup, flush=True)
+
+    scaler = Scaler([image_left, image_right], display_fps)
+    scaler.start()
 
     episode_index = 1
     recording = False
 
+    # The window is redrawn when the text changed, or the scaler updated an image
+    drawn_text = None
+    last_draw = 0.0
+
     for event in node:
         event_type = event["type"]
         if event_type == "STOP":
@@ -73,31 +205,10 @@ def main():
             event_id = event["id"]
 
             if event_id == "image_left":
-                arrow_image = event["value"][0]
-
-                image = {
-                    "width": arrow_image["width"].as_py(),
-                    "height": arrow_image["height"].as_py(),
-                    "channels": arrow_image["channels"].as_py(),
-                    "data": arrow_image["data"].values.to_numpy(),
-                }
-
-                image_left = pygame.image.frombuffer(
-                    image["data"], (image["width"], image["height"]), "BGR"
-                )
+                image_left.put(event["value"])
 
             elif event_id == "image_right":
-                arrow_image = event["value"][0]
-                image = {
-                    "width": arrow_image["width"].as_py(),
-                    "height": arrow_image["height"].as_py(),
-                    "channels": arrow_image["channels"].as_py(),
-                    "data": arrow_image["data"].values.to_numpy(),
-                }
-
-                image_right = pygame.image.frombuffer(
-                    image["data"], (image["width"], image["height"]), "BGR"
-                )
+                image_right.put(event["value"])
 
             elif event_id == "tick":
                 node.send_output("tick", pa.array([]), event["metadata"])
@@ -176,25 +287,44 @@ def main():
                 if not running:
                     break
 
-                screen.fill((0, 0, 0))
+                now = time.perf_counter()
+                if now - last_draw < 1 / display_fps:
+                    continue
 
-                # Draw the left image
-                screen.blit(image_left, (0, 0))
+                images_changed = any(
+                    slot.scaled_version != slot.drawn_version
+                    for slot in [image_left, image_right]
+                )
+
+                if text is drawn_text and not images_changed:
+                    continue
+
+                last_draw = now
+
+                screen.fill((0, 0, 0))
 
-                # Draw the right image
-                screen.blit(image_right, (window_width // 2, 0))
+                # Draw the left and right images
+                for slot, position in [
+                    (image_left, (0, 0)),
+                    (image_right, (window_width // 2, 0)),
+                ]:
+                    with slot.lock:
+                        screen.blit(slot.surface, position)
+                        slot.drawn_version = slot.scaled_version
 
                 # Draw the text bottom center
                 screen.blit(
                     text,
                     (window_width // 2 - text.get_width() // 2, int(window_height)),
                 )
+                drawn_text = text
 
                 pygame.display.flip()
 
         elif event_type == "ERROR":
             raise ValueError("An error occurred in the dataflow: " + event["error"])
 
+    scaler.running = False
     node.send_output("end", pa.array([]))
 
     pygame.quit()
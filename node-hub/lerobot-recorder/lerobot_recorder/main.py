@@ -0,0 +1,91 @@
+"""
+LeRobot Recorder: This node records the episodes of a dataflow directly in the layout of a LeRobot dataset, instead of
+recording every input with dora-record and building the dataset afterwards with `datasets/build_dataset.py`.
+
+The streams are aligned on the frame grid at FPS as their messages arrive, the frames of the current episode are kept
+in memory, and each finished episode is written in `out/<dataflow_id>/dataset.parquet`, next to the `videos` folder of
+the video-encoder nodes.
+"""
+
+import os
+import time
+import argparse
+from pathlib import Path
+
+from dora import Node
+
+from .recorder import Recorder
+
+
+def main():
+    # Handle dynamic nodes, ask for the name of the node in the dataflow
+    parser = argparse.ArgumentParser(
+        description="LeRobot Recorder: This node records the episodes of a dataflow in the layout of a LeRobot dataset."
+    )
+
+    parser.add_argument(
+        "--name",
+        type=str,
+        required=False,
+        help="The name of the node in the dataflow.",
+        default="lerobot_recorder",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        required=False,
+        help="The framerate of the dataset.",
+        default=30,
+    )
+
+    args = parser.parse_args()
+
+    fps = int(os.getenv("FPS", args.fps))
+
+    node = Node(args.name)
+
+    recorder = Recorder(str(Path("out") / node.dataflow_id()), fps)
+
+    # The recorder is closed on errors too, the footer of dataset.parquet keeps the written episodes readable
+    try:
+        for event in node:
+            event_type = event["type"]
+
+            if event_type == "INPUT":
+                event_id = event["id"]
+                now = time.perf_counter()
+
+                if event_id == "episode_index":
+                    episode = event["value"][0].as_py()
+
+                    if episode == -1:
+                        recorder.stop(now)
+                    else:
+                        recorder.start(episode, now)
+
+                elif event_id == "failed_episode_index":
+                    recorder.fail(event["value"][0].as_py())
+
+                elif event_id == "end":
+                    break
+
+                else:
+                    recorder.receive(event_id, event["value"], now)
+
+            elif event_type == "STOP":
+                break
+
+            elif event_type == "ERROR":
+                raise ValueError("An error occurred in the dataflow: " + event["error"])
+    finally:
+        recorder.close(time.perf_counter())
+
+    print(
+        f"LeRobot Recorder: {len(recorder.written)} episodes, {recorder.frames} frames written in "
+        f"{recorder.path / 'dataset.parquet'}, {recorder.dropped} failed episodes dropped.",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
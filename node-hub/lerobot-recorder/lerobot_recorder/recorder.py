@@ -0,0 +1,235 @@
+"""
+Recorder: aligns the streams of a recording on the frame grid of the dataset as their messages arrive, keeps the frames
+of the current episode in memory, and writes each finished episode in dataset.parquet, with the columns of
+`datasets/build_dataset.py`.
+"""
+
+import os
+import json
+import math
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def to_frame_value(value: pa.Array):
+    """
+    Converts a message into the value of a frame: the values of a joints/values StructArray as a float32 array (a
+    missing value is NaN), any other array as a list (e.g. the video frame of the video-encoder node).
+    """
+    if pa.types.is_struct(value.type) and value.type.get_field_index("values") != -1:
+        return value.field("values").to_numpy(zero_copy_only=False).astype(np.float32)
+
+    return value.to_pylist()
+
+
+def to_fixed_size_list(values: np.ndarray) -> pa.FixedSizeListArray:
+    # One list per row of the matrix, sharing the buffer of the matrix
+    return pa.FixedSizeListArray.from_arrays(
+        pa.array(values.astype(np.float32, copy=False).ravel()), values.shape[1]
+    )
+
+
+class Episode:
+    """
+    The frames of an episode being recorded. Frame `k` holds the latest value of each stream received before
+    `start + k / fps`, the frames before the first value of a stream hold that first value.
+    """
+
+    def __init__(self, index: int, start: float, fps: int):
+        self.index = index
+        self.start = start
+        self.fps = fps
+
+        # The frames only hold references to the latest values, the values are copied once by `to_table`
+        self.frames = {}
+        self.count = 0
+
+    def advance(self, now: float, latest: dict):
+        """
+        Adds the frames that started before `now`: they can no longer change, the following messages arrive after
+        them.
+        """
+        count = math.ceil((now - self.start) * self.fps)
+        added = count - self.count
+        if added <= 0:
+            return
+
+        for stream, value in latest.items():
+            # A stream that appears during the episode has no value in the previous frames
+            frames = self.frames.setdefault(stream, [None] * self.count)
+            frames.extend([value] * added)
+
+        self.count = count
+
+    def to_table(self, joints: Optional[pa.Array]) -> pa.Table:
+        columns = {"episode_index": np.full(self.count, self.index, dtype=np.int64)}
+
+        for stream, frames in self.frames.items():
+            first = next((value for value in frames if value is not None), None)
+            if first is None:
+                continue
+
+            frames = [first if value is None else value for value in frames]
+
+            if isinstance(first, np.ndarray):
+                columns[stream] = to_fixed_size_list(np.stack(frames))
+            else:
+                columns[stream] = pa.array(frames)
+
+        columns["timestamp"] = np.arange(self.count) * 1000 / self.fps
+
+        # The joints are stored once, in the schema metadata
+        metadata = None
+        if joints is not None:
+            metadata = {"joints": json.dumps(joints.to_pylist())}
+
+        return pa.table(columns, metadata=metadata)
+
+
+class Recorder:
+    """
+    Records the episodes of a session in `<path>/dataset.parquet`, one row group per episode.
+
+    The last finished episode is only written when the next episode starts, or when the recorder is closed, so failing
+    it (the dashboard fails the current or the previous episode) drops it from memory. A failed episode that was
+    already written is removed when the recorder is closed.
+    """
+
+    def __init__(self, path: str, fps: int):
+        self.path = Path(path)
+        self.fps = fps
+
+        self.latest = {}
+        self.joints = None
+
+        self.episode = None
+        self.pending = None
+
+        self.writer = None
+        self.written = []
+        self.failed = set()
+        self.frames = 0
+        self.dropped = 0
+
+    def receive(self, stream: str, value: pa.Array, now: float):
+        if self.episode is not None:
+            self.episode.advance(now, self.latest)
+
+        self.latest[stream] = to_frame_value(value)
+
+        # The joints of the dataset are the joints of the first action received
+        if (
+            self.joints is None
+            and pa.types.is_struct(value.type)
+            and value.type.get_field_index("joints") != -1
+            and stream == "action"
+        ):
+            self.joints = value.field("joints")
+
+    def start(self, index: int, now: float):
+        self.stop(now)
+        self.flush()
+
+        self.episode = Episode(index, now, self.fps)
+
+    def stop(self, now: float):
+        if self.episode is None:
+            return
+
+        self.episode.advance(now, self.latest)
+
+        self.pending = self.episode
+        self.episode = None
+
+    def fail(self, index: int):
+        if self.episode is not None and self.episode.index == index:
+            self.episode = None
+        elif self.pending is not None and self.pending.index == index:
+            self.pending = None
+        elif index in self.written:
+            self.failed.add(index)
+            return
+        else:
+            return
+
+        self.dropped += 1
+
+    def flush(self):
+        """
+        Writes the last finished episode.
+        """
+        if self.pending is None:
+            return
+
+        table = self.pending.to_table(self.joints)
+        index = self.pending.index
+        self.pending = None
+
+        if table.num_rows == 0:
+            return
+
+        if self.writer is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.writer = pq.ParquetWriter(
+                str(self.path / "dataset.parquet"), table.schema
+            )
+        else:
+            table = self.conform(table, self.writer.schema)
+
+        self.writer.write_table(table, row_group_size=table.num_rows)
+        self.written.append(index)
+        self.frames += table.num_rows
+
+    @staticmethod
+    def conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+        # The columns of the dataset are the columns of its first episode, a stream missing from an episode is null
+        columns = [
+            (
+                table[field.name].cast(field.type)
+                if field.name in table.column_names
+                else pa.nulls(table.num_rows, field.type)
+            )
+            for field in schema
+        ]
+
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    def close(self, now: float):
+        """
+        Writes the last episode and closes the dataset. Closing again does nothing.
+        """
+        try:
+            self.stop(now)
+            self.flush()
+        finally:
+            # The writer is closed even if the last episode can not be written, its footer keeps the others readable
+            self.episode = None
+            self.pending = None
+
+            writer, self.writer = self.writer, None
+            if writer is not None:
+                writer.close()
+
+        failed = [index for index in self.written if index in self.failed]
+        if writer is None or not failed:
+            return
+
+        # Each episode is a row group: the other episodes are copied without the failed ones
+        path = self.path / "dataset.parquet"
+        kept = [
+            group
+            for group, index in enumerate(self.written)
+            if index not in self.failed
+        ]
+        table = pq.ParquetFile(str(path)).read_row_groups(kept)
+
+        pq.write_table(table, str(path) + ".tmp")
+        os.replace(str(path) + ".tmp", path)
+
+        self.written = [index for index in self.written if index not in self.failed]
+        self.frames = table.num_rows
+        self.dropped += len(failed)
@@ -0,0 +1,119 @@
+"""
+Render throughput benchmark: measures the frames per second of the offscreen rendering of the cameras of a scene, with
+the preallocated buffers of `Cameras`, and compares it to rendering into a new array for each frame.
+
+The OpenGL backend is selected by MUJOCO_GL (egl by default, osmesa for CPU rendering).
+
+Usage:
+    MUJOCO_GL=egl python node-hub/mujoco-client/benchmark_render.py --scene robots/alexk-lcr/assets/simulation/reach_cube.xml
+"""
+
+import os
+import time
+import argparse
+
+os.environ.setdefault("MUJOCO_GL", "egl")
+
+import mujoco  # noqa: E402
+
+from mujoco_client.cameras import Cameras, image_to_arrow  # noqa: E402
+
+
+def run(
+    model,
+    data,
+    cameras: list[str],
+    width: int,
+    height: int,
+    frames: int,
+    preallocated: bool,
+) -> dict:
+    renderer = Cameras(model, {camera: 30.0 for camera in cameras}, width, height)
+
+    start = time.perf_counter()
+
+    for _ in range(frames):
+        # Step once between frames, so that the scene is updated
+        mujoco.mj_step(model, data)
+
+        for camera in cameras:
+            if preallocated:
+                frame = renderer.render(data, camera)
+            else:
+                renderer.renderer.update_scene(data, camera=camera)
+                frame = renderer.renderer.render()
+
+            image_to_arrow(frame)
+
+    wall = time.perf_counter() - start
+    renderer.close()
+
+    return {
+        "fps": frames * len(cameras) / wall,
+        "ms_per_frame": 1000 * wall / (frames * len(cameras)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render throughput benchmark: measures the offscreen rendering of the cameras of a scene."
+    )
+
+    parser.add_argument(
+        "--scene",
+        type=str,
+        required=True,
+        help="The scene file of the MuJoCo simulation.",
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        required=False,
+        help="The number of frames rendered per camera.",
+        default=200,
+    )
+    parser.add_argument(
+        "--resolutions",
+        type=str,
+        nargs="+",
+        required=False,
+        help="The resolutions to measure, as WIDTHxHEIGHT.",
+        default=["320x240", "640x480"],
+    )
+
+    args = parser.parse_args()
+
+    model = mujoco.MjModel.from_xml_path(args.scene)
+    data = mujoco.MjData(model)
+
+    cameras = [
+        mujoco.mj_id2name(model, mujoco.mjtObj.mjOBJ_CAMERA, camera)
+        for camera in range(model.ncam)
+    ]
+
+    print(f"MUJOCO_GL={os.environ['MUJOCO_GL']}, cameras: {cameras}")
+    print(f"{'resolution':<12}{'cameras':>8}{'buffers':>14}{'fps':>10}{'ms/frame':>10}")
+
+    for resolution in args.resolutions:
+        width, height = (int(value) for value in resolution.split("x"))
+
+        for count in range(1, len(cameras) + 1):
+            for preallocated in [False, True]:
+                result = run(
+                    model,
+                    data,
+                    cameras[:count],
+                    width,
+                    height,
+                    args.frames,
+                    preallocated,
+                )
+
+                print(
+                    f"{resolution:<12}{count:>8}{'preallocated' if preallocated else 'new':>14}"
+                    f"{result['fps']:>10.1f}{result['ms_per_frame']:>10.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
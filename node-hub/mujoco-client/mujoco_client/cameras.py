@@ -0,0 +1,140 @@
+"""
+Cameras: renders the cameras of a MuJoCo scene offscreen, each at its own rate of simulated time, with one renderer and
+preallocated pixel buffers.
+"""
+
+import time
+
+import numpy as np
+import pyarrow as pa
+
+RENDER_TIMES_WINDOW = 1000
+
+
+def parse_cameras(cameras: str, default_fps: float) -> dict[str, float]:
+    """
+    Parses a list of cameras `name[:fps],name[:fps]`, e.g. `camera_front:30,camera_top:10`.
+    """
+    rates = {}
+
+    for camera in cameras.split(","):
+        camera = camera.strip()
+        if not camera:
+            continue
+
+        name, _, fps = camera.partition(":")
+        rates[name] = float(fps) if fps else default_fps
+
+    return rates
+
+
+def image_to_arrow(frame: np.ndarray) -> pa.StructArray:
+    """
+    Wraps a (height, width, channels) frame in the image struct of `opencv-video-capture`.
+    """
+    image = {
+        "width": pa.scalar(frame.shape[1], type=pa.uint32()),
+        "height": pa.scalar(frame.shape[0], type=pa.uint32()),
+        "channels": pa.scalar(frame.shape[2], type=pa.uint8()),
+        "data": frame.ravel(),
+    }
+
+    return pa.array([image])
+
+
+class Cameras:
+    """
+    Offscreen renderer of the cameras of a scene.
+
+    The OpenGL backend is selected by the `MUJOCO_GL` environment variable before MuJoCo is imported: `egl` for GPU
+    headless rendering, `osmesa` for CPU rendering, `glfw` with a display.
+
+    The render times of the cameras are scheduled on the simulated time, independently of the physics timestep: a
+    camera at 30 fps renders 30 frames per simulated second, whether the simulation runs in real time or faster.
+    """
+
+    def __init__(self, model, cameras: dict[str, float], width: int, height: int):
+        """
+        Args:
+            model: the MuJoCo model.
+            cameras: the names of the cameras of the scene and their framerate.
+            width: the width of the rendered images.
+            height: the height of the rendered images.
+        """
+        import mujoco
+
+        for camera in cameras:
+            if mujoco.mj_name2id(model, mujoco.mjtObj.mjOBJ_CAMERA, camera) < 0:
+                raise ValueError(f"Camera {camera} not found in the scene.")
+
+        # The offscreen buffer of the model must hold the images
+        model.vis.global_.offwidth = max(model.vis.global_.offwidth, width)
+        model.vis.global_.offheight = max(model.vis.global_.offheight, height)
+
+        self.renderer = mujoco.Renderer(model, height, width)
+
+        self.periods = {camera: 1 / fps for camera, fps in cameras.items()}
+        self.frames = {
+            camera: np.empty((height, width, 3), dtype=np.uint8) for camera in cameras
+        }
+        self.next = {camera: None for camera in cameras}
+
+        # Duration of the last renders, in seconds
+        self.render_times = np.zeros(RENDER_TIMES_WINDOW)
+        self.renders = 0
+
+    def due(self, sim_time: float) -> list[str]:
+        """
+        Returns the cameras whose next render time has been reached at `sim_time`, and schedules their following
+        render. Frames missed by a long step are skipped, not rendered in a burst.
+        """
+        cameras = []
+
+        for camera, period in self.periods.items():
+            if self.next[camera] is None:
+                self.next[camera] = sim_time
+
+            if sim_time >= self.next[camera]:
+                cameras.append(camera)
+
+                missed = int((sim_time - self.next[camera]) / period)
+                self.next[camera] += (missed + 1) * period
+
+        return cameras
+
+    def render(self, data, camera: str) -> np.ndarray:
+        """
+        Renders a camera into its preallocated buffer, and returns the buffer. It is overwritten by the next render of
+        the camera.
+        """
+        start = time.perf_counter()
+
+        self.renderer.update_scene(data, camera=camera)
+        self.renderer.render(out=self.frames[camera])
+
+        self.render_times[self.renders % RENDER_TIMES_WINDOW] = (
+            time.perf_counter() - start
+        )
+        self.renders += 1
+
+        return self.frames[camera]
+
+    def statistics(self) -> dict[str, float]:
+        """
+        Returns the number of renders and the percentiles of the duration of a render in milliseconds.
+        """
+        if self.renders == 0:
+            return {"renders": 0}
+
+        render_times = (
+            self.render_times[: min(self.renders, RENDER_TIMES_WINDOW)] * 1000
+        )
+
+        return {
+            "renders": self.renders,
+            "render p50 (ms)": float(np.percentile(render_times, 50)),
+            "render p99 (ms)": float(np.percentile(render_times, 99)),
+        }
+
+    def close(self):
+        self.renderer.close()
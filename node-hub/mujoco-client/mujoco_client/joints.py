@@ -0,0 +1,112 @@
+"""
+Joints: maps the names of the joints of a MuJoCo model to their addresses in `MjData`, once, so that reads and writes of
+several joints are vectorized NumPy gathers and scatters.
+"""
+
+import numpy as np
+import pyarrow as pa
+
+CACHE_SIZE = 4
+
+
+class JointIndex:
+    """
+    Addresses of named joints in the `qpos`, `qvel` and `ctrl` arrays of a MuJoCo model.
+
+    A joint driven by an actuator (e.g. a position servo) is written to `ctrl`, so that the actuator moves it, otherwise
+    its position is written to `qpos` directly.
+    """
+
+    def __init__(self, model):
+        import mujoco
+
+        self.qpos = {}
+        self.dof = {}
+        self.actuator = {}
+
+        for joint in range(model.njnt):
+            # Only hinge and slide joints have a single position value, like a motor
+            if model.jnt_type[joint] not in [
+                int(mujoco.mjtJoint.mjJNT_HINGE),
+                int(mujoco.mjtJoint.mjJNT_SLIDE),
+            ]:
+                continue
+
+            name = mujoco.mj_id2name(model, mujoco.mjtObj.mjOBJ_JOINT, joint)
+            if name is None:
+                continue
+
+            self.qpos[name] = int(model.jnt_qposadr[joint])
+            self.dof[name] = int(model.jnt_dofadr[joint])
+
+        for actuator in range(model.nu):
+            if model.actuator_trntype[actuator] != int(mujoco.mjtTrn.mjTRN_JOINT):
+                continue
+
+            joint = int(model.actuator_trnid[actuator, 0])
+            name = mujoco.mj_id2name(model, mujoco.mjtObj.mjOBJ_JOINT, joint)
+            if name is not None:
+                self.actuator[name] = actuator
+
+        # Addresses of the last joints arrays used, reads and writes repeat the same few joints arrays
+        self.cache = []
+
+    def resolve(self, name: str) -> str:
+        """
+        Returns the name of the joint of the model for a configured joint name, which may omit the `_joint` suffix of
+        the joints of the scenes.
+        """
+        if name in self.qpos:
+            return name
+
+        if name + "_joint" in self.qpos:
+            return name + "_joint"
+
+        raise ValueError(
+            f"Joint {name} not found in the model, available joints: {list(self.qpos)}"
+        )
+
+    def addresses(self, joints: pa.Array) -> tuple[np.ndarray, ...]:
+        """
+        Returns the qpos, dof (qvel) addresses of the joints, and for the written values: the indices of the values
+        written to ctrl and their actuators, and the indices of the values written to qpos and their addresses.
+        """
+        for cached_joints, cached_addresses in self.cache:
+            if cached_joints.equals(joints):
+                return cached_addresses
+
+        names = [self.resolve(joint) for joint in joints.to_pylist()]
+
+        qpos = np.array([self.qpos[name] for name in names], dtype=np.int64)
+        dof = np.array([self.dof[name] for name in names], dtype=np.int64)
+
+        actuated = np.array([name in self.actuator for name in names], dtype=bool)
+        ctrl_values = np.flatnonzero(actuated)
+        ctrl = np.array([self.actuator[names[i]] for i in ctrl_values], dtype=np.int64)
+        qpos_values = np.flatnonzero(~actuated)
+
+        addresses = (qpos, dof, ctrl_values, ctrl, qpos_values, qpos[qpos_values])
+
+        self.cache = [(joints, addresses)] + self.cache[: CACHE_SIZE - 1]
+
+        return addresses
+
+    def write(self, data, joints: pa.Array, values: np.ndarray):
+        """
+        Scatters the goal values of the joints into `data.ctrl` for the actuated joints, and `data.qpos` for the
+        others.
+        """
+        _, _, ctrl_values, ctrl, qpos_values, qpos = self.addresses(joints)
+
+        data.ctrl[ctrl] = values[ctrl_values]
+        data.qpos[qpos] = values[qpos_values]
+
+    def read_position(self, data, joints: pa.Array) -> np.ndarray:
+        return data.qpos[self.addresses(joints)[0]]
+
+    def read_velocity(self, data, joints: pa.Array) -> np.ndarray:
+        return data.qvel[self.addresses(joints)[1]]
+
+    def read_force(self, data, joints: pa.Array) -> np.ndarray:
+        # Generalized force of the actuators on the joints, the simulated counterpart of the current of a motor
+        return data.qfrc_actuator[self.addresses(joints)[1]]
@@ -8,84 +8,249 @@ import argparse
 import time
 import json
 
+import numpy as np
 import pyarrow as pa
 
 from dora import Node
 
-import mujoco
-import mujoco.viewer
+from mujoco_client.cameras import Cameras, image_to_arrow, parse_cameras
+from mujoco_client.joints import JointIndex
+
+STEP_TIMES_WINDOW = 10000
+
+# Upper bound of the steps of one tick in realtime mode, so that a slow simulation does not stall the dataflow
+MAX_REALTIME_SUBSTEPS = 100
+
+
+def joints_values_to_arrow(joints: pa.Array, values: np.ndarray) -> pa.StructArray:
+    return pa.StructArray.from_arrays(
+        arrays=[joints, pa.array(values.astype(np.float32))],
+        names=["joints", "values"],
+    )
 
 
 class Client:
 
-    def __init__(self, config: dict[str, any]):
+    def __init__(self, config: dict[str, any], node=None):
         self.config = config
+        self.startup = {}
 
-        self.m = mujoco.MjModel.from_xml_path(filename=config["scene"])
-        self.data = mujoco.MjData(self.m)
+        # The node is created before importing MuJoCo, so the dataflow can start while it is loading
+        start = time.perf_counter()
+        self.node = Node(config["name"]) if node is None else node
+        self.startup["node"] = (time.perf_counter() - start) * 1000
 
-        self.node = Node(config["name"])
+        if config["cameras"] and config["headless"]:
+            # Offscreen rendering without a display, MUJOCO_GL is read when MuJoCo is imported
+            os.environ.setdefault("MUJOCO_GL", "egl")
 
-    def run(self):
-        with mujoco.viewer.launch_passive(self.m, self.data) as viewer:
-            for event in self.node:
-                event_type = event["type"]
+        start = time.perf_counter()
+        import mujoco
 
-                if event_type == "INPUT":
-                    event_id = event["id"]
+        self.startup["import mujoco"] = (time.perf_counter() - start) * 1000
 
-                    if event_id == "tick":
-                        self.node.send_output("tick", pa.array([]), event["metadata"])
+        start = time.perf_counter()
+        self.m = mujoco.MjModel.from_xml_path(filename=config["scene"])
+        self.data = mujoco.MjData(self.m)
+        self.index = JointIndex(self.m)
+
+        # Resolve the configured joints once, so that a joint missing in the scene is reported at startup
+        self.index.addresses(config["joints"])
+        self.startup["load scene"] = (time.perf_counter() - start) * 1000
+
+        self.cameras = None
+        if config["cameras"]:
+            start = time.perf_counter()
+            self.cameras = Cameras(
+                self.m,
+                config["cameras"],
+                config["image_width"],
+                config["image_height"],
+            )
+            self.startup["create renderer"] = (time.perf_counter() - start) * 1000
+
+        # Duration of the last steps of the simulation, in seconds
+        self.step_times = np.zeros(STEP_TIMES_WINDOW)
+        self.steps = 0
+
+        self.origin = None
+        self.sim_origin = None
 
-                        if not viewer.is_running():
-                            break
+    def run(self):
+        if self.config["headless"]:
+            self.loop(None)
+        else:
+            import mujoco.viewer
 
-                        step_start = time.time()
+            with mujoco.viewer.launch_passive(self.m, self.data) as viewer:
+                self.loop(viewer)
 
-                        # Step the simulation forward
-                        mujoco.mj_step(self.m, self.data)
-                        viewer.sync()
+        self.node.send_output("end", pa.array([]))
 
-                        # Rudimentary time keeping, will drift relative to wall clock.
-                        time_until_next_step = self.m.opt.timestep - (
-                            time.time() - step_start
-                        )
-                        if time_until_next_step > 0:
-                            time.sleep(time_until_next_step)
+        statistics = self.statistics()
+        if self.cameras is not None:
+            statistics.update(self.cameras.statistics())
+            self.cameras.close()
 
-                    elif event_id == "pull_position":
-                        self.pull_position(self.node, event["metadata"])
-                    elif event_id == "pull_velocity":
-                        self.pull_velocity(self.node, event["metadata"])
-                    elif event_id == "pull_current":
-                        self.pull_current(self.node, event["metadata"])
-                    elif event_id == "write_goal_position":
-                        self.write_goal_position(event["value"])
-                    elif event_id == "end":
-                        break
+        print("Mujoco Client statistics: ", statistics, flush=True)
 
-                elif event_type == "ERROR":
-                    raise ValueError(
-                        "An error occurred in the dataflow: " + event["error"]
-                    )
+    def loop(self, viewer):
+        self.origin = time.perf_counter()
+        self.sim_origin = self.data.time
 
-            self.node.send_output("end", pa.array([]))
+        if self.config["mode"] != "free":
+            for event in self.node:
+                if not self.handle(event, viewer):
+                    break
+
+            return
+
+        # Free-run: step as fast as possible, and handle the events received in between
+        while True:
+            event = self.node.next(timeout=0.0)
+
+            if event is None:
+                break
+
+            if event["type"] == "ERROR":
+                # A timeout of `next`, no event is pending
+                if not self.tick(viewer, None):
+                    break
+            elif not self.handle(event, viewer):
+                break
+
+    def handle(self, event, viewer) -> bool:
+        """
+        Handles an event of the dataflow. Returns False if the simulation should end.
+        """
+        event_type = event["type"]
+
+        if event_type == "INPUT":
+            event_id = event["id"]
+
+            if event_id == "tick":
+                # In free-run mode, ticks are emitted by the simulation itself
+                if self.config["mode"] != "free":
+                    return self.tick(viewer, event["metadata"])
+            elif event_id == "pull_position":
+                self.pull_position(self.node, event["metadata"])
+            elif event_id == "pull_velocity":
+                self.pull_velocity(self.node, event["metadata"])
+            elif event_id == "pull_current":
+                self.pull_current(self.node, event["metadata"])
+            elif event_id == "write_goal_position":
+                self.write_goal_position(event["value"])
+            elif event_id == "end":
+                return False
+
+        elif event_type == "ERROR":
+            raise ValueError("An error occurred in the dataflow: " + event["error"])
+
+        return True
+
+    def tick(self, viewer, metadata) -> bool:
+        """
+        Advances the simulation by one tick. Returns False if the viewer has been closed.
+        """
+        self.send_output("tick", pa.array([]), metadata)
+
+        if viewer is not None and not viewer.is_running():
+            return False
+
+        if self.config["mode"] == "realtime":
+            # Fixed steps until the simulation time catches up with the wall clock, so that it does not drift
+            target = self.sim_origin + (time.perf_counter() - self.origin)
+            substeps = int((target - self.data.time) / self.m.opt.timestep)
+            substeps = min(max(substeps, 0), MAX_REALTIME_SUBSTEPS)
+        else:
+            substeps = self.config["substeps"]
+
+        self.step(substeps)
+
+        if viewer is not None:
+            viewer.sync()
+
+        if self.cameras is not None:
+            for camera in self.cameras.due(self.data.time):
+                frame = self.cameras.render(self.data, camera)
+                self.send_output(camera, image_to_arrow(frame), metadata)
+
+        return True
+
+    def send_output(self, output_id: str, data, metadata):
+        # Ticks emitted by the simulation itself in free-run mode have no metadata
+        if metadata is None:
+            self.node.send_output(output_id, data)
+        else:
+            self.node.send_output(output_id, data, metadata)
+
+    def step(self, substeps: int):
+        import mujoco
+
+        for _ in range(substeps):
+            start = time.perf_counter()
+            mujoco.mj_step(self.m, self.data)
+            self.step_times[self.steps % STEP_TIMES_WINDOW] = (
+                time.perf_counter() - start
+            )
+            self.steps += 1
+
+    def statistics(self) -> dict[str, float]:
+        """
+        Returns the ratio of simulated time to wall time since the start of the simulation, and the percentiles of the
+        duration of a step in microseconds.
+        """
+        if self.origin is None or self.steps == 0:
+            return {"steps": self.steps}
+
+        wall = time.perf_counter() - self.origin
+        step_times = self.step_times[: min(self.steps, STEP_TIMES_WINDOW)] * 1e6
+
+        return {
+            "steps": self.steps,
+            "sim/wall": (self.data.time - self.sim_origin) / wall,
+            "step p50 (us)": float(np.percentile(step_times, 50)),
+            "step p99 (us)": float(np.percentile(step_times, 99)),
+            "step max (us)": float(np.max(step_times)),
+        }
 
     def pull_position(self, node, metadata):
-        pass
+        node.send_output(
+            "position",
+            joints_values_to_arrow(
+                self.config["joints"],
+                self.index.read_position(self.data, self.config["joints"]),
+            ),
+            metadata,
+        )
 
     def pull_velocity(self, node, metadata):
-        pass
+        node.send_output(
+            "velocity",
+            joints_values_to_arrow(
+                self.config["joints"],
+                self.index.read_velocity(self.data, self.config["joints"]),
+            ),
+            metadata,
+        )
 
     def pull_current(self, node, metadata):
-        pass
+        node.send_output(
+            "current",
+            joints_values_to_arrow(
+                self.config["joints"],
+                self.index.read_force(self.data, self.config["joints"]),
+            ),
+            metadata,
+        )
 
     def write_goal_position(self, goal_position_with_joints):
         joints = goal_position_with_joints.field("joints")
         goal_position = goal_position_with_joints.field("values")
 
-        for i, joint in enumerate(joints):
-            self.data.joint(joint.as_py()).qpos[0] = goal_position[i].as_py()
+        self.index.write(
+            self.data, joints, goal_position.to_numpy(zero_copy_only=False)
+        )
 
 
 def main():
@@ -112,6 +277,64 @@ def main():
     parser.add_argument(
         "--config", type=str, help="The configuration of the joints.", default=None
     )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        required=False,
+        help="Run the simulation without the viewer.",
+        default=False,
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["realtime", "lockstep", "free"],
+        required=False,
+        help="realtime: each tick steps the simulation up to the wall clock. lockstep: each tick runs --substeps "
+        "steps. free: the simulation runs --substeps steps per tick as fast as possible, and emits the ticks.",
+        default="realtime",
+    )
+    parser.add_argument(
+        "--substeps",
+        type=int,
+        required=False,
+        help="The number of steps per tick in lockstep and free modes.",
+        default=1,
+    )
+    parser.add_argument(
+        "--cameras",
+        type=str,
+        required=False,
+        help="The cameras of the scene to render, as name[:fps] separated by commas, e.g. camera_front:30,camera_top.",
+        default="",
+    )
+    parser.add_argument(
+        "--camera-fps",
+        type=float,
+        required=False,
+        help="The framerate of the cameras without an explicit framerate, in simulated time.",
+        default=30.0,
+    )
+    parser.add_argument(
+        "--image-width",
+        type=int,
+        required=False,
+        help="The width of the rendered images.",
+        default=640,
+    )
+    parser.add_argument(
+        "--image-height",
+        type=int,
+        required=False,
+        help="The height of the rendered images.",
+        default=480,
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        required=False,
+        help="Print an import/initialization timing breakdown of the node.",
+        default=False,
+    )
 
     args = parser.parse_args()
 
@@ -139,11 +362,31 @@ def main():
         "name": args.name,
         "scene": scene,
         "joints": pa.array(joints, pa.string()),
+        "headless": args.headless
+        or os.getenv("HEADLESS", "0").lower() in ["1", "true"],
+        "mode": os.getenv("MODE", args.mode),
+        "substeps": int(os.getenv("SUBSTEPS", args.substeps)),
+        "cameras": parse_cameras(
+            os.getenv("CAMERAS", args.cameras),
+            float(os.getenv("CAMERA_FPS", args.camera_fps)),
+        ),
+        "image_width": int(os.getenv("IMAGE_WIDTH", args.image_width)),
+        "image_height": int(os.getenv("IMAGE_HEIGHT", args.image_height)),
     }
 
+    if bus["mode"] not in ["realtime", "lockstep", "free"]:
+        raise ValueError("MODE must be one of realtime, lockstep or free.")
+
     print("Mujoco Client Configuration: ", bus, flush=True)
 
     client = Client(bus)
+
+    if args.profile_startup or os.getenv("PROFILE_STARTUP", "0").lower() in [
+        "1",
+        "true",
+    ]:
+        print("Mujoco Client startup profile (ms): ", client.startup, flush=True)
+
     client.run()
 
 
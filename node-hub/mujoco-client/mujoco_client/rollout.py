@@ -0,0 +1,453 @@
+"""
+Mujoco Rollout: generates a dataset of simulated episodes, running one MuJoCo simulation per process of a pool. Each
+episode replays the actions of an episode of a dataset, or a scripted policy, and the episodes are written in the
+layout of `datasets/build_dataset.py` (dataset.parquet and encoded videos).
+"""
+
+import os
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mujoco_client.cameras import parse_cameras
+
+# Simulation of the worker process, created once by `init_worker`
+worker = None
+
+
+def sine_policy(t: float, low: np.ndarray, high: np.ndarray, episode: int):
+    # Each joint oscillates in its range, with a period and phase depending on the joint and the episode
+    rng = np.random.default_rng(episode)
+    period = rng.uniform(2.0, 6.0, len(low))
+    phase = rng.uniform(0, 2 * np.pi, len(low))
+
+    return low + (high - low) * (0.5 + 0.4 * np.sin(2 * np.pi * t / period + phase))
+
+
+def hold_policy(t: float, low: np.ndarray, high: np.ndarray, episode: int):
+    # Holds the middle of the range of each joint
+    return (low + high) / 2
+
+
+POLICIES = {"sine": sine_policy, "hold": hold_policy}
+
+
+def load_actions(dataset_path: str) -> tuple[list[str], dict[int, np.ndarray]]:
+    """
+    Loads the actions of the episodes of a dataset built by `datasets/build_dataset.py`. Returns the joints and the
+    (n_frames, n_joints) action matrix of each episode.
+    """
+    schema = pq.read_schema(dataset_path + "/dataset.parquet")
+
+    # The joints are stored once in the schema metadata, the datasets built before in a column repeated on every row
+    columns = ["episode_index", "timestamp", "action"]
+    if schema.metadata is None or b"joints" not in schema.metadata:
+        columns.append("joints")
+
+    table = pq.read_table(dataset_path + "/dataset.parquet", columns=columns).sort_by(
+        [("episode_index", "ascending"), ("timestamp", "ascending")]
+    )
+
+    if "joints" in table.column_names:
+        joints = table["joints"][0].values.to_pylist()
+    else:
+        joints = json.loads(schema.metadata[b"joints"])
+
+    action = table["action"].combine_chunks()
+    actions = action.flatten().to_numpy().reshape(len(action), -1).astype(np.float32)
+    episodes = table["episode_index"].to_numpy()
+
+    return joints, {
+        int(episode): actions[episodes == episode] for episode in np.unique(episodes)
+    }
+
+
+class Worker:
+    """
+    The simulation of a process of the pool: the model, the joint index and the renderer are created once, each
+    episode only resets the data.
+    """
+
+    def __init__(
+        self,
+        scene: str,
+        joints: list[str],
+        cameras: dict[str, float],
+        width: int,
+        height: int,
+        fps: int,
+        output: str,
+    ):
+        if cameras:
+            # MUJOCO_GL is read when MuJoCo is imported, each process has its own context
+            os.environ.setdefault("MUJOCO_GL", "egl")
+
+        import mujoco
+
+        from mujoco_client.cameras import Cameras
+        from mujoco_client.joints import JointIndex
+
+        self.model = mujoco.MjModel.from_xml_path(scene)
+        self.data = mujoco.MjData(self.model)
+        self.index = JointIndex(self.model)
+
+        self.joints = pa.array(joints, pa.string())
+        self.fps = fps
+        self.output = Path(output)
+
+        # Range of each joint, for the scripted policies
+        names = [self.index.resolve(joint) for joint in joints]
+        ranges = np.array(
+            [
+                self.model.jnt_range[
+                    mujoco.mj_name2id(self.model, mujoco.mjtObj.mjOBJ_JOINT, name)
+                ]
+                for name in names
+            ]
+        )
+        self.low, self.high = ranges[:, 0], ranges[:, 1]
+
+        self.cameras = Cameras(self.model, cameras, width, height) if cameras else None
+
+    def rollout(self, episode: int, frames: int, actions, policy: str) -> dict:
+        """
+        Runs an episode of `frames` frames, and encodes the videos of its cameras. Returns the columns of the episode.
+        """
+        import mujoco
+
+        mujoco.mj_resetData(self.model, self.data)
+
+        state = np.zeros((frames, len(self.joints)), dtype=np.float32)
+        action = np.zeros((frames, len(self.joints)), dtype=np.float32)
+
+        # Each frame is piped to the encoder of its camera as it is rendered, only one frame per camera is in memory
+        paths = {}
+        videos = {}
+        if self.cameras is not None:
+            for camera, frame in self.cameras.frames.items():
+                name = f"{camera}_episode_{episode:06d}.mp4"
+                videos[camera] = VideoEncoder(
+                    self.output / "videos" / name,
+                    frame.shape[1],
+                    frame.shape[0],
+                    self.fps,
+                )
+                paths[camera] = f"videos/{name}"
+
+        try:
+            steps = 0
+            for frame in range(frames):
+                t = frame / self.fps
+
+                if actions is not None:
+                    action[frame] = actions[frame]
+                else:
+                    action[frame] = POLICIES[policy](t, self.low, self.high, episode)
+
+                # Observations are taken at the frame time, before applying its action
+                state[frame] = self.index.read_position(self.data, self.joints)
+                for camera, video in videos.items():
+                    video.write(self.cameras.render(self.data, camera))
+
+                self.index.write(
+                    self.data, self.joints, action[frame].astype(np.float64)
+                )
+
+                # Fixed steps up to the time of the next frame
+                target = round((frame + 1) / self.fps / self.model.opt.timestep)
+                for _ in range(target - steps):
+                    mujoco.mj_step(self.model, self.data)
+                steps = target
+        except BaseException:
+            for video in videos.values():
+                video.kill()
+            raise
+
+        for video in videos.values():
+            video.close()
+
+        return {
+            "episode_index": episode,
+            "action": action,
+            "observation.state": state,
+            "videos": paths,
+        }
+
+
+class VideoEncoder:
+    """
+    Encodes RGB frames with the settings of the video-encoder node, writing each frame to the stdin of an FFmpeg
+    process as it is rendered, instead of writing PNG files or holding the frames of the episode.
+    """
+
+    def __init__(self, path: Path, width: int, height: int, fps: int):
+        self.path = path
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "-s",
+                f"{width}x{height}",
+                "-r",
+                str(fps),
+                "-i",
+                "pipe:0",
+                "-vcodec",
+                "libx264",
+                "-g",
+                "2",
+                "-pix_fmt",
+                "yuv444p",
+                str(path),
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame: np.ndarray):
+        # The pipe reads the buffer of the frame, without copying it to bytes
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.failed()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        if self.process.wait() != 0:
+            self.failed()
+
+    def failed(self):
+        raise RuntimeError(
+            f"FFmpeg exited with code {self.process.wait()} while encoding {self.path}."
+        )
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def init_worker(*args):
+    global worker
+    worker = Worker(*args)
+
+
+def run_episode(task: tuple) -> dict:
+    return worker.rollout(*task)
+
+
+def to_fixed_size_list(values: np.ndarray) -> pa.FixedSizeListArray:
+    # One list per row of the matrix, sharing the buffer of the matrix
+    return pa.FixedSizeListArray.from_arrays(
+        pa.array(values.astype(np.float32, copy=False).ravel()), values.shape[1]
+    )
+
+
+def write_dataset(results: list[dict], joints: list[str], cameras, fps: int, output):
+    """
+    Writes the episodes in dataset.parquet, with the columns of `datasets/build_dataset.py`.
+    """
+    results = sorted(results, key=lambda result: result["episode_index"])
+
+    frames = [len(result["action"]) for result in results]
+    frame = np.concatenate([np.arange(count) for count in frames])
+
+    columns = {
+        "episode_index": np.repeat(
+            [result["episode_index"] for result in results], frames
+        ),
+        "action": to_fixed_size_list(
+            np.concatenate([result["action"] for result in results])
+        ),
+        "observation.state": to_fixed_size_list(
+            np.concatenate([result["observation.state"] for result in results])
+        ),
+    }
+
+    for camera in cameras:
+        paths = np.repeat([result["videos"][camera] for result in results], frames)
+        columns[f"observation.images.{camera}"] = [
+            [{"path": path, "timestamp": index / fps}]
+            for path, index in zip(paths, frame)
+        ]
+
+    columns["timestamp"] = frame * 1000 / fps
+
+    pq.write_table(
+        pa.table(columns, metadata={"joints": json.dumps(joints)}),
+        str(Path(output) / "dataset.parquet"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mujoco Rollout: generates a dataset of simulated episodes with a pool of MuJoCo simulations."
+    )
+
+    parser.add_argument(
+        "--scene",
+        type=str,
+        required=True,
+        help="The scene file of the MuJoCo simulation.",
+    )
+    parser.add_argument(
+        "--dataset-name",
+        type=str,
+        required=True,
+        help="The name of the generated dataset, written in datasets/<dataset-name>.",
+    )
+    parser.add_argument(
+        "--replay",
+        type=str,
+        required=False,
+        help="The path to a dataset whose actions are replayed, in the units of the joints of the scene.",
+        default=None,
+    )
+    parser.add_argument(
+        "--policy",
+        type=str,
+        choices=list(POLICIES),
+        required=False,
+        help="The scripted policy used when no dataset is replayed.",
+        default="sine",
+    )
+    parser.add_argument(
+        "--joints",
+        type=str,
+        required=False,
+        help="The joints controlled by the scripted policy, separated by commas.",
+        default=None,
+    )
+    parser.add_argument(
+        "--episodes",
+        type=int,
+        required=False,
+        help="The number of episodes of the scripted policy.",
+        default=10,
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        required=False,
+        help="The number of frames of an episode of the scripted policy.",
+        default=300,
+    )
+    parser.add_argument(
+        "--framerate",
+        type=int,
+        required=False,
+        help="The framerate of the dataset.",
+        default=30,
+    )
+    parser.add_argument(
+        "--cameras",
+        type=str,
+        required=False,
+        help="The cameras of the scene to record, separated by commas.",
+        default="",
+    )
+    parser.add_argument(
+        "--image-width",
+        type=int,
+        required=False,
+        help="The width of the rendered images.",
+        default=640,
+    )
+    parser.add_argument(
+        "--image-height",
+        type=int,
+        required=False,
+        help="The height of the rendered images.",
+        default=480,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        help="The number of simulation processes, defaults to the number of cores.",
+        default=os.cpu_count(),
+    )
+
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        joints, episode_actions = load_actions(args.replay)
+        tasks = [
+            (episode, len(actions), actions, None)
+            for episode, actions in episode_actions.items()
+        ]
+    elif args.joints is not None:
+        joints = args.joints.split(",")
+        tasks = [
+            (episode, args.frames, None, args.policy)
+            for episode in range(args.episodes)
+        ]
+    else:
+        raise ValueError(
+            "Please set the dataset to --replay, or the --joints of the policy."
+        )
+
+    # The framerate of the cameras is the framerate of the dataset
+    cameras = parse_cameras(args.cameras, args.framerate)
+
+    output = Path("datasets") / args.dataset_name.replace(" ", "_").lower()
+    (output / "videos").mkdir(parents=True, exist_ok=True)
+
+    print(
+        f"Generating {len(tasks)} episodes of {args.scene} in {output} with {args.workers} workers",
+        flush=True,
+    )
+
+    start = time.perf_counter()
+
+    # Each process creates its own OpenGL context, they are not inherited from a fork
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        args.workers,
+        initializer=init_worker,
+        initargs=(
+            args.scene,
+            joints,
+            cameras,
+            args.image_width,
+            args.image_height,
+            args.framerate,
+            str(output),
+        ),
+    ) as pool:
+        results = []
+        for result in pool.imap_unordered(run_episode, tasks):
+            results.append(result)
+            print(
+                f"Episode {result['episode_index']} done ({len(results)}/{len(tasks)})",
+                flush=True,
+            )
+
+    wall = time.perf_counter() - start
+
+    write_dataset(results, joints, cameras, args.framerate, output)
+
+    print(
+        f"{len(tasks)} episodes in {wall:.1f} s: {60 * len(tasks) / wall:.1f} episodes/min, "
+        f"{sum(task[1] for task in tasks) / wall:.1f} frames/s",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 import os
 import argparse
-import cv2
 
 import numpy as np
 import pyarrow as pa
@@ -63,9 +62,13 @@ def main():
         if isinstance(image_height, str) and image_height.isnumeric():
             image_height = int(image_height)
 
-    video_capture = cv2.VideoCapture(video_capture_path)
     node = Node(args.name)
 
+    # OpenCV is imported once the node is created, the dataflow does not wait for it
+    import cv2
+
+    video_capture = cv2.VideoCapture(video_capture_path)
+
     pa.array([])  # initialize pyarrow array
 
     for event in node:
@@ -0,0 +1,269 @@
+"""
+Replay jitter benchmark: measures how far the emission times of the replay client are from the timestamps of the
+dataset, and compares the internal scheduler to the previous pulled replay (one frame per `pull_position` tick of a
+`dora/timer/millis/33` timer, read with `iloc`).
+
+The episode is read from a dataset built by `datasets/build_dataset.py`, or generated if no path is given.
+
+Usage:
+    python node-hub/replay-client/benchmark_jitter.py --frames 300
+    python node-hub/replay-client/benchmark_jitter.py --path datasets/enzo2 --episode 1 --speed 2
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from replay_client.main import Client, joints_values_to_arrow
+
+
+class FakeNode:
+    """
+    Emulates the Dora node of the replay client: `next` waits for the timeout, or for the next tick of a periodic
+    `pull_position` timer if `period` is set, and `send_output` records the emission times of the positions and the
+    frames they replay.
+    """
+
+    def __init__(self, period: Optional[float] = None, count: Optional[int] = None):
+        self.period = period
+        self.count = count
+        self.start = time.perf_counter()
+        self.ticks = 0
+        self.sent = []
+        self.frames = []
+        self.client = None
+
+    def next(self, timeout: Optional[float] = None):
+        if self.period is None:
+            time.sleep(timeout)
+            return {"type": "ERROR", "error": "timeout"}
+
+        if self.ticks >= self.count:
+            return None
+
+        # Ticks of a dora timer do not drift
+        self.ticks += 1
+        time.sleep(
+            max(0.0, self.start + self.ticks * self.period - time.perf_counter())
+        )
+        return {"type": "INPUT", "id": "pull_position", "metadata": {}}
+
+    def send_output(self, output_id: str, data, metadata=None):
+        if output_id == "position":
+            self.sent.append(time.perf_counter())
+            self.frames.append(
+                self.ticks - 1
+                if self.client is None
+                else self.client.scheduler.index - 1
+            )
+
+
+def generate_dataset(path: str, frames: int, fps: int, joints: int, dropped: float):
+    """
+    Writes a dataset.parquet with one episode, with the layout of `datasets/build_dataset.py`. A fraction `dropped` of
+    the frames is missing, as when no message of the recording falls in a frame.
+    """
+    rng = np.random.default_rng(0)
+
+    frame = np.arange(frames)
+    frame = frame[(rng.random(frames) >= dropped) | (frame == 0)]
+
+    names = [f"joint_{i}" for i in range(joints)]
+    table = pa.table(
+        {
+            "episode_index": np.zeros(len(frame), dtype=np.int64),
+            "action": pa.FixedSizeListArray.from_arrays(
+                pa.array(rng.random(len(frame) * joints).astype(np.float32)), joints
+            ),
+            "timestamp": frame * 1000 / fps,
+        },
+        metadata={"joints": json.dumps(names)},
+    )
+
+    pq.write_table(table, path + "/dataset.parquet")
+
+
+def pulled(config: dict, period: float) -> tuple[FakeNode, float]:
+    """
+    The previous replay loop, kept as a reference for the benchmark. Returns the node holding the emissions, and the
+    time spent building a position.
+    """
+    import pandas as pd
+
+    dataset = pd.read_parquet(config["episode_path"] + "/dataset.parquet")
+    dataset = dataset[dataset["episode_index"] == config["episode_id"]]
+    action = dataset["action"]
+    joints = pa.array(
+        json.loads(
+            pq.read_schema(config["episode_path"] + "/dataset.parquet").metadata[
+                b"joints"
+            ]
+        )
+    )
+
+    node = FakeNode(period, len(action))
+    build = 0.0
+
+    for frame in range(len(action)):
+        node.next()
+
+        start = time.perf_counter()
+        position = pa.StructArray.from_arrays(
+            arrays=[
+                joints,
+                pa.array(action.iloc[frame], type=pa.float32()),
+            ],
+            names=["joints", "values"],
+        )
+        build += time.perf_counter() - start
+
+        node.send_output("position", position)
+
+    return node, build / len(action)
+
+
+def scheduled(config: dict) -> tuple[FakeNode, Client, float]:
+    """
+    The replay of the client. Returns the node holding the emissions, the client, and the time spent building a
+    position.
+    """
+    node = FakeNode()
+    client = Client(config, node)
+    node.client = client
+    client.run()
+
+    positions = client.scheduler.positions
+
+    start = time.perf_counter()
+    for index in range(len(positions)):
+        joints_values_to_arrow(client.joints, pa.array(positions[index]))
+    build = (time.perf_counter() - start) / len(positions)
+
+    return node, client, build
+
+
+def report(name: str, node: FakeNode, times: np.ndarray, build: float):
+    """
+    Prints the error between the emission time of each frame and its time in the episode, both relative to the first
+    emission.
+    """
+    sent = np.array(node.sent) - node.sent[0]
+    expected = times[node.frames] - times[node.frames[0]]
+    error = (sent - expected) * 1000
+
+    print(
+        f"{name:<28}{len(sent):>8}{np.mean(np.abs(error)):>12.2f}{np.percentile(np.abs(error), 99):>12.2f}"
+        f"{np.max(np.abs(error)):>12.2f}{error[-1]:>12.2f}{build * 1e6:>14.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay jitter benchmark: measures the emission times of the replay client against the dataset."
+    )
+
+    parser.add_argument(
+        "--path",
+        type=str,
+        required=False,
+        help="The path to a dataset, a dataset is generated if not set.",
+        default=None,
+    )
+    parser.add_argument(
+        "--episode",
+        type=int,
+        required=False,
+        help="The episode to replay.",
+        default=0,
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        required=False,
+        help="The number of frames of the generated episode.",
+        default=300,
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        required=False,
+        help="The framerate of the generated episode.",
+        default=30,
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        required=False,
+        help="The replay speed multiplier of the scheduled replay.",
+        default=1.0,
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        required=False,
+        help="The interpolated output rate in Hz of the scheduled replay.",
+        default=100.0,
+    )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path
+        if path is None:
+            path = directory
+            generate_dataset(path, args.frames, args.fps, 6, dropped=0.02)
+
+        config = {
+            "name": "replay_client",
+            "episode_path": path,
+            "episode_id": args.episode,
+            "rate": None,
+            "speed": args.speed,
+            "loop": False,
+            "seek": 0.0,
+        }
+
+        timestamps = (
+            pq.read_table(
+                os.path.join(path, "dataset.parquet"),
+                filters=[("episode_index", "==", args.episode)],
+            )["timestamp"].to_numpy()
+            / 1000
+        )
+        timestamps = np.sort(timestamps - timestamps.min())
+
+        print(
+            f"{'replay':<28}{'samples':>8}{'mean (ms)':>12}{'p99 (ms)':>12}{'max (ms)':>12}"
+            f"{'drift (ms)':>12}{'cost (us)':>14}"
+        )
+
+        node, build = pulled(config, 0.033)
+        report("pulled, timer 33 ms", node, timestamps, build)
+
+        node, client, build = scheduled(config)
+        report(
+            f"scheduled, x{args.speed:g}",
+            node,
+            client.scheduler.times / args.speed,
+            build,
+        )
+
+        config["rate"] = args.rate
+        node, client, build = scheduled(config)
+        report(
+            f"scheduled, {args.rate:g} Hz, x{args.speed:g}",
+            node,
+            client.scheduler.times / args.speed,
+            build,
+        )
+
+
+if __name__ == "__main__":
+    main()
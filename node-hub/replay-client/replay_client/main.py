@@ -4,13 +4,19 @@ reading a dataset of actions and joints from a specific episode.
 """
 
 import os
+import time
 import argparse
+import collections
 
+import numpy as np
 import pyarrow as pa
-import pandas as pd
 
 from dora import Node
 
+from .replay import Scheduler, load_episode
+
+LATENESS_WINDOW = 10000
+
 
 def joints_values_to_arrow(joints, values):
     return pa.StructArray.from_arrays(
@@ -24,50 +30,91 @@ def joints_values_to_arrow(joints, values):
 
 class Client:
 
-    def __init__(self, config: dict[str, any]):
+    def __init__(self, config: dict[str, any], node=None):
         self.config = config
 
-        self.node = Node(config["name"])
+        # The node is created before loading the episode, so the dataflow can start while it is loading
+        self.node = Node(config["name"]) if node is None else node
 
-        dataset = pd.read_parquet(config["episode_path"] + "/dataset.parquet")
+        timestamps, actions, self.joints = load_episode(
+            config["episode_path"], config["episode_id"]
+        )
 
-        # Filter the dataset to only keep rows from the episode
-        dataset = dataset[dataset["episode_index"] == config["episode_id"]]
+        self.scheduler = Scheduler(
+            timestamps, actions, config["rate"], config["speed"], config["loop"]
+        )
 
-        self.action = dataset["action"]
-        self.joints = dataset["joints"]
-        self.frame = 0
+        # Lateness of the emitted samples in seconds, relative to their deadline
+        self.lateness = collections.deque(maxlen=LATENESS_WINDOW)
 
     def run(self):
-        for event in self.node:
-            event_type = event["type"]
+        self.scheduler.seek(self.config["seek"], time.perf_counter())
+
+        while True:
+            deadline = self.scheduler.deadline()
+            if deadline is None:
+                break
+
+            now = time.perf_counter()
+            if now < deadline:
+                # Wait for the deadline, while still handling the events of the dataflow
+                event = self.node.next(timeout=deadline - now)
+
+                if event is None:
+                    break
+
+                event_type = event["type"]
 
-            if event_type == "INPUT":
-                event_id = event["id"]
+                if event_type == "INPUT":
+                    event_id = event["id"]
 
-                if event_id == "pull_position":
-                    if self.pull_position(self.node, event["metadata"]):
+                    if event_id == "seek":
+                        self.scheduler.seek(
+                            event["value"][0].as_py(), time.perf_counter()
+                        )
+                    elif event_id == "end":
                         break
-                elif event_id == "end":
+
+                elif event_type == "STOP":
                     break
 
-            elif event_type == "ERROR":
-                raise ValueError("An error occurred in the dataflow: " + event["error"])
+                elif event_type == "ERROR":
+                    # A timeout of `next` is an ERROR event: the deadline is checked again
+                    if "timeout" not in event["error"].lower():
+                        raise ValueError(
+                            "An error occurred in the dataflow: " + event["error"]
+                        )
+
+                continue
+
+            self.send_position(now)
 
         self.node.send_output("end", pa.array([]))
 
-    def pull_position(self, node, metadata) -> bool:
-        if self.frame >= len(self.action):
-            return True
+        if self.lateness:
+            print("Replay Client lateness (ms): ", self.statistics(), flush=True)
 
-        action = self.action.iloc[self.frame]
-        joints = self.joints.iloc[self.frame]
+    def send_position(self, now: float):
+        index, deadline = self.scheduler.pop(now)
 
-        position = joints_values_to_arrow(joints, pa.array(action, type=pa.float32()))
+        # Rows of the precomputed matrix are contiguous, so they are not copied by pyarrow
+        position = joints_values_to_arrow(
+            self.joints, pa.array(self.scheduler.positions[index])
+        )
 
-        self.frame += 1
+        self.lateness.append(time.perf_counter() - deadline)
+        self.node.send_output("position", position)
 
-        node.send_output("position", position, metadata)
+    def statistics(self) -> dict[str, float]:
+        lateness = np.array(self.lateness) * 1000
+
+        return {
+            "mean": float(np.mean(lateness)),
+            "p50": float(np.percentile(lateness, 50)),
+            "p99": float(np.percentile(lateness, 99)),
+            "max": float(np.max(lateness)),
+            "skipped": self.scheduler.skipped,
+        }
 
 
 def main():
@@ -97,6 +144,34 @@ def main():
         help="The episode id to replay.",
         default=None,
     )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        required=False,
+        help="The output rate in Hz, samples are interpolated between frames. Defaults to the dataset timestamps.",
+        default=None,
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        required=False,
+        help="The replay speed multiplier.",
+        default=1.0,
+    )
+    parser.add_argument(
+        "--loop",
+        action="store_true",
+        required=False,
+        help="Restart the episode from its first frame when it ends.",
+        default=False,
+    )
+    parser.add_argument(
+        "--seek",
+        type=float,
+        required=False,
+        help="The time in seconds of the episode to start the replay from.",
+        default=0.0,
+    )
 
     args = parser.parse_args()
 
@@ -113,11 +188,16 @@ def main():
         "name": args.name,
         "episode_path": os.getenv("PATH", args.path),
         "episode_id": int(os.getenv("EPISODE", args.episode)),
+        "rate": float(os.getenv("RATE")) if os.getenv("RATE") else args.rate,
+        "speed": float(os.getenv("SPEED", args.speed)),
+        "loop": args.loop or os.getenv("LOOP", "0").lower() in ["1", "true"],
+        "seek": float(os.getenv("SEEK", args.seek)),
     }
 
     print("Replay Client Configuration: ", config, flush=True)
 
     client = Client(config)
+
     client.run()
 
 
@@ -0,0 +1,164 @@
+"""
+Replay: loads an episode of a dataset once into contiguous NumPy arrays, and schedules its samples against absolute
+deadlines so that the replay does not drift from the timestamps of the dataset.
+"""
+
+import json
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def load_episode(
+    dataset_path: str, episode_id: int
+) -> tuple[np.ndarray, np.ndarray, pa.Array]:
+    """
+    Loads an episode of a dataset built by `datasets/build_dataset.py`.
+
+    Returns the timestamps of the frames in seconds from the start of the episode, the actions as a
+    (n_frames, n_joints) float32 matrix, and the names of the joints.
+    """
+    schema = pq.read_schema(dataset_path + "/dataset.parquet")
+
+    # The joints are stored once in the schema metadata, the datasets built before in a column repeated on every row
+    columns = ["episode_index", "timestamp", "action"]
+    if schema.metadata is None or b"joints" not in schema.metadata:
+        columns.append("joints")
+
+    table = pq.read_table(
+        dataset_path + "/dataset.parquet",
+        columns=columns,
+        filters=[("episode_index", "==", episode_id)],
+    )
+
+    if table.num_rows == 0:
+        raise ValueError(f"Episode {episode_id} not found in {dataset_path}.")
+
+    table = table.sort_by("timestamp")
+
+    # Timestamps of the dataset are in milliseconds
+    timestamps = table["timestamp"].to_numpy().astype(np.float64) / 1000
+    timestamps -= timestamps[0]
+
+    # The values of the list column are one contiguous buffer, viewed as a matrix without converting each row
+    action = table["action"].combine_chunks()
+    actions = np.ascontiguousarray(
+        action.flatten().to_numpy().reshape(len(action), -1), dtype=np.float32
+    )
+
+    if "joints" in table.column_names:
+        joints = table["joints"][0].values
+    else:
+        joints = pa.array(json.loads(schema.metadata[b"joints"]), pa.string())
+
+    return timestamps, actions, joints
+
+
+class Scheduler:
+    """
+    Drift-free scheduler of the samples of an episode.
+
+    Each sample has an absolute deadline `origin + time / speed` on the `time.perf_counter()` clock, where `origin` only
+    moves when seeking or looping, by exact durations. Late samples therefore never delay the following ones.
+
+    If `rate` is higher than the framerate of the dataset, samples are linearly interpolated between frames, once, when
+    the scheduler is created.
+    """
+
+    def __init__(
+        self,
+        timestamps: np.ndarray,
+        actions: np.ndarray,
+        rate: Optional[float] = None,
+        speed: float = 1.0,
+        loop: bool = False,
+    ):
+        """
+        Args:
+            timestamps: the timestamps of the frames in seconds, increasing.
+            actions: the (n_frames, n_joints) matrix of actions.
+            rate: the output rate in Hz, defaults to the timestamps of the dataset.
+            speed: the replay speed multiplier, 2.0 replays twice as fast.
+            loop: if True, the episode restarts from its first frame when it ends.
+        """
+        if speed <= 0:
+            raise ValueError("The replay speed must be positive.")
+
+        self.speed = speed
+        self.loop = loop
+
+        # Period between the last frame and the first one when looping
+        period = float(np.median(np.diff(timestamps))) if len(timestamps) > 1 else 0.0
+
+        if rate is None:
+            self.times = timestamps
+            self.positions = actions
+        else:
+            period = 1 / rate
+            self.times = np.arange(timestamps[0], timestamps[-1] + period / 2, period)
+
+            # Index of the frame before each output time, and weight of the next one
+            index = np.clip(
+                np.searchsorted(timestamps, self.times, side="right") - 1,
+                0,
+                max(len(timestamps) - 2, 0),
+            )
+            following = np.minimum(index + 1, len(timestamps) - 1)
+            span = timestamps[following] - timestamps[index]
+            weight = np.divide(
+                self.times - timestamps[index],
+                span,
+                out=np.zeros_like(self.times),
+                where=span > 0,
+            )
+            weight = np.clip(weight, 0, 1)[:, None].astype(np.float32)
+
+            self.positions = np.ascontiguousarray(
+                actions[index] * (1 - weight) + actions[following] * weight
+            )
+
+        self.duration = float(self.times[-1] - self.times[0]) + period
+
+        self.index = 0
+        self.origin = 0.0
+        self.loops = 0
+        self.skipped = 0
+
+    def seek(self, time: float, now: float):
+        """
+        Moves the replay to the first sample at or after `time` seconds of the episode, which is due at `now`.
+        """
+        self.index = min(
+            int(np.searchsorted(self.times, time, side="left")), len(self.times) - 1
+        )
+        self.origin = now - self.times[self.index] / self.speed
+
+    def deadline(self) -> Optional[float]:
+        """
+        Returns the deadline of the next sample, or None if the episode has ended.
+        """
+        if self.index >= len(self.times):
+            if not self.loop:
+                return None
+
+            self.index = 0
+            self.origin += self.duration / self.speed
+            self.loops += 1
+
+        return float(self.origin + self.times[self.index] / self.speed)
+
+    def pop(self, now: float) -> tuple[int, float]:
+        """
+        Returns the index of the most recent sample due at `now`, and its deadline. Older due samples are skipped, as
+        only the latest goal matters to the robot.
+        """
+        elapsed = (now - self.origin) * self.speed
+        last = int(np.searchsorted(self.times, elapsed, side="right")) - 1
+        last = min(max(last, self.index), len(self.times) - 1)
+
+        self.skipped += last - self.index
+        self.index = last + 1
+
+        return last, float(self.origin + self.times[last] / self.speed)
@@ -1,14 +1,12 @@
 import os
 from pathlib import Path
 
-import cv2
 import argparse
 
 import numpy as np
 import pyarrow as pa
 
 from dora import Node
-from ffmpeg import FFmpeg
 
 
 def main():
@@ -35,6 +33,9 @@ def main():
 
     node = Node(args.name)
 
+    # OpenCV is imported once the node is created, the dataflow does not wait for it
+    import cv2
+
     recording = False
     episode_index = 1
 
@@ -112,6 +113,9 @@ def main():
                     name = f"{video_name}_episode_{episode_index:06d}.mp4"
                     video_path = base / name
 
+                    # FFmpeg is only needed at the end of an episode, import it on first use
+                    from ffmpeg import FFmpeg
+
                     ffmpeg = (
                         FFmpeg()
                         .option("y")
@@ -11,15 +11,34 @@ The program will:
 9. Let the user verify in real time that the LCR is working properly.
 
 It will also enable all appropriate operating modes for the LCR.
+
+With --scan, the program instead looks for the motors connected to one or more ports, at every supported baud rate, and
+prints their IDs and models as a configuration the client can load.
+
+With --tune, the program instead tunes the bus timing of a configured LCR: it measures the round trip time of the
+position reads with the Return_Delay_Time of the motors set to 0 and at each higher baud rate, applies the fastest
+setting without missed answers, verifies it with a soak test, and saves it to the configuration file.
 """
 
+import os
 import argparse
 import time
 import json
 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
 import pyarrow as pa
 
-from bus import DynamixelBus, TorqueMode, OperatingMode
+from bus import (
+    DynamixelBus,
+    TorqueMode,
+    OperatingMode,
+    MODEL_NUMBERS,
+    BAUD_RATE,
+    BAUD_RATE_VALUES,
+)
 
 from pwm_position_control.transform import pwm_to_logical_arrow, wrap_joints_and_values
 
@@ -72,13 +91,321 @@ def configure_servos(bus: DynamixelBus):
     )
 
 
+def scan_port(port: str, motor_ids: list[int]) -> dict[int, dict[int, int]]:
+    bus = DynamixelBus(port, {})
+
+    try:
+        return bus.scan(motor_ids)
+    finally:
+        bus.close()
+
+
+def scan_config(found: dict[int, dict[int, int]]) -> dict[int, dict]:
+    """
+    Makes the client configuration of the motors found on a port at each baud rate, with the torque disabled. The motors
+    are named after the joints of the LCR when the IDs 1 to 6 were found, after their ID otherwise.
+    """
+    configs = {}
+    for baud_rate, model_numbers in found.items():
+        motor_ids = sorted(model_numbers)
+
+        if motor_ids == list(range(1, len(FULL_ARM) + 1)):
+            names = FULL_ARM.to_pylist()
+        else:
+            names = [f"motor_{motor_id}" for motor_id in motor_ids]
+
+        configs[baud_rate] = {
+            name: {
+                "id": motor_id,
+                "model": MODEL_NUMBERS.get(model_numbers[motor_id], "x_series"),
+                "model_number": model_numbers[motor_id],
+                "baud_rate": baud_rate,
+                "torque": False,
+                # Left unchanged on the motors by the client
+                "goal_current": None,
+                "P": None,
+                "I": None,
+                "D": None,
+            }
+            for name, motor_id in zip(names, motor_ids)
+        }
+
+    return configs
+
+
+def scan(ports: list[str], max_id: int, output: Optional[str]):
+    """
+    Scans the ports concurrently, and prints the configuration of the motors found on each port. With `output`, the
+    configuration of each bus is written to `output/<port>.json` (`output/<port>_<baud_rate>.json` if motors were found
+    at several baud rates on the port), which the client can load as CONFIG.
+    """
+    motor_ids = list(range(max_id + 1))
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        found = list(executor.map(lambda port: scan_port(port, motor_ids), ports))
+
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+
+    for port, motors in zip(ports, found):
+        configs = scan_config(motors)
+        if not configs:
+            print(f"{port}: no motor found.")
+
+        for baud_rate, config in configs.items():
+            print(
+                f"{port} at {baud_rate} baud: "
+                + ", ".join(
+                    f"{motor['id']} ({motor['model']})" for motor in config.values()
+                )
+            )
+            print(json.dumps(config, indent=2))
+
+            if output is None:
+                continue
+
+            name = os.path.basename(port)
+            if len(configs) > 1:
+                name += f"_{baud_rate}"
+
+            path = os.path.join(output, name + ".json")
+            with open(path, "w") as file:
+                json.dump(config, file, indent=2)
+
+            print(f"Written to {path}.")
+
+
+def measure_reads(bus: DynamixelBus, joints: pa.Array, duration: float) -> dict:
+    """
+    Reads the positions of the motors for `duration` seconds, and returns the read rate, the round trip times of the
+    reads and the number of answers missed.
+    """
+    missed = sum(bus.missed_answers.values())
+
+    round_trips = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        try:
+            bus.read_position(joints)
+        except ConnectionError:
+            pass
+        round_trips.append(time.perf_counter() - start)
+
+    round_trips_ms = np.array(round_trips) * 1000
+
+    return {
+        "rate_hz": len(round_trips) / duration,
+        "rtt_p50_ms": float(np.percentile(round_trips_ms, 50)),
+        "rtt_p99_ms": float(np.percentile(round_trips_ms, 99)),
+        "missed": sum(bus.missed_answers.values()) - missed,
+    }
+
+
+def apply_timing(
+    bus: DynamixelBus,
+    joints: pa.Array,
+    baud_rate: int,
+    return_delay_times: list[int],
+    status_return_levels: Optional[list[int]],
+):
+    bus.write_return_delay_time(
+        wrap_joints_and_values(joints, pa.array(return_delay_times, pa.uint32()))
+    )
+
+    if status_return_levels is not None:
+        bus.write_status_return_level(
+            wrap_joints_and_values(joints, pa.array(status_return_levels, pa.uint32()))
+        )
+
+    if baud_rate != bus.port_handler.getBaudRate():
+        bus.set_baud_rate(baud_rate)
+
+
+def find_motors(bus: DynamixelBus, motor_ids: list[int]) -> int:
+    """
+    Finds the baud rate of the motors with a scan, after a failed change of the bus timing left them at an unknown
+    baud rate, and sets the port to it.
+    """
+    for baud_rate, model_numbers in bus.scan(motor_ids).items():
+        if set(motor_ids) <= set(model_numbers):
+            bus.set_port_baud_rate(baud_rate)
+            return baud_rate
+
+    raise ConnectionError(
+        f"The motors {motor_ids} were not found at any baud rate on port {bus.port}."
+    )
+
+
+def read_all(read, joints: pa.Array, name: str) -> list[int]:
+    # The original values of all the motors are needed to restore them
+    values = read(joints).field("values").to_pylist()
+    if None in values:
+        raise ConnectionError(
+            f"The {name} of the motors {joints.to_pylist()} could not be read: {values}."
+        )
+
+    return values
+
+
+def tune(
+    port: str,
+    config_path: str,
+    measure_seconds: float,
+    soak_seconds: float,
+    status_return_level: Optional[int],
+):
+    """
+    Tunes the bus timing of the motors of the configuration `config_path`, and saves the tuned baud rate, return delay
+    time and status return level in the configuration of each motor.
+    """
+    with open(config_path) as file:
+        config = json.load(file)
+
+    joints = pa.array(list(config.keys()), pa.string())
+    motor_ids = [config[joint]["id"] for joint in config]
+    baud_rate = next(iter(config.values())).get("baud_rate", BAUD_RATE)
+
+    bus = DynamixelBus(
+        port,
+        {joint: (config[joint]["id"], config[joint]["model"]) for joint in config},
+        baud_rate=baud_rate,
+        read_retries=0,
+    )
+
+    # The Return_Delay_Time and Baud_Rate registers are only written while the torque is disabled
+    print("Disabling the torque of the motors.")
+    bus.write_torque_enable(
+        wrap_joints_and_values(joints, [TorqueMode.DISABLED.value] * len(joints))
+    )
+
+    original = (
+        baud_rate,
+        read_all(bus.read_return_delay_time, joints, "Return_Delay_Time"),
+        read_all(bus.read_status_return_level, joints, "Status_Return_Level"),
+    )
+
+    status_return_levels = None
+    if status_return_level is not None:
+        status_return_levels = [status_return_level] * len(joints)
+
+    # The current timing, then no return delay at the current and each higher baud rate supported by the motors and
+    # the port
+    settings = [original]
+    for candidate in BAUD_RATE_VALUES:
+        if candidate < baud_rate:
+            continue
+
+        if not bus.supports_baud_rate(candidate):
+            print(f"{candidate} baud is not supported by port {port}, skipped.")
+            continue
+
+        settings.append((candidate, [0] * len(joints), status_return_levels))
+
+    print(
+        f"{'baud rate':>10}{'delay us':>10}{'rate Hz':>10}{'p50 ms':>10}{'p99 ms':>10}{'missed':>8}"
+    )
+
+    def try_setting(setting, seconds: float) -> Optional[dict]:
+        candidate, delays, _ = setting
+
+        try:
+            apply_timing(bus, joints, *setting)
+            return measure_reads(bus, joints, seconds)
+        except (ConnectionError, OSError) as e:
+            print(f"{candidate:>10}{2 * max(delays):>10}  unusable: {e}")
+
+        # The motors may have switched to the baud rate while the port did not
+        print(f"Motors found at {find_motors(bus, motor_ids)} baud.")
+        return None
+
+    results = []
+    for setting in settings:
+        result = try_setting(setting, measure_seconds)
+        if result is None:
+            if setting is original:
+                bus.close()
+                raise ConnectionError(
+                    "The reads failed with the original bus timing, please check the configuration and the "
+                    "connection."
+                )
+            continue
+
+        candidate, delays, _ = setting
+        print(
+            f"{candidate:>10}{2 * max(delays):>10}{result['rate_hz']:>10.1f}{result['rtt_p50_ms']:>10.2f}"
+            f"{result['rtt_p99_ms']:>10.2f}{result['missed']:>8}"
+        )
+        results.append((setting, result))
+
+    before = results[0][1]
+
+    # The fastest settings without missed answers are verified in turn with a soak test
+    tuned = None
+    for setting, _ in sorted(
+        (result for result in results if result[1]["missed"] == 0),
+        key=lambda result: result[1]["rtt_p50_ms"],
+    ):
+        candidate, delays, _ = setting
+        print(f"Soak test at {candidate} baud, {2 * max(delays)} us return delay...")
+
+        soak = try_setting(setting, soak_seconds)
+        if soak is None:
+            continue
+
+        if soak["missed"] == 0:
+            tuned = (setting, soak)
+            break
+
+        print(f"Soak test failed: {soak['missed']} answers missed.")
+
+    if tuned is None:
+        try:
+            apply_timing(bus, joints, *original)
+        except (ConnectionError, OSError):
+            find_motors(bus, motor_ids)
+            apply_timing(bus, joints, *original)
+
+        bus.close()
+
+        raise ConnectionError(
+            "No stable bus timing found, the original baud rate, return delay time and status return level were "
+            "restored."
+        )
+
+    (candidate, delays, levels), soak = tuned
+
+    for i, joint in enumerate(config):
+        config[joint]["baud_rate"] = candidate
+        config[joint]["return_delay_time"] = delays[i]
+        if levels is not None:
+            config[joint]["status_return_level"] = levels[i]
+
+    with open(config_path, "w") as file:
+        json.dump(config, file)
+
+    print(
+        f"Tuned to {candidate} baud and {2 * max(delays)} us return delay, saved to {config_path}. Read rate: "
+        f"{before['rate_hz']:.1f} Hz before, {soak['rate_hz']:.1f} Hz after (p99 round trip "
+        f"{before['rtt_p99_ms']:.2f} ms before, {soak['rtt_p99_ms']:.2f} ms after)."
+    )
+
+    bus.close()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="LCR Auto Configure: This program is used to automatically configure the Low Cost Robot (LCR) for "
         "the user."
     )
 
-    parser.add_argument("--port", type=str, required=True, help="The port of the LCR.")
+    parser.add_argument("--port", type=str, required=False, help="The port of the LCR.")
+    parser.add_argument(
+        "--baudrate",
+        type=int,
+        default=BAUD_RATE,
+        help="The baud rate of the LCR, if it was changed by --tune.",
+    )
     parser.add_argument(
         "--right",
         action="store_true",
@@ -98,8 +425,73 @@ def main():
         "--leader", action="store_true", help="If the LCR is the leader of the user."
     )
 
+    parser.add_argument(
+        "--scan",
+        type=str,
+        nargs="+",
+        metavar="PORT",
+        help="Scan the ports for motors at every supported baud rate, instead of configuring the LCR.",
+    )
+    parser.add_argument(
+        "--max-id",
+        type=int,
+        default=20,
+        help="The highest motor ID scanned.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="The folder of the client configurations written by the scan, one per bus.",
+    )
+
+    parser.add_argument(
+        "--tune",
+        type=str,
+        default=None,
+        metavar="CONFIG",
+        help="Tune the bus timing of the LCR on --port configured by CONFIG, instead of configuring it.",
+    )
+    parser.add_argument(
+        "--measure-seconds",
+        type=float,
+        default=1.0,
+        help="The duration of the measure of each bus timing by --tune.",
+    )
+    parser.add_argument(
+        "--soak-seconds",
+        type=float,
+        default=30.0,
+        help="The duration of the soak test of the tuned bus timing.",
+    )
+    parser.add_argument(
+        "--status-return-level",
+        type=int,
+        choices=[1, 2],
+        default=None,
+        help="The Status_Return_Level set by --tune, unchanged by default. 0 is not supported, the motors would no "
+        "longer answer the reads.",
+    )
+
     args = parser.parse_args()
 
+    if args.scan is not None:
+        scan(args.scan, args.max_id, args.output)
+        return
+
+    if args.port is None:
+        raise ValueError("You must specify --port, or --scan.")
+
+    if args.tune is not None:
+        tune(
+            args.port,
+            args.tune,
+            args.measure_seconds,
+            args.soak_seconds,
+            args.status_return_level,
+        )
+        return
+
     if args.right and args.left:
         raise ValueError("You cannot specify both --right and --left.")
 
@@ -121,6 +513,7 @@ def main():
             "wrist_roll": (5, "x_series"),
             "gripper": (6, "x_series"),
         },
+        baud_rate=args.baudrate,
     )
 
     configure_servos(arm)
@@ -155,6 +548,7 @@ def main():
         control_table_json[FULL_ARM[i].as_py()] = {
             "id": i + 1,
             "model": model,
+            "baud_rate": args.baudrate,
             "torque": (
                 True if args.follower else True if args.leader and i == 5 else False
             ),
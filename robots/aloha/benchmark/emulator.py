@@ -0,0 +1,439 @@
+"""
+Emulated Dynamixel servos: each bus is a pseudo-terminal that answers Dynamixel Protocol 2.0 instruction packets like a
+chain of X series servos, so that the Dynamixel SDK, the dora nodes and the Rust nodes can open it as a serial port and
+run unchanged, without the arms.
+
+The timing of a real bus is emulated: an answer is delivered after the transmission time of the instruction and the
+status packets at the baud rate, the return delay time of each servo, and the latency of the USB-serial adapter.
+
+The servos of a `leader` bus follow a scripted trajectory, as if moved by hand. The first servo encodes a counter in its
+position, so that the follower goals can be matched to the leader reads: the latency of the teleoperation loop is
+measured from the leader read to the follower write of the same position, whatever the implementation in between.
+"""
+
+import os
+import time
+import random
+import tty
+import select
+import termios
+import threading
+import multiprocessing
+
+import numpy as np
+
+HEADER = b"\xff\xff\xfd\x00"
+BROADCAST_ID = 0xFE
+
+PING = 0x01
+READ = 0x02
+WRITE = 0x03
+REBOOT = 0x08
+STATUS = 0x55
+SYNC_READ = 0x82
+SYNC_WRITE = 0x83
+
+
+# Model number of the XM430-W350, the servos of the aloha arms
+MODEL_NUMBER = 1020
+
+ADDRESS_MODEL_NUMBER = 0
+ADDRESS_ID = 7
+ADDRESS_BAUD_RATE = 8
+ADDRESS_RETURN_DELAY_TIME = 9
+ADDRESS_TORQUE_ENABLE = 64
+ADDRESS_STATUS_RETURN_LEVEL = 68
+ADDRESS_GOAL_POSITION = 116
+ADDRESS_PRESENT_POSITION = 132
+
+# Baud rates of the Baud_Rate register of the X series
+BAUD_RATES = {
+    0: 9600,
+    1: 57600,
+    2: 115200,
+    3: 1_000_000,
+    4: 2_000_000,
+    5: 3_000_000,
+    6: 4_000_000,
+}
+
+TERMIOS_BAUD_RATES = {
+    getattr(termios, f"B{rate}"): rate
+    for rate in BAUD_RATES.values()
+    if hasattr(termios, f"B{rate}")
+}
+
+CRC_TABLE = []
+for _i in range(256):
+    _crc = _i << 8
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x8005) if _crc & 0x8000 else (_crc << 1)
+    CRC_TABLE.append(_crc & 0xFFFF)
+
+
+def crc16(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) ^ CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]) & 0xFFFF
+    return crc
+
+
+def add_stuffing(data: bytes) -> bytes:
+    return data.replace(b"\xff\xff\xfd", b"\xff\xff\xfd\xfd")
+
+
+def remove_stuffing(data: bytes) -> bytes:
+    return data.replace(b"\xff\xff\xfd\xfd", b"\xff\xff\xfd")
+
+
+def status_packet(servo_id: int, error: int, parameters: bytes) -> bytes:
+    body = add_stuffing(bytes([STATUS, error]) + parameters)
+    packet = HEADER + bytes([servo_id]) + (len(body) + 2).to_bytes(2, "little") + body
+    return packet + crc16(packet).to_bytes(2, "little")
+
+
+class Servo:
+    """
+    The control table of an emulated X series servo.
+    """
+
+    def __init__(self, servo_id: int, baud_rate: int, return_delay_time: int):
+        self.memory = bytearray(256)
+
+        self.write(ADDRESS_MODEL_NUMBER, MODEL_NUMBER.to_bytes(2, "little"))
+        self.write(ADDRESS_ID, bytes([servo_id]))
+        self.write(
+            ADDRESS_BAUD_RATE,
+            bytes([{rate: value for value, rate in BAUD_RATES.items()}[baud_rate]]),
+        )
+        self.write(ADDRESS_RETURN_DELAY_TIME, bytes([return_delay_time]))
+        self.write(ADDRESS_STATUS_RETURN_LEVEL, bytes([2]))
+        self.write(ADDRESS_PRESENT_POSITION, (2048).to_bytes(4, "little"))
+        self.write(ADDRESS_GOAL_POSITION, (2048).to_bytes(4, "little"))
+
+    @property
+    def id(self) -> int:
+        return self.memory[ADDRESS_ID]
+
+    @property
+    def baud_rate(self) -> int:
+        return BAUD_RATES.get(self.memory[ADDRESS_BAUD_RATE], 0)
+
+    @property
+    def return_delay(self) -> float:
+        # Return_Delay_Time is in units of 2 us
+        return self.memory[ADDRESS_RETURN_DELAY_TIME] * 2e-6
+
+    @property
+    def status_return_level(self) -> int:
+        return self.memory[ADDRESS_STATUS_RETURN_LEVEL]
+
+    def read(self, address: int, length: int) -> bytes:
+        return bytes(self.memory[address : address + length])
+
+    def write(self, address: int, data: bytes):
+        self.memory[address : address + len(data)] = data
+
+
+class EmulatedBus:
+    """
+    A chain of emulated servos behind a pseudo-terminal, served by a thread.
+    """
+
+    def __init__(
+        self,
+        ids: list[int],
+        role: str = "follower",
+        baud_rate: int = 1_000_000,
+        return_delay_time: int = 0,
+        usb_latency: float = 0.001,
+        drop_rate: float = 0.0,
+    ):
+        """
+        Args:
+            ids: the IDs of the servos of the chain.
+            role: `leader` for servos following a scripted trajectory, `follower` for servos reaching their goal.
+            baud_rate: the baud rate of the servos.
+            return_delay_time: the Return_Delay_Time of the servos, in units of 2 us.
+            usb_latency: the latency added by the USB-serial adapter to each answer, in seconds.
+            drop_rate: the probability that a servo does not answer a read, as on a marginal link.
+        """
+        self.servos = {
+            servo_id: Servo(servo_id, baud_rate, return_delay_time) for servo_id in ids
+        }
+        self.role = role
+        self.usb_latency = usb_latency
+        self.drop_rate = drop_rate
+        self.random = random.Random(0)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+
+        self.start = time.perf_counter()
+        self.running = True
+
+        # Marker positions of the first servo of a leader and the time they were read
+        self.marker_id = min(ids)
+        self.marker = 0
+        self.marker_times = {}
+
+        # Timestamps of the goal position writes, and the (timestamp, latency) of the ones carrying a leader marker
+        self.goal_times = []
+        self.latencies = []
+        self.leader = None
+
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def host_baud_rate(self) -> int:
+        """
+        The baud rate the host configured on its side of the pseudo-terminal.
+        """
+        speed = termios.tcgetattr(self.master)[5]
+        return TERMIOS_BAUD_RATES.get(speed, 0)
+
+    def dropped(self) -> bool:
+        return self.drop_rate > 0 and self.random.random() < self.drop_rate
+
+    def update_leader(self):
+        now = time.perf_counter() - self.start
+
+        for index, (servo_id, servo) in enumerate(self.servos.items()):
+            if servo_id == self.marker_id:
+                self.marker = (self.marker + 1) % 2048
+                position = 1024 + self.marker
+                self.marker_times[position] = time.perf_counter()
+            else:
+                position = int(
+                    2048 + 600 * np.sin(2 * np.pi * now / (2.0 + 0.5 * index))
+                )
+
+            servo.write(ADDRESS_PRESENT_POSITION, position.to_bytes(4, "little"))
+
+    def on_goal_position(self, servo: Servo):
+        position = int.from_bytes(servo.read(ADDRESS_GOAL_POSITION, 4), "little")
+
+        # The follower reaches its goal instantly when its torque is enabled
+        if servo.memory[ADDRESS_TORQUE_ENABLE]:
+            servo.write(ADDRESS_PRESENT_POSITION, servo.read(ADDRESS_GOAL_POSITION, 4))
+
+        if servo.id != self.marker_id:
+            return
+
+        now = time.perf_counter()
+        self.goal_times.append(now)
+
+        if self.leader is not None:
+            # Conversions to radians and back may round the position by one unit
+            for candidate in [position, position - 1, position + 1]:
+                read_time = self.leader.marker_times.get(candidate)
+                if read_time is not None:
+                    self.latencies.append((now, now - read_time))
+                    break
+
+    def serve(self):
+        buffer = b""
+
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+
+            try:
+                buffer += os.read(self.master, 4096)
+            except OSError:
+                return
+
+            received = time.perf_counter()
+
+            while True:
+                start = buffer.find(HEADER)
+                if start < 0:
+                    buffer = buffer[-3:]
+                    break
+
+                buffer = buffer[start:]
+                if len(buffer) < 7:
+                    break
+
+                length = int.from_bytes(buffer[5:7], "little")
+                if len(buffer) < 7 + length:
+                    break
+
+                packet, buffer = buffer[: 7 + length], buffer[7 + length :]
+                self.handle(packet, received)
+
+    def handle(self, packet: bytes, received: float):
+        if crc16(packet[:-2]) != int.from_bytes(packet[-2:], "little"):
+            return
+
+        # Servos at another baud rate than the host only receive noise
+        host_baud_rate = self.host_baud_rate()
+        servos = [
+            servo
+            for servo in self.servos.values()
+            if host_baud_rate in [0, servo.baud_rate]
+        ]
+
+        servo_id = packet[4]
+        instruction = packet[7]
+        parameters = remove_stuffing(packet[8:-2])
+
+        answers = []
+
+        if instruction == PING:
+            for servo in servos:
+                if servo_id in [servo.id, BROADCAST_ID]:
+                    answers.append(
+                        (servo, status_packet(servo.id, 0, servo.read(0, 3)))
+                    )
+
+        elif instruction in [READ, WRITE, REBOOT]:
+            for servo in servos:
+                if servo.id != servo_id:
+                    continue
+
+                address = int.from_bytes(parameters[0:2], "little")
+                data = b""
+
+                if instruction == READ:
+                    if self.role == "leader" and address == ADDRESS_PRESENT_POSITION:
+                        self.update_leader()
+                    data = servo.read(
+                        address, int.from_bytes(parameters[2:4], "little")
+                    )
+                elif instruction == WRITE:
+                    servo.write(address, parameters[2:])
+                    if address == ADDRESS_GOAL_POSITION:
+                        self.on_goal_position(servo)
+
+                if instruction == READ and self.dropped():
+                    continue
+
+                # Status_Return_Level 1 only answers READ and PING, 0 only PING
+                if instruction == READ or servo.status_return_level == 2:
+                    answers.append((servo, status_packet(servo.id, 0, data)))
+
+        elif instruction == SYNC_READ:
+            address = int.from_bytes(parameters[0:2], "little")
+            length = int.from_bytes(parameters[2:4], "little")
+
+            if self.role == "leader" and address == ADDRESS_PRESENT_POSITION:
+                self.update_leader()
+
+            by_id = {servo.id: servo for servo in servos}
+            for requested in parameters[4:]:
+                servo = by_id.get(requested)
+                if servo is not None and not self.dropped():
+                    answers.append(
+                        (servo, status_packet(servo.id, 0, servo.read(address, length)))
+                    )
+
+        elif instruction == SYNC_WRITE:
+            address = int.from_bytes(parameters[0:2], "little")
+            length = int.from_bytes(parameters[2:4], "little")
+
+            by_id = {servo.id: servo for servo in servos}
+            for offset in range(4, len(parameters), length + 1):
+                servo = by_id.get(parameters[offset])
+                if servo is None:
+                    continue
+
+                servo.write(address, parameters[offset + 1 : offset + 1 + length])
+                if address == ADDRESS_GOAL_POSITION:
+                    self.on_goal_position(servo)
+
+        if not answers:
+            return
+
+        # The instruction is transmitted, then each servo waits its return delay and transmits its status
+        baud_rate = answers[0][0].baud_rate
+        wire = len(packet) * 10 / baud_rate
+        for servo, answer in answers:
+            wire += servo.return_delay + len(answer) * 10 / baud_rate
+
+        deadline = received + wire + self.usb_latency
+        while time.perf_counter() < deadline:
+            remaining = deadline - time.perf_counter()
+            if remaining > 2e-4:
+                time.sleep(remaining - 1e-4)
+
+        os.write(self.master, b"".join(answer for _, answer in answers))
+
+    def statistics(self) -> dict:
+        return {
+            "goal_times": list(self.goal_times),
+            "latencies": list(self.latencies),
+        }
+
+    def close(self):
+        self.running = False
+        os.close(self.slave)
+        os.close(self.master)
+
+
+def run_emulator(buses: list[dict], connection):
+    """
+    Runs emulated buses in this process: sends their paths through `connection`, serves them until any message is
+    received, then sends back their statistics.
+    """
+    emulated = [
+        EmulatedBus(**{k: v for k, v in bus.items() if k != "leader"}) for bus in buses
+    ]
+
+    for bus, emulated_bus in zip(buses, emulated):
+        if bus.get("leader") is not None:
+            emulated_bus.leader = emulated[bus["leader"]]
+
+    for emulated_bus in emulated:
+        emulated_bus.thread.start()
+
+    connection.send([emulated_bus.path for emulated_bus in emulated])
+    connection.recv()
+
+    for emulated_bus in emulated:
+        emulated_bus.running = False
+        emulated_bus.thread.join()
+
+    connection.send([emulated_bus.statistics() for emulated_bus in emulated])
+
+    for emulated_bus in emulated:
+        emulated_bus.close()
+
+
+class Emulator:
+    """
+    Emulated buses served by a separate process, so that the emulation does not compete for the GIL with a benchmarked
+    implementation running in this process.
+
+    Example:
+        with Emulator([{"ids": [1, 2], "role": "leader"}, {"ids": [1, 2], "leader": 0}]) as emulator:
+            leader_path, follower_path = emulator.paths
+            ...
+        statistics = emulator.statistics
+    """
+
+    def __init__(self, buses: list[dict]):
+        """
+        Args:
+            buses: the keyword arguments of each `EmulatedBus`, and for a follower the index of its `leader` bus.
+        """
+        self.buses = buses
+        self.paths = []
+        self.statistics = []
+
+    def __enter__(self):
+        self.connection, child = multiprocessing.Pipe()
+
+        self.process = multiprocessing.get_context("fork").Process(
+            target=run_emulator, args=(self.buses, child), daemon=True
+        )
+        self.process.start()
+
+        self.paths = self.connection.recv()
+        return self
+
+    def __exit__(self, *exc):
+        self.connection.send("stop")
+        self.statistics = self.connection.recv()
+        self.process.join()
@@ -0,0 +1,511 @@
+"""
+Teleoperation benchmark: drives the leader -> follower loop of an implementation against emulated servos (see
+`emulator.py`), and records its loop rate, jitter, end-to-end latency and read/write latencies in a JSON report, with
+the raw samples in an optional parquet file.
+
+Implementations:
+    robot: the `Robot` class of `python/robot.py`, reading the leader and writing the follower in a loop.
+    bus: the `DynamixelBus` of the dynamixel-client node, in the same loop, without dora.
+    dora: two dynamixel-client nodes in a dora dataflow, the leader position is written as the follower goal.
+    fused: the Rust `aloha-teleop` node, reading and writing both arms in one process.
+
+The loop rate and latency are measured by the emulated servos, so they are comparable between implementations. The
+read and write latencies are measured around the calls of the in-process implementations (robot, bus).
+
+Usage:
+    python teleop_benchmark.py --implementation bus --duration 10 --output reports/bus.json
+    python teleop_benchmark.py --compare reports/robot.json reports/bus.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from emulator import Emulator
+
+BENCHMARK_PATH = Path(__file__).resolve().parent
+ROOT_PATH = BENCHMARK_PATH.parents[2]
+
+IMPLEMENTATIONS = ["robot", "bus", "dora", "fused"]
+
+# Histogram bins shared by all reports, 10 per decade from 10 us to 1 s
+HISTOGRAM_BINS_MS = np.logspace(-2, 3, 51)
+
+
+def run_robot(paths: list[str], ids: list[int], args) -> dict:
+    sys.path.insert(0, str(BENCHMARK_PATH / "python"))
+
+    from robot import Robot
+    from dynamixel import Dynamixel
+
+    leader = Robot(
+        Dynamixel.Config(baudrate=args.baudrate, device_name=paths[0]).instantiate(),
+        servo_ids=ids,
+    )
+    follower = Robot(
+        Dynamixel.Config(baudrate=args.baudrate, device_name=paths[1]).instantiate(),
+        servo_ids=ids,
+    )
+
+    # Switch the follower to position control before measuring
+    follower.set_goal_pos(leader.read_position())
+
+    reads = []
+    writes = []
+
+    end = time.perf_counter() + args.duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        position = leader.read_position()
+        read = time.perf_counter()
+        follower.set_goal_pos(position)
+        writes.append(time.perf_counter() - read)
+        reads.append(read - start)
+
+    return {"read": reads, "write": writes}
+
+
+def run_bus(paths: list[str], ids: list[int], args) -> dict:
+    import pyarrow as pa
+
+    from dynamixel_client.bus import DynamixelBus, TorqueMode, wrap_joints_and_values
+
+    joints = pa.array([f"joint_{servo_id}" for servo_id in ids], pa.string())
+    description = {
+        joint: (servo_id, "x_series")
+        for joint, servo_id in zip(joints.to_pylist(), ids)
+    }
+
+    leader = DynamixelBus(paths[0], description, read_budget_ms=args.read_budget_ms)
+    follower = DynamixelBus(paths[1], description)
+
+    follower.write_torque_enable(
+        wrap_joints_and_values(joints, [TorqueMode.ENABLED.value] * len(joints))
+    )
+
+    reads = []
+    writes = []
+
+    end = time.perf_counter() + args.duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        try:
+            position = leader.read_position(joints)
+        except ConnectionError:
+            # No servo answered within the read budget, the goal is not written
+            continue
+        read = time.perf_counter()
+        follower.write_goal_position(position)
+        writes.append(time.perf_counter() - read)
+        reads.append(read - start)
+
+    errors = leader.read_errors(joints).to_pylist()
+
+    leader.close()
+    follower.close()
+
+    return {"read": reads, "write": writes, "read_errors": errors}
+
+
+def dynamixel_config(ids: list[int], torque: bool) -> dict:
+    return {
+        f"joint_{servo_id}": {
+            "id": servo_id,
+            "model": "x_series",
+            "torque": torque,
+            "P": 800,
+            "I": 0,
+            "D": 0,
+            "goal_current": 1000,
+        }
+        for servo_id in ids
+    }
+
+
+def run_dora(paths: list[str], ids: list[int], args) -> dict:
+    if shutil.which("dora") is None:
+        raise RuntimeError("The dora CLI is required by the dora implementation.")
+
+    directory = Path(tempfile.mkdtemp(prefix="teleop-benchmark-"))
+
+    for name, torque in [("leader", False), ("follower", True)]:
+        with open(directory / f"{name}.json", "w") as file:
+            json.dump(dynamixel_config(ids, torque), file)
+
+    graph = f"""nodes:
+  - id: leader
+    path: dynamixel-client
+    inputs:
+      pull_position: dora/timer/millis/{args.period_ms}
+    outputs:
+      - position
+    env:
+      PORT: {paths[0]}
+      CONFIG: {directory / "leader.json"}
+
+  - id: follower
+    path: dynamixel-client
+    inputs:
+      write_goal_position: leader/position
+    env:
+      PORT: {paths[1]}
+      CONFIG: {directory / "follower.json"}
+"""
+    with open(directory / "graph.yml", "w") as file:
+        file.write(graph)
+
+    name = directory.name
+    subprocess.run(["dora", "up"], check=True)
+    subprocess.run(
+        ["dora", "start", str(directory / "graph.yml"), "--name", name, "--detach"],
+        check=True,
+    )
+
+    try:
+        time.sleep(args.duration)
+    finally:
+        subprocess.run(["dora", "stop", "--name", name], check=False)
+
+    return {}
+
+
+def run_fused(paths: list[str], ids: list[int], args) -> dict:
+    command = args.fused_command.split() + [
+        "--master-left-path",
+        paths[0],
+        "--puppet-left-path",
+        paths[1],
+        "--master-right-path",
+        paths[2],
+        "--puppet-right-path",
+        paths[3],
+    ]
+
+    # Outside of a dataflow, aloha-teleop only runs the teleoperation threads
+    env = {key: value for key, value in os.environ.items() if key != "DORA_NODE_CONFIG"}
+
+    process = subprocess.Popen(command, cwd=ROOT_PATH, env=env)
+
+    try:
+        time.sleep(args.duration)
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}")
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {}
+
+
+RUNNERS = {
+    "robot": run_robot,
+    "bus": run_bus,
+    "dora": run_dora,
+    "fused": run_fused,
+}
+
+
+def summarize(values_ms: np.ndarray) -> dict:
+    if len(values_ms) == 0:
+        return {"count": 0}
+
+    counts, _ = np.histogram(values_ms, bins=HISTOGRAM_BINS_MS)
+
+    return {
+        "count": int(len(values_ms)),
+        "mean": float(np.mean(values_ms)),
+        "std": float(np.std(values_ms)),
+        "p50": float(np.percentile(values_ms, 50)),
+        "p90": float(np.percentile(values_ms, 90)),
+        "p99": float(np.percentile(values_ms, 99)),
+        "max": float(np.max(values_ms)),
+        "histogram": counts.tolist(),
+    }
+
+
+def run(args) -> tuple[dict, dict]:
+    ids = list(range(1, args.servos + 1))
+
+    bus = {
+        "ids": ids,
+        "baud_rate": args.baudrate,
+        "return_delay_time": args.return_delay_time,
+        "usb_latency": args.usb_latency_ms / 1000,
+        "drop_rate": args.drop_rate,
+    }
+
+    # A leader and a follower, and a second arm for the fused node which drives both arms of the aloha
+    buses = [
+        {**bus, "role": "leader"},
+        {**bus, "role": "follower", "leader": 0},
+    ]
+    if args.implementation == "fused":
+        buses += [
+            {**bus, "role": "leader"},
+            {**bus, "role": "follower", "leader": 2},
+        ]
+
+    with Emulator(buses) as emulator:
+        client = RUNNERS[args.implementation](emulator.paths, ids, args)
+
+    # The first follower is measured, the goals of the warmup are skipped
+    statistics = emulator.statistics[1]
+    goal_times = np.array(statistics["goal_times"])
+    latencies = np.array(statistics["latencies"]).reshape(-1, 2)
+
+    if len(goal_times) > 0:
+        start = goal_times[0] + args.warmup
+        goal_times = goal_times[goal_times >= start]
+        latencies = latencies[latencies[:, 0] >= start]
+
+    periods_ms = np.diff(goal_times) * 1000
+    latencies_ms = latencies[:, 1] * 1000
+    reads_ms = np.array(client.get("read", [])) * 1000
+    writes_ms = np.array(client.get("write", [])) * 1000
+
+    rate = 0.0
+    if len(goal_times) > 1:
+        rate = (len(goal_times) - 1) / (goal_times[-1] - goal_times[0])
+
+    report = {
+        "implementation": args.implementation,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "config": {
+            "servos": args.servos,
+            "baudrate": args.baudrate,
+            "return_delay_time": args.return_delay_time,
+            "usb_latency_ms": args.usb_latency_ms,
+            "drop_rate": args.drop_rate,
+            "read_budget_ms": args.read_budget_ms,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "period_ms": args.period_ms,
+        },
+        "histogram_bins_ms": HISTOGRAM_BINS_MS.tolist(),
+        "loop_rate_hz": rate,
+        "period_ms": summarize(periods_ms),
+        "latency_ms": summarize(latencies_ms),
+        "read_ms": summarize(reads_ms),
+        "write_ms": summarize(writes_ms),
+    }
+
+    if "read_errors" in client:
+        report["read_errors"] = client["read_errors"]
+
+    samples = {
+        "period": periods_ms,
+        "latency": latencies_ms,
+        "read": reads_ms,
+        "write": writes_ms,
+    }
+
+    return report, samples
+
+
+def write_parquet(samples: dict, path: str):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    metrics = [metric for metric, values in samples.items() for _ in values]
+    values = np.concatenate([values for values in samples.values()])
+
+    pq.write_table(
+        pa.table({"metric": pa.array(metrics, pa.string()), "value_ms": values}), path
+    )
+
+
+def compare(paths: list[str]):
+    """
+    Prints the main metrics of the reports side by side, relative to the first report.
+    """
+    reports = []
+    for path in paths:
+        with open(path) as file:
+            reports.append(json.load(file))
+
+    metrics = [
+        ("loop rate (Hz)", lambda report: report["loop_rate_hz"]),
+        ("period p50 (ms)", lambda report: report["period_ms"].get("p50")),
+        ("period p99 (ms)", lambda report: report["period_ms"].get("p99")),
+        ("jitter std (ms)", lambda report: report["period_ms"].get("std")),
+        ("latency p50 (ms)", lambda report: report["latency_ms"].get("p50")),
+        ("latency p99 (ms)", lambda report: report["latency_ms"].get("p99")),
+        ("read p50 (ms)", lambda report: report["read_ms"].get("p50")),
+        ("write p50 (ms)", lambda report: report["write_ms"].get("p50")),
+    ]
+
+    names = [
+        f"{report['implementation']} ({Path(path).stem})"
+        for report, path in zip(reports, paths)
+    ]
+    width = max(24, *(len(name) + 2 for name in names))
+
+    print(f"{'':<18}" + "".join(f"{name:>{width}}" for name in names))
+
+    for label, metric in metrics:
+        baseline = metric(reports[0])
+        row = f"{label:<18}"
+
+        for report in reports:
+            value = metric(report)
+            if value is None:
+                cell = "-"
+            elif report is reports[0] or not baseline:
+                cell = f"{value:.2f}"
+            else:
+                cell = f"{value:.2f} ({100 * (value - baseline) / baseline:+.0f}%)"
+            row += f"{cell:>{width}}"
+
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Teleoperation benchmark: drives the leader -> follower loop of an implementation against "
+        "emulated servos."
+    )
+
+    parser.add_argument(
+        "--implementation",
+        type=str,
+        choices=IMPLEMENTATIONS,
+        required=False,
+        help="The implementation of the teleoperation loop to benchmark.",
+        default=None,
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        nargs="+",
+        required=False,
+        help="Compare the reports of previous runs instead of running the benchmark.",
+        default=None,
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        required=False,
+        help="The duration of the measure, in seconds.",
+        default=10.0,
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        required=False,
+        help="The duration at the start of the loop that is not measured, in seconds.",
+        default=1.0,
+    )
+    parser.add_argument(
+        "--servos",
+        type=int,
+        required=False,
+        help="The number of servos of each arm.",
+        default=9,
+    )
+    parser.add_argument(
+        "--baudrate",
+        type=int,
+        required=False,
+        help="The baud rate of the emulated servos.",
+        default=1_000_000,
+    )
+    parser.add_argument(
+        "--return-delay-time",
+        type=int,
+        required=False,
+        help="The Return_Delay_Time of the emulated servos, in units of 2 us.",
+        default=0,
+    )
+    parser.add_argument(
+        "--usb-latency-ms",
+        type=float,
+        required=False,
+        help="The latency of the emulated USB-serial adapters, 1 ms for an FTDI adapter with a latency timer of 1.",
+        default=1.0,
+    )
+    parser.add_argument(
+        "--drop-rate",
+        type=float,
+        required=False,
+        help="The probability that an emulated servo does not answer a read.",
+        default=0.0,
+    )
+    parser.add_argument(
+        "--read-budget-ms",
+        type=float,
+        required=False,
+        help="The read budget of the DynamixelBus of the bus implementation, retries included.",
+        default=None,
+    )
+    parser.add_argument(
+        "--period-ms",
+        type=int,
+        required=False,
+        help="The period of the position pulls of the dora implementation.",
+        default=10,
+    )
+    parser.add_argument(
+        "--fused-command",
+        type=str,
+        required=False,
+        help="The command running the fused node, from the root of the repository.",
+        default="cargo run -p aloha-teleop --release --",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=False,
+        help="The path of the JSON report.",
+        default=None,
+    )
+    parser.add_argument(
+        "--parquet",
+        type=str,
+        required=False,
+        help="The path of a parquet file of the raw samples.",
+        default=None,
+    )
+
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        compare(args.compare)
+        return
+
+    if args.implementation is None:
+        raise ValueError(
+            "Please set the --implementation to benchmark, or --compare reports."
+        )
+
+    report, samples = run(args)
+
+    output = args.output or f"reports/{args.implementation}.json"
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    if args.parquet is not None:
+        write_parquet(samples, args.parquet)
+
+    print(
+        f"{args.implementation}: {report['loop_rate_hz']:.1f} Hz, "
+        f"period p99 {report['period_ms'].get('p99', 0):.2f} ms, "
+        f"latency p50 {report['latency_ms'].get('p50', 0):.2f} ms, report in {output}",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
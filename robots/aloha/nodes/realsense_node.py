@@ -1,28 +1,359 @@
-import pyrealsense2 as rs
+"""
+RealSense node: captures the color stream of a RealSense camera, and optionally its depth stream aligned to the color
+stream.
+
+Frames are delivered by the RealSense callback into a latest-frame buffer, and each `tick` sends the latest frame if it
+has not been sent yet, without waiting for the camera. The preview window (PREVIEW=1) is drawn by its own thread.
+
+Outputs:
+    image: the BGR color image, flat, with its width, height and encoding in the metadata.
+    depth: the depth image, in the encoding of DEPTH_ENCODING, with its width, height, encoding and scale (meters per
+        unit) in the metadata. Use `decode_depth` to read it back.
+
+Depth encodings, all lossless:
+    mono16: the raw uint16 depth.
+    png16: a 16-bit PNG image.
+    delta-zstd: the difference of each pixel with its left neighbor, compressed with zstd (requires `zstandard`).
+
+A recorded `.bag` file can be played back instead of the camera with BAG=<path>. The encodings can be compared on a
+recording without a dataflow:
+
+    python realsense_node.py --bag recording.bag --benchmark-depth
+"""
+
+import os
+import time
+import argparse
+import threading
+
 import numpy as np
-from dora import Node
 import pyarrow as pa
-import os
-import cv2
 
 IMAGE_WIDTH = int(os.getenv("IMAGE_WIDTH", "640"))
 IMAGE_HEIGHT = int(os.getenv("IMAGE_HEIGHT", "480"))
-FPS = 30
+FPS = int(os.getenv("FPS", "30"))
 CAMERA_ID = os.getenv("CAMERA_ID")
-print("camera ID:", CAMERA_ID)
-pipe = rs.pipeline()
-config = rs.config()
-config.enable_device(CAMERA_ID)
-config.enable_stream(rs.stream.color, IMAGE_WIDTH, IMAGE_HEIGHT, rs.format.bgr8, FPS)
-profile = pipe.start(config)
-
-node = Node()
-
-for event in node:
-    frames = pipe.wait_for_frames()
-    color_frame = frames.get_color_frame()
-    color_images = np.asanyarray(color_frame.get_data())
-    node.send_output("image", pa.array(color_images.ravel()))
-    cv2.imshow(CAMERA_ID, color_images)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
+
+DEPTH = os.getenv("DEPTH", "0").lower() in ["1", "true"]
+DEPTH_ENCODING = os.getenv("DEPTH_ENCODING", "png16")
+PREVIEW = os.getenv("PREVIEW", "0").lower() in ["1", "true"]
+BAG = os.getenv("BAG")
+
+DEPTH_ENCODINGS = ["mono16", "png16", "delta-zstd"]
+
+
+def encode_depth(depth: np.ndarray, encoding: str) -> np.ndarray:
+    """
+    Encodes a (height, width) uint16 depth image losslessly, returns the encoded bytes as a uint8 array.
+    """
+    if encoding == "mono16":
+        return depth.ravel().view(np.uint8)
+
+    if encoding == "png16":
+        import cv2
+
+        # Fastest compression level, depth images compress well at any level
+        ok, buffer = cv2.imencode(".png", depth, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not ok:
+            raise ValueError("Could not encode the depth image as PNG.")
+
+        return buffer.ravel()
+
+    if encoding == "delta-zstd":
+        import zstandard
+
+        # Neighboring depths are close, their differences are small and compress much better than the depths. The
+        # differences wrap around in uint16, and the cumulative sum of the decoder wraps back.
+        delta = depth.copy()
+        delta[:, 1:] = np.diff(depth, axis=1)
+
+        return np.frombuffer(
+            zstandard.ZstdCompressor(level=1).compress(delta.tobytes()), dtype=np.uint8
+        )
+
+    raise ValueError(
+        f"Unknown depth encoding {encoding}, expected one of {DEPTH_ENCODINGS}."
+    )
+
+
+def decode_depth(data: np.ndarray, encoding: str, width: int, height: int):
+    """
+    Decodes a depth image encoded by `encode_depth` into a (height, width) uint16 array.
+    """
+    if encoding == "mono16":
+        return data.view(np.uint16).reshape(height, width)
+
+    if encoding == "png16":
+        import cv2
+
+        return cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+
+    if encoding == "delta-zstd":
+        import zstandard
+
+        delta = np.frombuffer(
+            zstandard.ZstdDecompressor().decompress(data.tobytes()), dtype=np.uint16
+        ).reshape(height, width)
+
+        return np.cumsum(delta, axis=1, dtype=np.uint16)
+
+    raise ValueError(
+        f"Unknown depth encoding {encoding}, expected one of {DEPTH_ENCODINGS}."
+    )
+
+
+class LatestFrame:
+    """
+    The latest frames delivered by the RealSense callback, copied out of the RealSense buffers so they are released
+    immediately.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.color = None
+        self.depth = None
+        self.sequence = 0
+
+    def put(self, color: np.ndarray, depth):
+        with self.lock:
+            self.color = color
+            self.depth = depth
+            self.sequence += 1
+
+    def get(self):
+        with self.lock:
+            return self.sequence, self.color, self.depth
+
+
+def start_pipeline(latest: LatestFrame, bag, depth: bool):
+    """
+    Starts the RealSense pipeline, on the camera CAMERA_ID or the recording `bag`. Returns the pipeline and the depth
+    scale in meters per unit.
+    """
+    import pyrealsense2 as rs
+
+    config = rs.config()
+
+    if bag is not None:
+        # The streams of a recording are played back as recorded
+        config.enable_device_from_file(bag, repeat_playback=True)
+        config.enable_stream(rs.stream.color)
+        if depth:
+            config.enable_stream(rs.stream.depth)
+    else:
+        if CAMERA_ID is not None:
+            config.enable_device(CAMERA_ID)
+
+        config.enable_stream(
+            rs.stream.color, IMAGE_WIDTH, IMAGE_HEIGHT, rs.format.bgr8, FPS
+        )
+        if depth:
+            config.enable_stream(
+                rs.stream.depth, IMAGE_WIDTH, IMAGE_HEIGHT, rs.format.z16, FPS
+            )
+
+    align = rs.align(rs.stream.color) if depth else None
+
+    def callback(frame):
+        frames = frame.as_frameset()
+        if not frames:
+            return
+
+        if align is not None:
+            frames = align.process(frames)
+
+        color_frame = frames.get_color_frame()
+        if not color_frame:
+            return
+
+        color = np.asanyarray(color_frame.get_data()).copy()
+        if color_frame.get_profile().format() == rs.format.rgb8:
+            color = color[:, :, ::-1].copy()
+
+        depth_image = None
+        if align is not None:
+            depth_frame = frames.get_depth_frame()
+            if not depth_frame:
+                return
+
+            depth_image = np.asanyarray(depth_frame.get_data()).copy()
+
+        latest.put(color, depth_image)
+
+    pipe = rs.pipeline()
+    profile = pipe.start(config, callback)
+
+    if bag is not None:
+        # Play the recording at the framerate it was recorded at
+        profile.get_device().as_playback().set_real_time(True)
+
+    depth_scale = 0.0
+    if depth:
+        depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+
+    return pipe, depth_scale
+
+
+def display(latest: LatestFrame, name: str, stop: threading.Event):
+    """
+    Shows the latest color frame in a window until `q` is pressed or the node stops.
+    """
+    import cv2
+
+    shown = 0
+    while not stop.is_set():
+        sequence, color, _ = latest.get()
+
+        if sequence != shown:
+            cv2.imshow(name, color)
+            shown = sequence
+
+        if cv2.waitKey(1000 // FPS) & 0xFF == ord("q"):
+            break
+
+    cv2.destroyAllWindows()
+
+
+def benchmark_depth(latest: LatestFrame, frames: int):
+    """
+    Compares the size and the encoding and decoding times of the depth encodings on the frames of the camera or the
+    recording, and checks that they are lossless.
+    """
+    depths = []
+    sequence = 0
+    while len(depths) < frames:
+        current, _, depth = latest.get()
+        if current != sequence and depth is not None:
+            depths.append(depth)
+            sequence = current
+        time.sleep(0.001)
+
+    print(f"{'encoding':<12}{'ratio':>8}{'encode ms':>12}{'decode ms':>12}")
+
+    for encoding in DEPTH_ENCODINGS:
+        size = 0
+        encode = 0.0
+        decode = 0.0
+
+        for depth in depths:
+            start = time.perf_counter()
+            data = encode_depth(depth, encoding)
+            encode += time.perf_counter() - start
+
+            start = time.perf_counter()
+            decoded = decode_depth(data, encoding, depth.shape[1], depth.shape[0])
+            decode += time.perf_counter() - start
+
+            if not np.array_equal(decoded, depth):
+                raise ValueError(f"The {encoding} depth encoding is not lossless.")
+
+            size += data.nbytes
+
+        print(
+            f"{encoding:<12}{sum(depth.nbytes for depth in depths) / size:>8.2f}"
+            f"{1000 * encode / len(depths):>12.2f}{1000 * decode / len(depths):>12.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="RealSense node: captures the color and aligned depth streams of a RealSense camera."
+    )
+    parser.add_argument(
+        "--bag",
+        type=str,
+        required=False,
+        help="A recorded .bag file played back instead of the camera.",
+        default=BAG,
+    )
+    parser.add_argument(
+        "--benchmark-depth",
+        action="store_true",
+        required=False,
+        help="Compare the depth encodings on the frames of the camera or the recording, without a dataflow.",
+        default=False,
+    )
+    parser.add_argument(
+        "--frames",
+        type=int,
+        required=False,
+        help="The number of depth frames of the benchmark.",
+        default=100,
+    )
+
+    args = parser.parse_args()
+
+    if DEPTH_ENCODING not in DEPTH_ENCODINGS:
+        raise ValueError(
+            f"Unknown depth encoding {DEPTH_ENCODING}, expected one of {DEPTH_ENCODINGS}."
+        )
+
+    latest = LatestFrame()
+
+    if args.benchmark_depth:
+        pipe, _ = start_pipeline(latest, args.bag, depth=True)
+        try:
+            benchmark_depth(latest, args.frames)
+        finally:
+            pipe.stop()
+        return
+
+    from dora import Node
+
+    node = Node()
+
+    pipe, depth_scale = start_pipeline(latest, args.bag, depth=DEPTH)
+
+    stop = threading.Event()
+    if PREVIEW:
+        threading.Thread(
+            target=display,
+            args=(latest, CAMERA_ID or "realsense", stop),
+            daemon=True,
+        ).start()
+
+    sent = 0
+
+    for event in node:
+        event_type = event["type"]
+
+        if event_type == "INPUT":
+            if event["id"] != "tick":
+                continue
+
+            sequence, color, depth = latest.get()
+
+            # No new frame since the last tick
+            if sequence == sent:
+                continue
+            sent = sequence
+
+            metadata = event["metadata"]
+            metadata["width"] = color.shape[1]
+            metadata["height"] = color.shape[0]
+            metadata["encoding"] = "bgr8"
+
+            node.send_output("image", pa.array(color.ravel()), metadata)
+
+            if depth is not None:
+                metadata["encoding"] = DEPTH_ENCODING
+                metadata["depth_scale"] = depth_scale
+
+                node.send_output(
+                    "depth",
+                    pa.array(encode_depth(depth, DEPTH_ENCODING)),
+                    metadata,
+                )
+
+        elif event_type == "STOP":
+            break
+
+        elif event_type == "ERROR":
+            raise Exception(event["error"])
+
+    stop.set()
+    pipe.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from dora import Node
+import numpy as np
 import pandas as pd
 import pyarrow as pa
 import time
@@ -18,10 +19,12 @@ if __name__ == "__main__":
 
                 df = pd.read_parquet(action + ".parquet")
 
-                initial_time = df["timestamp_utc"].iloc[0]
-                current_time = initial_time
-                for index, row in df.iterrows():
-                    delta_time = (row["timestamp_utc"] - current_time).microseconds
-                    current_time = row["timestamp_utc"]
-                    time.sleep(delta_time / 1_000_000)
-                    node.send_output(TOPIC, pa.array(row[TOPIC], type=pa.uint32()))
+                # Send each row at an absolute deadline, so that sending does not accumulate as drift
+                timestamps = df["timestamp_utc"].to_numpy().astype("datetime64[ns]")
+                offsets = (timestamps - timestamps[0]).astype(np.int64) / 1e9
+                origin = time.perf_counter()
+                for offset, value in zip(offsets, df[TOPIC]):
+                    remaining = origin + offset - time.perf_counter()
+                    if remaining > 0:
+                        time.sleep(remaining)
+                    node.send_output(TOPIC, pa.array(value, type=pa.uint32()))
@@ -1,59 +1,418 @@
-import pyarrow as pa
-import whisper
-from pynput import keyboard
-from pynput.keyboard import Key, Events
-from dora import Node
+"""
+Whisper node: streaming speech recognition of voice commands.
+
+Audio is captured by a callback into a ring buffer, cut into utterances by an energy voice-activity detector, and
+transcribed by a worker thread, so the node keeps handling dora events while listening and transcribing.
+
+Pressing right alt routes the next utterance to `text_llm`, right ctrl to `text_policy`. With ALWAYS_ON, every
+utterance is sent to `text_policy`. With PARTIAL_INTERVAL > 0, partial transcriptions of the current utterance are sent
+to `<output>_partial` while it is spoken.
+
+The audio can be read from a WAV file instead of the microphone (WAV environment variable), and the node can run
+without a dataflow to benchmark the latency of the commands of a recording:
+
+    python whisper_node.py --wav commands.wav
+"""
+
+import os
+import time
+import wave
+import queue
+import argparse
+import threading
+from typing import Optional
 
-import torch
 import numpy as np
 import pyarrow as pa
-import sounddevice as sd
-import gc  # garbage collect library
-
-model = whisper.load_model("base")
 
 SAMPLE_RATE = 16000
 
-node = Node()
+# Duration of a frame of the voice-activity detector
+FRAME_MS = 30
+FRAME = SAMPLE_RATE * FRAME_MS // 1000
 
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+ALWAYS_ON = os.getenv("ALWAYS_ON", "0").lower() in ["1", "true"]
+PARTIAL_INTERVAL = float(os.getenv("PARTIAL_INTERVAL", "0"))
 
-def get_text(duration) -> str:
+# A frame is voiced if its RMS is above both VAD_THRESHOLD and VAD_RATIO times the noise floor
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.01"))
+VAD_RATIO = float(os.getenv("VAD_RATIO", "3.0"))
+MIN_SPEECH_MS = int(os.getenv("MIN_SPEECH_MS", "150"))
+SILENCE_MS = int(os.getenv("SILENCE_MS", "500"))
+PREROLL_MS = int(os.getenv("PREROLL_MS", "200"))
 
-    ## Microphone
-    audio_data = sd.rec(
-        int(SAMPLE_RATE * duration),
-        samplerate=SAMPLE_RATE,
-        channels=1,
-        dtype=np.int16,
-        blocking=True,
-    )
+# Maximum duration of the utterances routed to each output, as the previous fixed recordings
+MAX_SECONDS = {"text_llm": 5.0, "text_policy": 3.0}
+
+
+class AudioRing:
+    """
+    Preallocated ring buffer of the last `seconds` of audio, written by the capture callback. Positions are absolute
+    sample indices since the start of the capture.
+    """
+
+    def __init__(self, seconds: float):
+        self.buffer = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+        self.written = 0
+        self.condition = threading.Condition()
+
+    def write(self, samples: np.ndarray):
+        with self.condition:
+            start = self.written % len(self.buffer)
+            end = start + len(samples)
+
+            if end <= len(self.buffer):
+                self.buffer[start:end] = samples
+            else:
+                split = len(self.buffer) - start
+                self.buffer[start:] = samples[:split]
+                self.buffer[: end - len(self.buffer)] = samples[split:]
+
+            self.written += len(samples)
+            self.condition.notify_all()
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """
+        Returns a copy of the samples [start, end), which must still be in the buffer.
+        """
+        with self.condition:
+            start = max(start, self.written - len(self.buffer), 0)
+            indices = np.arange(start, end) % len(self.buffer)
+            return self.buffer[indices]
+
+    def wait(self, position: int, timeout: float) -> int:
+        """
+        Waits until samples after `position` have been written, returns the number of samples written.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.written > position, timeout)
+            return self.written
+
+
+class Trigger:
+    """
+    The output the next utterance is routed to. With push-to-talk, a key press arms it for one utterance: the segmenter
+    takes it when the utterance starts, so the speech that follows during the transcription is not routed.
+    """
+
+    def __init__(self, output: Optional[str], always: bool):
+        self.output = output
+        self.always = always
+        self.lock = threading.Lock()
+
+    def arm(self, output: str):
+        with self.lock:
+            self.output = output
+
+    def armed(self) -> bool:
+        return self.output is not None
+
+    def take(self) -> Optional[str]:
+        with self.lock:
+            output = self.output
+            if not self.always:
+                self.output = None
 
-    audio = audio_data.ravel().astype(np.float32) / 32768.0
-
-    ## Speech to text
-    audio = whisper.pad_or_trim(audio)
-    return model.transcribe(audio, language="en")
-
-
-## Check for keyboard event
-with keyboard.Events() as events:
-    for dora_event in node:
-        if dora_event["type"] == "INPUT":
-            event = events.get(0.1)
-            if (
-                event is not None
-                and (event.key == Key.alt_r or event.key == Key.ctrl_r)
-                and isinstance(event, Events.Press)
-            ):
-                if event.key == Key.alt_r:
-                    result = get_text(5)
-                    node.send_output(
-                        "text_llm", pa.array([result["text"]]), dora_event["metadata"]
+            return output
+
+
+class Segmenter(threading.Thread):
+    """
+    Cuts the audio of the ring buffer into utterances with an energy voice-activity detector, and submits them to the
+    transcription worker, with partial submissions while the utterance is spoken.
+    """
+
+    def __init__(self, ring: AudioRing, jobs: queue.Queue, trigger: Trigger):
+        """
+        Args:
+            ring: the audio ring buffer.
+            jobs: the queue of the transcription worker.
+            trigger: the output the next utterance is routed to, no utterance is cut while it is not armed.
+        """
+        super().__init__(daemon=True)
+
+        self.ring = ring
+        self.jobs = jobs
+        self.trigger = trigger
+        self.running = True
+
+        self.noise = VAD_THRESHOLD / VAD_RATIO
+
+    def run(self):
+        position = 0
+        speech_start = None
+        voiced_frames = 0
+        silent_frames = 0
+        last_voiced = 0
+        last_voiced_time = 0.0
+        last_partial = 0.0
+        output = None
+
+        while self.running:
+            written = self.ring.wait(position + FRAME - 1, timeout=0.1)
+
+            while position + FRAME <= written:
+                frame = self.ring.read(position, position + FRAME)
+                position += FRAME
+
+                rms = float(np.sqrt(np.mean(frame * frame)))
+                voiced = rms > max(VAD_THRESHOLD, VAD_RATIO * self.noise)
+
+                if speech_start is None:
+                    if not voiced:
+                        # Track the noise floor between utterances
+                        self.noise = 0.95 * self.noise + 0.05 * rms
+                        voiced_frames = 0
+                        continue
+
+                    if not self.trigger.armed():
+                        continue
+
+                    voiced_frames += 1
+                    if voiced_frames * FRAME_MS < MIN_SPEECH_MS:
+                        continue
+
+                    # The utterance takes the output, a push-to-talk trigger is disarmed until the next key press
+                    output = self.trigger.take()
+                    if output is None:
+                        voiced_frames = 0
+                        continue
+
+                    # Start of an utterance, with the audio preceding the detection
+                    speech_start = max(
+                        position
+                        - voiced_frames * FRAME
+                        - PREROLL_MS * SAMPLE_RATE // 1000,
+                        0,
                     )
-                elif event.key == Key.ctrl_r:
-                    result = get_text(3)
-                    node.send_output(
-                        "text_policy",
-                        pa.array([result["text"]]),
-                        dora_event["metadata"],
+                    silent_frames = 0
+                    last_partial = time.perf_counter()
+
+                if voiced:
+                    silent_frames = 0
+                    last_voiced = position
+                    last_voiced_time = time.perf_counter()
+                else:
+                    silent_frames += 1
+
+                duration = (position - speech_start) / SAMPLE_RATE
+                ended = silent_frames * FRAME_MS >= SILENCE_MS
+                ended = ended or duration >= MAX_SECONDS.get(output, 5.0)
+
+                if ended:
+                    self.jobs.put(
+                        (
+                            output,
+                            self.ring.read(speech_start, last_voiced),
+                            True,
+                            last_voiced_time,
+                        )
                     )
+                    speech_start = None
+                    voiced_frames = 0
+
+                elif (
+                    PARTIAL_INTERVAL > 0
+                    and time.perf_counter() - last_partial >= PARTIAL_INTERVAL
+                    and self.jobs.empty()
+                ):
+                    # Partial results are skipped while the worker is busy, final results never are
+                    self.jobs.put(
+                        (output, self.ring.read(speech_start, position), False, None)
+                    )
+                    last_partial = time.perf_counter()
+
+
+class Transcriber(threading.Thread):
+    """
+    Transcribes the utterances submitted by the segmenter, and queues the results for the event loop.
+    """
+
+    def __init__(self, model, jobs: queue.Queue, results: queue.Queue):
+        super().__init__(daemon=True)
+
+        self.model = model
+        self.jobs = jobs
+        self.results = results
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+
+            output, audio, final, speech_end = job
+
+            result = self.model.transcribe(audio, language="en")
+            self.results.put((output, result["text"].strip(), final, speech_end))
+
+
+def read_wav(path: str) -> np.ndarray:
+    """
+    Reads a 16-bit WAV file as mono float32 samples at SAMPLE_RATE.
+    """
+    with wave.open(path, "rb") as file:
+        if file.getsampwidth() != 2:
+            raise ValueError(f"{path} must be a 16-bit WAV file.")
+
+        samples = np.frombuffer(file.readframes(file.getnframes()), dtype=np.int16)
+        samples = samples.reshape(-1, file.getnchannels()).mean(axis=1)
+        rate = file.getframerate()
+
+    audio = samples.astype(np.float32) / 32768.0
+
+    if rate != SAMPLE_RATE:
+        times = np.arange(int(len(audio) * SAMPLE_RATE / rate)) / SAMPLE_RATE
+        audio = np.interp(times, np.arange(len(audio)) / rate, audio).astype(np.float32)
+
+    return audio
+
+
+def play_wav(ring: AudioRing, audio: np.ndarray, done: threading.Event):
+    """
+    Writes the audio of a WAV file into the ring buffer at real-time pace, as the capture callback would, followed by
+    one second of silence to end the last utterance.
+    """
+    audio = np.concatenate([audio, np.zeros(SAMPLE_RATE, dtype=np.float32)])
+
+    start = time.perf_counter()
+    for index in range(0, len(audio), FRAME):
+        time.sleep(max(0.0, start + index / SAMPLE_RATE - time.perf_counter()))
+        ring.write(audio[index : index + FRAME])
+
+    done.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Whisper node: streaming speech recognition of voice commands."
+    )
+    parser.add_argument(
+        "--wav",
+        type=str,
+        required=False,
+        help="Transcribe a WAV file without a dataflow, and print the latency of the commands.",
+        default=None,
+    )
+
+    args = parser.parse_args()
+
+    offline = args.wav is not None
+    wav = args.wav or os.getenv("WAV")
+
+    # The node is created before loading the model, so the dataflow can start while it is loading
+    node = None
+    if not offline:
+        from dora import Node
+
+        node = Node()
+
+    import whisper
+
+    model = whisper.load_model(WHISPER_MODEL)
+
+    ring = AudioRing(seconds=30)
+    jobs = queue.Queue()
+    results = queue.Queue()
+
+    # Output of the next utterance, set by the keyboard unless always on
+    always = ALWAYS_ON or bool(wav)
+    trigger = Trigger("text_policy" if always else None, always)
+
+    segmenter = Segmenter(ring, jobs, trigger)
+    transcriber = Transcriber(model, jobs, results)
+    segmenter.start()
+    transcriber.start()
+
+    done = threading.Event()
+
+    if wav:
+        threading.Thread(
+            target=play_wav, args=(ring, read_wav(wav), done), daemon=True
+        ).start()
+        stream = None
+    else:
+        import sounddevice as sd
+
+        def callback(indata, frames, time_info, status):
+            ring.write(indata[:, 0])
+
+        stream = sd.InputStream(
+            samplerate=SAMPLE_RATE,
+            channels=1,
+            dtype=np.float32,
+            blocksize=FRAME,
+            callback=callback,
+        )
+        stream.start()
+
+    listener = None
+    if not ALWAYS_ON and not wav:
+        from pynput import keyboard
+
+        def on_press(key):
+            if key == keyboard.Key.alt_r:
+                trigger.arm("text_llm")
+            elif key == keyboard.Key.ctrl_r:
+                trigger.arm("text_policy")
+
+        listener = keyboard.Listener(on_press=on_press)
+        listener.start()
+
+    latencies = []
+
+    def send_results(metadata):
+        while not results.empty():
+            output, text, final, speech_end = results.get()
+
+            if final:
+                latencies.append(time.perf_counter() - speech_end)
+
+            if offline:
+                kind = "final" if final else "partial"
+                print(f"[{kind}] {output}: {text}", flush=True)
+            elif final:
+                node.send_output(output, pa.array([text]), metadata)
+            else:
+                node.send_output(output + "_partial", pa.array([text]), metadata)
+
+    if offline:
+        while not done.wait(0.01):
+            send_results({})
+
+        # The segmenter processes the audio written before stopping, and the worker the jobs queued before None
+        segmenter.running = False
+        segmenter.join()
+        jobs.put(None)
+        transcriber.join()
+        send_results({})
+    else:
+        for event in node:
+            if event["type"] == "INPUT":
+                send_results(event["metadata"])
+            elif event["type"] == "STOP":
+                break
+
+    segmenter.running = False
+    if stream is not None:
+        stream.stop()
+    if listener is not None:
+        listener.stop()
+
+    if latencies:
+        latencies = np.array(latencies) * 1000
+        print(
+            "Whisper command latency (ms): ",
+            {
+                "commands": len(latencies),
+                "mean": float(np.mean(latencies)),
+                "p50": float(np.percentile(latencies, 50)),
+                "max": float(np.max(latencies)),
+            },
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
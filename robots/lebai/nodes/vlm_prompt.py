@@ -1 +1,356 @@
+"""
+VLM prompt node: answers questions about the camera image with Qwen2-VL, as `dora-qwenvl`, with a cache of answers.
 
+Each camera frame is downscaled once, when it is first queried, and summarized by a 64-bit difference hash. A query
+whose prompt matches a cached answer and whose frame hash is within HASH_DISTANCE bits of the cached frame is answered
+from the cache without running the model. Inference runs on a worker thread, so images keep being received while the
+model generates.
+
+Inputs:
+    image: the camera image of `opencv-video-capture`.
+    tick: asks the default question, the answer is sent on `tick`.
+    text: sets the question and asks it, the answer is sent on `text`.
+
+Outputs:
+    tick, text: the answers.
+    stats: the cache hit rate, the latency and the number of failed queries, after each answer or failure.
+"""
+
+import os
+import time
+import threading
+from typing import Optional
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+
+DEFAULT_PATH = "Qwen/Qwen2-VL-2B-Instruct"
+MODEL_PATH = os.getenv("CUSTOM_MODEL_PATH", DEFAULT_PATH)
+DEFAULT_QUESTION = os.getenv("DEFAULT_QUESTION", "Describe this image.")
+MAX_NEW_TOKENS = int(os.getenv("MAX_NEW_TOKENS", "128"))
+
+# The longest side of the image given to the model, Qwen2-VL splits it into 28x28 pixels patches
+VLM_IMAGE_SIZE = int(os.getenv("VLM_IMAGE_SIZE", "448"))
+
+# Two frames are the same scene if their hashes differ by at most HASH_DISTANCE of 64 bits
+HASH_DISTANCE = int(os.getenv("HASH_DISTANCE", "4"))
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "32"))
+
+LATENCIES_WINDOW = 1000
+
+
+def decode_image(value: pa.Array, metadata: dict) -> np.ndarray:
+    """
+    Decodes a BGR image, either in the image struct of `opencv-video-capture`, or flat with its size in the metadata as
+    sent by the released `opencv-video-capture`.
+    """
+    if pa.types.is_struct(value.type):
+        image = value[0]
+
+        return (
+            image["data"]
+            .values.to_numpy()
+            .reshape(
+                image["height"].as_py(),
+                image["width"].as_py(),
+                image["channels"].as_py(),
+            )
+        )
+
+    frame = value.to_numpy().reshape(metadata["height"], metadata["width"], 3)
+    if metadata.get("encoding", "bgr8") == "rgb8":
+        frame = frame[:, :, ::-1]
+
+    return frame
+
+
+def downscale(frame: np.ndarray) -> np.ndarray:
+    """
+    Downscales a BGR frame so that its longest side is VLM_IMAGE_SIZE, and converts it to RGB.
+    """
+    import cv2
+
+    scale = VLM_IMAGE_SIZE / max(frame.shape[:2])
+    if scale < 1:
+        frame = cv2.resize(
+            frame,
+            (round(frame.shape[1] * scale), round(frame.shape[0] * scale)),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def difference_hash(frame: np.ndarray) -> int:
+    """
+    64-bit difference hash of an RGB frame: the signs of the horizontal gradients of a 9x8 grayscale thumbnail. It is
+    stable under noise and small exposure changes, and changes when objects move.
+    """
+    import cv2
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class Frame:
+    """
+    The latest camera frame, downscaled and hashed once, on its first query.
+    """
+
+    def __init__(self, value: pa.Array, metadata: dict):
+        self.value = value
+        self.metadata = metadata
+        self.image = None
+        self.hash = None
+
+    def prepare(self):
+        if self.image is None:
+            self.image = downscale(decode_image(self.value, self.metadata))
+            self.hash = difference_hash(self.image)
+            self.value = None
+
+
+class AnswerCache:
+    """
+    Least recently used answers, keyed by prompt and frame hash.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, prompt: str, frame_hash: int):
+        for key, answer in self.entries.items():
+            if (
+                key[0] == prompt
+                and bin(key[1] ^ frame_hash).count("1") <= HASH_DISTANCE
+            ):
+                self.entries.move_to_end(key)
+                return answer
+
+        return None
+
+    def put(self, prompt: str, frame_hash: int, answer: str):
+        self.entries[(prompt, frame_hash)] = answer
+        self.entries.move_to_end((prompt, frame_hash))
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class Model:
+    def __init__(self, path: str):
+        import torch
+        from transformers import AutoProcessor, Qwen2VLForConditionalGeneration
+
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        self.model = Qwen2VLForConditionalGeneration.from_pretrained(
+            path, torch_dtype="auto", device_map=self.device
+        )
+        self.processor = AutoProcessor.from_pretrained(path)
+
+    def generate(self, image: np.ndarray, question: str) -> str:
+        from PIL import Image
+
+        messages = [
+            {
+                "role": "user",
+                "content": [{"type": "image"}, {"type": "text", "text": question}],
+            }
+        ]
+        text = self.processor.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True
+        )
+
+        inputs = self.processor(
+            text=[text],
+            images=[Image.fromarray(image)],
+            padding=True,
+            return_tensors="pt",
+        ).to(self.device)
+
+        generated_ids = self.model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS)
+        generated_ids = generated_ids[:, inputs.input_ids.shape[1] :]
+
+        return self.processor.batch_decode(
+            generated_ids, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )[0]
+
+
+class Worker(threading.Thread):
+    """
+    Runs the queries on the model, one at a time. Each output has one pending slot: a query submitted while the model is
+    busy replaces the pending query of its output, whose answer would be outdated when it is sent, but not the queries
+    of the other outputs (a `tick` does not replace a `text` question). The slots are run in the order they were
+    filled.
+    """
+
+    def __init__(self, model: Model):
+        super().__init__(daemon=True)
+
+        self.model = model
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.results = []
+
+    def submit(self, query: dict):
+        with self.condition:
+            self.pending[query["output"]] = query
+            self.condition.notify()
+
+    def take_results(self) -> list:
+        with self.condition:
+            results, self.results = self.results, []
+            return results
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+                query = self.pending.pop(next(iter(self.pending)))
+
+            start = time.perf_counter()
+            try:
+                answer = self.model.generate(query["frame"].image, query["prompt"])
+            except Exception as e:
+                # A failed query (e.g. out of memory) is reported by the main loop, the worker keeps running
+                query["error"] = e
+                answer = None
+            query["inference"] = time.perf_counter() - start
+
+            with self.condition:
+                self.results.append((query, answer))
+
+
+class Statistics:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.latencies = np.zeros(LATENCIES_WINDOW)
+        self.inferences = np.zeros(LATENCIES_WINDOW)
+        self.answers = 0
+        self.errors = 0
+
+    def record(self, latency: float, inference: Optional[float] = None):
+        self.latencies[self.answers % LATENCIES_WINDOW] = latency
+        self.answers += 1
+
+        if inference is None:
+            self.hits += 1
+        else:
+            self.inferences[self.misses % LATENCIES_WINDOW] = inference
+            self.misses += 1
+
+    def to_arrow(self) -> pa.StructArray:
+        if self.answers == 0:
+            return pa.array(
+                [{"hits": 0, "misses": 0, "hit_rate": 0.0, "errors": self.errors}]
+            )
+
+        latencies = self.latencies[: min(self.answers, LATENCIES_WINDOW)] * 1000
+        inferences = self.inferences[: min(self.misses, LATENCIES_WINDOW)] * 1000
+
+        return pa.array(
+            [
+                {
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / max(self.answers, 1),
+                    "errors": self.errors,
+                    "latency_p50_ms": float(np.percentile(latencies, 50)),
+                    "latency_p95_ms": float(np.percentile(latencies, 95)),
+                    "inference_p50_ms": (
+                        float(np.percentile(inferences, 50)) if self.misses else 0.0
+                    ),
+                }
+            ]
+        )
+
+
+def main():
+    from dora import Node
+
+    # The node is created before loading the model, so the dataflow can start while it is loading
+    node = Node()
+
+    model = Model(MODEL_PATH)
+    worker = Worker(model)
+    worker.start()
+
+    cache = AnswerCache(CACHE_SIZE)
+    statistics = Statistics()
+
+    frame = None
+    question = DEFAULT_QUESTION
+
+    def answer(query: dict, text: str, inference: Optional[float] = None):
+        statistics.record(time.perf_counter() - query["start"], inference)
+
+        node.send_output(query["output"], pa.array([text]), query["metadata"])
+        node.send_output("stats", statistics.to_arrow())
+
+    for event in node:
+        event_type = event["type"]
+
+        if event_type == "INPUT":
+            event_id = event["id"]
+
+            if event_id == "image":
+                # The frame is only decoded and downscaled if it is queried
+                frame = Frame(event["value"], event["metadata"])
+
+            elif event_id in ["tick", "text"]:
+                if event_id == "text":
+                    text = event["value"][0].as_py()
+                    if text == "":
+                        continue
+                    question = text
+
+                if frame is None:
+                    continue
+
+                query = {
+                    "output": event_id,
+                    "prompt": question,
+                    "frame": frame,
+                    "metadata": event["metadata"],
+                    "start": time.perf_counter(),
+                }
+
+                frame.prepare()
+
+                cached = cache.get(question, frame.hash)
+                if cached is not None:
+                    answer(query, cached)
+                else:
+                    worker.submit(query)
+
+            for query, text in worker.take_results():
+                if "error" in query:
+                    statistics.errors += 1
+                    print(
+                        f"VLM query on {query['output']} failed: {query['error']!r}",
+                        flush=True,
+                    )
+                    node.send_output("stats", statistics.to_arrow())
+                    continue
+
+                cache.put(query["prompt"], query["frame"].hash, text)
+                answer(query, text, query["inference"])
+
+        elif event_type == "STOP":
+            break
+
+        elif event_type == "ERROR":
+            raise Exception(event["error"])
+
+    print("VLM prompt statistics: ", statistics.to_arrow().to_pylist()[0], flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,6 @@ from pathlib import Path
 import numpy as np
 import pyarrow as pa
 from dora import Node
-from lerobot.common.datasets.lerobot_dataset import LeRobotDataset
 
 # import h5py
 from pollen_vision.camera_wrappers.depthai import SDKWrapper
@@ -16,6 +15,9 @@ freq = 30
 
 cam_name = "cam_trunk"
 
+# The node is created before opening the camera, so the dataflow can start while it is opening
+node = Node()
+
 time.sleep(5)
 cam = SDKWrapper(get_config_file_path("CONFIG_SR"), fps=freq)
 # ret, image = cap.read()
@@ -23,32 +25,6 @@ cam = SDKWrapper(get_config_file_path("CONFIG_SR"), fps=freq)
 import cv2
 import numpy as np
 
-episode = 1
-dataset = LeRobotDataset("cadene/reachy2_teleop_remi")
-from_index = dataset.episode_data_index["from"][episode]
-to_index = dataset.episode_data_index["to"][episode]
-actions = dataset.hf_dataset["action"][from_index:to_index]
-states = dataset.hf_dataset["observation.state"][from_index:to_index]
-
-images = dataset[0]["observation.images.cam_trunk"]
-
-
-## Convert image from chw to hwc
-
-# cv2.imwrite("test.jpg", (images.permute((1, 2, 0)).numpy() * 255).astype(np.uint8))
-images = images.permute((1, 2, 0)).numpy() * 255
-images = images.astype(np.uint8)
-images = cv2.cvtColor(images, cv2.COLOR_RGB2BGR)
-
-# start = time.time()
-import PIL
-import torch
-
-# frame_hwc = (images.permute((1, 2, 0)) * 255).type(torch.uint8).cpu().numpy()
-
-# PIL.Image.fromarray(frame_hwc).save( f"frame_.png")
-
-node = Node()
 index = 0
 
 
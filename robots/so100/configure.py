@@ -11,15 +11,22 @@ The program will:
 9. Let the user verify in real time that the SO100 is working properly.
 
 It will also enable all appropriate operating modes for the SO100.
+
+With --scan, the program instead looks for the motors connected to one or more ports, at every supported baud rate, and
+prints their IDs and models as a configuration the client can load.
 """
 
+import os
 import argparse
 import time
 import json
 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import pyarrow as pa
 
-from bus import FeetechBus, TorqueMode, OperatingMode
+from bus import FeetechBus, TorqueMode, OperatingMode, MODEL_NUMBERS
 from pwm_position_control.transform import pwm_to_logical_arrow, wrap_joints_and_values
 
 from pwm_position_control.tables import (
@@ -71,6 +78,85 @@ def configure_servos(bus: FeetechBus):
     )
 
 
+def scan_port(port: str, motor_ids: list[int]) -> dict[int, dict[int, int]]:
+    bus = FeetechBus(port, {})
+
+    try:
+        return bus.scan(motor_ids)
+    finally:
+        bus.close()
+
+
+def scan_config(found: dict[int, dict[int, int]]) -> dict[int, dict]:
+    """
+    Makes the client configuration of the motors found on a port at each baud rate, with the torque disabled. The motors
+    are named after the joints of the SO100 when the IDs 1 to 6 were found, after their ID otherwise.
+    """
+    configs = {}
+    for baud_rate, model_numbers in found.items():
+        motor_ids = sorted(model_numbers)
+
+        if motor_ids == list(range(1, len(FULL_ARM) + 1)):
+            names = FULL_ARM.to_pylist()
+        else:
+            names = [f"motor_{motor_id}" for motor_id in motor_ids]
+
+        configs[baud_rate] = {
+            name: {
+                "id": motor_id,
+                "model": MODEL_NUMBERS.get(model_numbers[motor_id], "scs_series"),
+                "model_number": model_numbers[motor_id],
+                "baud_rate": baud_rate,
+                "torque": False,
+            }
+            for name, motor_id in zip(names, motor_ids)
+        }
+
+    return configs
+
+
+def scan(ports: list[str], max_id: int, output: Optional[str]):
+    """
+    Scans the ports concurrently, and prints the configuration of the motors found on each port. With `output`, the
+    configuration of each bus is written to `output/<port>.json` (`output/<port>_<baud_rate>.json` if motors were found
+    at several baud rates on the port), which the client can load as CONFIG.
+    """
+    motor_ids = list(range(max_id + 1))
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        found = list(executor.map(lambda port: scan_port(port, motor_ids), ports))
+
+    if output is not None:
+        os.makedirs(output, exist_ok=True)
+
+    for port, motors in zip(ports, found):
+        configs = scan_config(motors)
+        if not configs:
+            print(f"{port}: no motor found.")
+
+        for baud_rate, config in configs.items():
+            print(
+                f"{port} at {baud_rate} baud: "
+                + ", ".join(
+                    f"{motor['id']} ({motor['model']})" for motor in config.values()
+                )
+            )
+            print(json.dumps(config, indent=2))
+
+            if output is None:
+                continue
+
+            name = os.path.basename(port)
+            if len(configs) > 1:
+                name += f"_{baud_rate}"
+
+            path = os.path.join(output, name + ".json")
+            with open(path, "w") as file:
+                json.dump(config, file, indent=2)
+
+            print(f"Written to {path}.")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="SO100 Auto Configure: This program is used to automatically configure the Low Cost Robot (SO100) "
@@ -78,7 +164,7 @@ def main():
     )
 
     parser.add_argument(
-        "--port", type=str, required=True, help="The port of the SO100."
+        "--port", type=str, required=False, help="The port of the SO100."
     )
     parser.add_argument(
         "--right",
@@ -91,8 +177,35 @@ def main():
         help="If the SO100 is on the left side of the user.",
     )
 
+    parser.add_argument(
+        "--scan",
+        type=str,
+        nargs="+",
+        metavar="PORT",
+        help="Scan the ports for motors at every supported baud rate, instead of configuring the SO100.",
+    )
+    parser.add_argument(
+        "--max-id",
+        type=int,
+        default=20,
+        help="The highest motor ID scanned.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="The folder of the client configurations written by the scan, one per bus.",
+    )
+
     args = parser.parse_args()
 
+    if args.scan is not None:
+        scan(args.scan, args.max_id, args.output)
+        return
+
+    if args.port is None:
+        raise ValueError("You must specify --port, or --scan.")
+
     if args.right and args.left:
         raise ValueError("You cannot specify both --right and --left.")
 